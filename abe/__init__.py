@@ -1,11 +1,18 @@
 __all__ = [
-    "base", "parse", "texture",
+    "base", "cache", "diff", "parse", "planes", "spatial", "stats", "store", "texture",
     "Brush", "BrushSide", "Entity", "MapFile",
+    "BrushStore", "BVH",
     "CoD4Map", "QuakeMap", "Valve220Map", "Vmf",
     "ProjectionAxis", "TextureVector"]
 
 from . import base
+from . import cache
+from . import diff
 from . import parse
+from . import planes
+from . import spatial
+from . import stats
+from . import store
 from . import texture
 
 from .base import (
@@ -18,6 +25,10 @@ from .parse import (
     QuakeMap,
     Valve220Map,
     Vmf)
+from .spatial import (
+    BVH)
+from .store import (
+    BrushStore)
 from .texture import (
     ProjectionAxis,
     TextureVector)
@@ -1,8 +1,11 @@
 from __future__ import annotations
-from collections import defaultdict
-import math
-from typing import Any, Dict, List
+import io
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from . import clip
+from . import planes
+from . import stats
 from . import texture
 
 from ass import geometry
@@ -10,6 +13,7 @@ from ass import physics
 from ass import vector
 import breki
 from breki.files.parsed import parse_first
+import numpy as np
 
 
 # TODO: Curve (CoDRadiant)
@@ -30,41 +34,40 @@ class Brush:
     def __repr__(self) -> str:
         return f"<Brush {len(self.sides)} sides @ 0x{id(self):012X}>"
 
+    def __str__(self) -> str:
+        return "\n".join(["{", *map(str, self.sides), "}"])
+
     def as_model(self) -> geometry.Model:
-        meshes = [side.as_mesh(self) for side in self.sides]
+        positions, side_offsets = clip.brush_faces(*plane_arrays([self]))
+        texture_vectors = [side.texture_vector for side in self.sides]
+        if None in texture_vectors:  # e.g. CoD4 projections
+            uvs = [None] * len(self.sides)
+        else:  # all uvs at once
+            uvs = np.split(
+                clip.face_uvs(positions, side_offsets, *texture.texture_arrays(texture_vectors)),
+                side_offsets[1:-1])
+        meshes = [
+            side.polygon_mesh(side_positions, self, side_uvs)
+            for side, side_positions, side_uvs in zip(self.sides, np.split(positions, side_offsets[1:-1]), uvs)
+            if len(side_positions) >= 3]
         return geometry.Model(meshes)
 
     # TODO: catch bevel planes
     # -- found in Titanfall Engine trigger brushes
     # -- don't contribute to geometry, but helpful for physics calculations
 
-    def as_physics(self) -> physics.Brush:
-        # need to confirm brush is closed & convex
-        # having vertices would make determining bounds easier
-        raise NotImplementedError()
-        out = physics.Brush()
-        bounds = dict()
-        for side in self.sides:
-            normal = side.plane.normal.normalised()
-            axes = {
-                math.isclose(getattr(normal, axis), sign): (axis, sign)
-                for axis in "xyz"
-                for sign in (+1, -1)}
-            if True in axes:  # plane is axial (axis aligned)
-                # NOTE: do we need to invert plane distance to get bounds?
-                bounds[axes[True]] = side.plane.distance
-                out.axial_planes.append(side.plane)
-            else:
-                out.other_planes.append(side.plane)
-            mins = vector.vec3(
-                bounds.get((axis, -1), +math.inf)
-                for axis in "xyz")
-            maxs = vector.vec3(
-                bounds.get((axis, +1), -math.inf)
-                for axis in "xyz")
-            out.bounds = physics.AABB.from_mins_maxs(mins, maxs)
+    def as_physics(self, epsilon: float = clip.EPSILON) -> physics.Brush:
+        """physics.Brush w/ planes sorted into axial & other planes; bounds from vertices"""
+        out = physics_brushes([self], epsilon)[0]
+        if out is None:
+            raise ValueError(f"{self!r} has no volume")
         return out
 
+    def polygons(self, epsilon: float = clip.EPSILON, snap: float = clip.SNAP) -> List[np.ndarray]:
+        """vertex positions of each side, clipped by all other sides"""
+        positions, side_offsets = clip.brush_faces(*plane_arrays([self]), epsilon, snap)
+        return np.split(positions, side_offsets[1:-1])
+
     @classmethod
     def from_bounds(cls, bounds: physics.AABB, shader: str = None) -> Brush:
         sides = list()
@@ -77,12 +80,63 @@ class Brush:
         return cls(sides)
 
 
+def plane_arrays(brushes: List[Brush]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(normals, distances, brush_offsets) of every side; see clip.brush_faces"""
+    normals = np.array([
+        tuple(side.plane.normal)
+        for brush in brushes
+        for side in brush.sides], dtype=np.float64).reshape(-1, 3)
+    distances = np.array([
+        side.plane.distance
+        for brush in brushes
+        for side in brush.sides], dtype=np.float64)
+    brush_offsets = np.zeros(len(brushes) + 1, dtype=np.int64)
+    brush_offsets[1:] = np.cumsum([len(brush.sides) for brush in brushes])
+    return normals, distances, brush_offsets
+
+
+def physics_brushes(brushes: List[Brush], epsilon: float = clip.EPSILON) -> List[Optional[physics.Brush]]:
+    """Brush.as_physics for many brushes at once; None for brushes w/o volume"""
+    normals, distances, brush_offsets = plane_arrays(brushes)
+    side_planes = [side.plane for brush in brushes for side in brush.sides]
+    return physics_from_arrays(side_planes, normals, distances, brush_offsets, epsilon)
+
+
+def physics_from_arrays(side_planes: List[physics.Plane], normals: np.ndarray, distances: np.ndarray,
+                        brush_offsets: np.ndarray, epsilon: float = clip.EPSILON) -> List[Optional[physics.Brush]]:
+    """physics.Brush for each brush, w/ axial planes & bounds found for all sides at once"""
+    positions, side_offsets = clip.brush_faces(normals, distances, brush_offsets, epsilon)
+    mins, maxs = clip.brush_bounds(positions, side_offsets, brush_offsets)
+    has_volume = np.all(mins < maxs, axis=1).tolist()  # NaN if no vertices
+    mins, maxs = mins.tolist(), maxs.tolist()
+    is_axial = clip.axial_planes(normals).tolist()
+    brush_offsets = np.asarray(brush_offsets).tolist()
+    out = list()
+    for i, (first, last) in enumerate(zip(brush_offsets, brush_offsets[1:])):
+        if not has_volume[i]:
+            out.append(None)
+            continue
+        brush = physics.Brush()
+        for side in range(first, last):
+            if is_axial[side]:
+                brush.axial_planes.append(side_planes[side])
+            else:
+                brush.other_planes.append(side_planes[side])
+        brush.bounds = physics.AABB.from_mins_maxs(
+            vector.vec3(*mins[i]), vector.vec3(*maxs[i]))
+        out.append(brush)
+    return out
+
+
 class BrushSide:
+    ProjectionAxisClass = texture.ProjectionAxis
     plane: physics.Plane = physics.Plane((0, 0, 1), 0)
     shader: str = "__TB_empty"
     texture_vector: texture.TextureVector
     # TODO: include rotation in texture.TextureVector
     texture_rotation: float = 0
+    plane_index: Optional[int] = None
+    # ^ index into MapFile.planes; set when the table is built
 
     def __init__(self, plane=None, shader=None, texture_vector=None, rotation=None):
         self.plane = self.plane if plane is None else plane
@@ -105,117 +159,490 @@ class BrushSide:
             return hash(self) == hash(other)
         return False
 
+    def peek_plane(self) -> physics.Plane:
+        """.plane, w/o decoding & keeping anything else (see parse.common.LazyBrushSide)"""
+        return self.plane
+
     def vertex_at(self, position: vector.vec3, parent: Brush = None) -> geometry.Vertex:
-        """override for alternate vertex projections"""
-        return geometry.Vertex(
-            position,
-            self.plane.normal,
-            self.texture_vector.uv_at(position))
+        """override for alternate vertex projections; or override .vertices_at to project in bulk"""
+        return self._vertices_at([position], parent)[0]
+
+    def vertices_at(self, positions: List[vector.vec3], parent: Brush = None,
+                    uvs: np.ndarray = None) -> List[geometry.Vertex]:
+        """vertex for each position; uvs can be precomputed w/ .texture_vector.uv_array"""
+        # NOTE: defers to .vertex_at if a subclass overrides it (uvs are ignored)
+        if type(self).vertex_at is not BrushSide.vertex_at:
+            return [self.vertex_at(vector.vec3(*position), parent) for position in positions]
+        return self._vertices_at(positions, parent, uvs)
+
+    def _vertices_at(self, positions: List[vector.vec3], parent: Brush = None,
+                     uvs: np.ndarray = None) -> List[geometry.Vertex]:
+        positions = np.array([tuple(position) for position in positions], dtype=np.float64).reshape(-1, 3)
+        if uvs is None:
+            if self.texture_vector is None:  # e.g. CoD4 projections
+                uvs = np.zeros((len(positions), 2))
+            else:
+                uvs = self.texture_vector.uv_array(positions)
+        uvs = uvs.tolist()
+        return [
+            geometry.Vertex(vector.vec3(*position), self.plane.normal, vector.vec2(*uv))
+            for position, uv in zip(positions.tolist(), uvs)]
         # TODO: uv1 from lightmap projection
         # TODO: colour from brush.editor node
 
     def as_mesh(self, parent: Brush = None) -> geometry.Mesh:
-        material = geometry.Material(self.shader)
-        # polygon
-        raw_tri = getattr(self.plane, "_triangle", None)
-        if raw_tri is not None:  # TEMP: use raw_tri as a placeholder
-            assert len(raw_tri) == 3
-            assert all(isinstance(p, vector.vec3) for p in raw_tri)
-            positions = raw_tri
-        else:  # TODO: assemble poly from plane
-            positions = list()
         if parent is not None:  # shape polygon w/ other sides
-            ...
-            # AABB quads
-            # slice edges w/ each non-axial plane
-            # only respect in-bounds intersections
-            # slice edge by replacing A-B w/ A-S;S-B if A & B on opposite sides
-            # find the lerp(t) via plane.test(A) * -plane.normal
-            # keep the inside (back), discard the outside (front)
-        polygon = geometry.Polygon([
-            self.vertex_at(position, parent)
-            for position in positions])
+            index = [id(side) for side in parent.sides].index(id(self))
+            positions = parent.polygons()[index]
+        else:  # no other sides to clip against
+            raw_tri = getattr(self.plane, "_triangle", None)
+            if raw_tri is not None:  # TEMP: use raw_tri as a placeholder
+                assert len(raw_tri) == 3
+                positions = raw_tri
+            else:
+                positions = list()
+        return self.polygon_mesh(positions, parent)
+
+    def polygon_mesh(self, positions: List[vector.vec3], parent: Brush = None,
+                     uvs: np.ndarray = None) -> geometry.Mesh:
+        material = geometry.Material(self.shader)
+        polygon = geometry.Polygon(self.vertices_at(positions, parent, uvs))
         return geometry.Mesh(material, [polygon])
 
 
 class Entity:
-    classname: str  # exposed from _keys
+    __slots__ = ("brushes", "_key_values", "_watchers")
+    classname: str  # exposed from _key_values
     # NOT KEYVALUES
     brushes: List[Brush]
-    _keys: List[str]  # key-value pairs to write
-    # NOTE: keys will be stored w/ setattr
+    _key_values: Dict[str, str]  # key-value pairs to write, in order
+    _watchers: Tuple[EntityList]  # indexed lists to notify of key-value changes
+    # NOTE: keys can also be accessed as attributes (e.g. entity.classname)
+    intern_values = {"classname", "spawnflags"}
+    # ^ keys w/ values shared by many entities
+    # NOTE: keys & the values of intern_values are interned (sys.intern)
+    # -- saves a lot of memory on maps w/ 1000s of entities
 
     def __init__(self, **kwargs):
         self.brushes = list()
-        self._keys = list()
+        self._key_values = dict()
+        self._watchers = tuple()
         for key, value in kwargs.items():
             self[key] = value
 
     def __delitem__(self, key: str):
-        assert key in self._keys, f'cannot delete key "{key}"'
-        self._keys.remove(key)
-        delattr(self, key)
+        assert key in self._key_values, f'cannot delete key "{key}"'
+        value = self._key_values.pop(key)
+        for watcher in self._watchers:
+            watcher._update_index(self, key, value, None)
+
+    def __delattr__(self, key: str):
+        if key in Entity.__slots__:
+            super().__delattr__(key)
+        else:
+            del self[key]
+
+    def __getattr__(self, key: str) -> str:
+        # NOTE: only called when regular attribute lookup fails
+        if key in Entity.__slots__:  # not initialised yet (e.g. unpickling)
+            raise AttributeError(key)
+        try:
+            return self._key_values[key]
+        except KeyError:
+            raise AttributeError(f"{self.__class__.__name__!r} object has no attribute {key!r}")
 
     def __getitem__(self, key: str) -> str:
-        return getattr(self, key)
+        return self._key_values[key]
 
     def __repr__(self) -> str:
         lines = [
             "{",
-            *[f'"{k}" "{self[k]}"' for k in self._keys],
+            *[f'"{k}" "{v}"' for k, v in self._key_values.items()],
             f"...skipped {len(self.brushes)} brushes...",
             "}"]
         return "\n".join(lines)
 
+    def __getstate__(self) -> Tuple[List[Brush], Dict[str, str]]:
+        # NOTE: pickle & copy; watchers are not copied
+        return (self.brushes, self._key_values)
+
+    def __setattr__(self, key: str, value: Any):
+        if key in Entity.__slots__:
+            super().__setattr__(key, value)
+        else:
+            self[key] = value
+
     def __setitem__(self, key: str, value: str):
-        assert key not in ("_keys", "brushes"), f'cannot set key "{key}"'
-        self._keys.append(key)
-        setattr(self, key, value)
+        assert key not in ("_keys", "_key_values", "brushes"), f'cannot set key "{key}"'
+        key = sys.intern(key)
+        if key in self.intern_values and isinstance(value, str):
+            value = sys.intern(value)
+        old_value = self._key_values.get(key)
+        self._key_values[key] = value
+        for watcher in self._watchers:
+            watcher._update_index(self, key, old_value, value)
+
+    def __setstate__(self, state: Tuple[List[Brush], Dict[str, str]]):
+        self.brushes, self._key_values = state
+        self._watchers = tuple()
 
     def __str__(self):
         lines = [
             "{",
-            *[f'"{k}" "{self[k]}"' for k in self._keys],
+            *[f'"{k}" "{v}"' for k, v in self._key_values.items()],
             *map(str, self.brushes),
             "}"]
         return "\n".join(lines)
 
+    @property
+    def _keys(self) -> List[str]:
+        return list(self._key_values)
+
     def get(self, key: str, default: Any = None) -> Any:
-        return getattr(self, key, default)
+        return self._key_values.get(key, default)
+
+    def items(self) -> List[Tuple[str, str]]:
+        return list(self._key_values.items())
+
+
+class IndexedList(list):
+    """list w/ a lookup index, built on first use"""
+    _index: Any
+    # NOTE: .append & .extend keep the index up to date
+    # -- any other edit drops it, to be rebuilt on the next lookup
+
+    def __init__(self, entries=tuple()):
+        super().__init__(entries)
+        self._index = None
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._index = None
+
+    def __iadd__(self, entries):
+        self.extend(entries)
+        return self
+
+    def __imul__(self, count: int):
+        self._index = None
+        return super().__imul__(count)
+
+    def __reduce__(self):
+        # NOTE: pickle & copy; the index is rebuilt on demand
+        return (self.__class__, (list(self),))
+
+    def __setitem__(self, index, entry):
+        super().__setitem__(index, entry)
+        self._index = None
+
+    def append(self, entry):
+        super().append(entry)
+        if self._index is not None:
+            self._add_to_index(len(self) - 1)
+
+    def clear(self):
+        super().clear()
+        self._index = None
+
+    def extend(self, entries):
+        start = len(self)
+        super().extend(entries)
+        if self._index is not None:
+            for index in range(start, len(self)):
+                self._add_to_index(index)
+
+    def insert(self, index: int, entry):
+        super().insert(index, entry)
+        self._index = None
+
+    def pop(self, index: int = -1):
+        self._index = None
+        return super().pop(index)
+
+    def remove(self, entry):
+        super().remove(entry)
+        self._index = None
+
+    def reverse(self):
+        super().reverse()
+        self._index = None
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._index = None
+
+    # INDEX HANDLERS
+
+    @property
+    def index_(self) -> Any:
+        if self._index is None:
+            self._build_index()
+        return self._index
+
+    def _add_to_index(self, index: int):
+        raise NotImplementedError()
+
+    def _build_index(self):
+        raise NotImplementedError()
+
+
+class EntityList(IndexedList):
+    """[Entity] w/ an inverted index of key-values"""
+    _index: Dict[Tuple[str, str], Set[int]]  # {(key, value): {position}}
+    _positions: Dict[int, int]  # {id(entity): position}
+    # NOTE: entities notify the list when their key-values change
+    # -- entities removed from the list stop notifying it after their next change
+
+    def by_classname(self) -> Dict[str, List[Entity]]:
+        return {
+            value: [self[position] for position in sorted(positions)]
+            for (key, value), positions in sorted(self.index_.items())
+            if key == "classname" and len(positions) != 0}
+
+    def search(self, **search: Dict[str, str]) -> List[Entity]:
+        """entities w/ all key-values in search"""
+        if any(value == "" for value in search.values()):
+            # NOTE: "" also matches entities w/o the key, which aren't indexed
+            return [
+                entity
+                for entity in self
+                if all(
+                    entity.get(key, "") == value
+                    for key, value in search.items())]
+        if len(search) == 0:
+            return list(self)
+        postings = sorted([
+            self.index_.get((key, value), set())
+            for key, value in search.items()], key=len)
+        positions = postings[0].intersection(*postings[1:])
+        return [self[position] for position in sorted(positions)]
+
+    def _add_to_index(self, position: int):
+        entity = self[position]
+        if not any(watcher is self for watcher in entity._watchers):
+            entity._watchers = (*entity._watchers, self)
+        self._positions[id(entity)] = position
+        for key, value in entity._key_values.items():
+            self._index.setdefault((key, value), set()).add(position)
+
+    def _build_index(self):
+        self._index = dict()
+        self._positions = dict()
+        for position in range(len(self)):
+            self._add_to_index(position)
+
+    def _update_index(self, entity: Entity, key: str, old_value: str, new_value: str):
+        """called by entity when a key-value changes"""
+        position = self._positions.get(id(entity)) if self._index is not None else None
+        if position is None or self[position] is not entity:  # not indexed; stop watching
+            entity._watchers = tuple(
+                watcher
+                for watcher in entity._watchers
+                if watcher is not self)
+            return
+        if old_value is not None:
+            positions = self._index[(key, old_value)]
+            positions.discard(position)
+            if len(positions) == 0:
+                self._index.pop((key, old_value))
+        if new_value is not None:
+            self._index.setdefault((key, new_value), set()).add(position)
+
+
+class MaterialTable:
+    """{shader: [BrushSide]} for every brush side in a map"""
+    uses: Dict[str, List[BrushSide]]
+    # NOTE: sides added or re-textured w/o .replace() are only picked up by .rebuild()
+
+    def __init__(self, entities: Iterable[Entity] = tuple()):
+        self.uses = dict()
+        self.rebuild(entities)
+
+    def __contains__(self, shader: str) -> bool:
+        return shader in self.uses
+
+    def __getitem__(self, shader: str) -> List[BrushSide]:
+        return self.uses[shader]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.uses)
+
+    def __len__(self) -> int:
+        return len(self.uses)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {len(self.uses)} materials @ 0x{id(self):016X}>"
+
+    def counts(self) -> Dict[str, int]:
+        """{shader: number of sides}"""
+        return {shader: len(sides) for shader, sides in self.uses.items()}
+
+    def rebuild(self, entities: Iterable[Entity]):
+        self.uses = dict()
+        for entity in entities:
+            for brush in entity.brushes:
+                for side in brush.sides:
+                    self.uses.setdefault(side.shader, list()).append(side)
+
+    def replace(self, old_shader: str, new_shader: str) -> int:
+        """retexture every side using old_shader; -> number of sides changed"""
+        sides = [side for side in self.uses.pop(old_shader, list()) if side.shader == old_shader]
+        new_shader = sys.intern(new_shader)
+        for side in sides:
+            side.shader = new_shader
+        if len(sides) != 0:
+            self.uses.setdefault(new_shader, list()).extend(sides)
+        return len(sides)
 
 
 class MapFile(breki.ParsedFile):
+    block_hashes: List[Tuple[int, int, int, int, bytes]]
+    # ^ [(start, end, first_line_no, last_line_no, digest)]; top-level {} blocks seen by .reparse()
+    block_items: List[Any]
+    # ^ object parsed from each block (Entity, or (Node, Entity) for .vmf)
+    brush_spans: Dict[Entity, List[Tuple[int, int]]]
+    # ^ {entity: [(first_line_no, last_line_no)]}; brushes skipped by .parse_entities()
+    # -- keyed by entity (not index), so they stay valid if .entities is edited
     comments: Dict[int, str]
     # ^ {line_no: "comment"}
-    entities: List[Entity]
+    entities: EntityList  # List[Entity]
+    _materials: Optional[MaterialTable]  # see .materials
+    _planes: Optional[planes.PlaneTable]  # see .planes
+    parse_stats: Optional[stats.ParseStats]
+    # ^ stats of the last parse; only recorded while abe.stats is enabled
     worldspawn: Entity = property(lambda s: s.entities[0])
 
     def __init__(self, filepath: str, archive=None, code_page=None):
         super().__init__(filepath, archive, code_page)
+        self.block_hashes = list()
+        self.block_items = list()
+        self.brush_spans = dict()
         self.comments = dict()
         self.entities = list()
+        self._materials = None
+        self._planes = None
+        self.parse_stats = None
 
     @parse_first
     def __repr__(self) -> str:
         descriptor = f'"{self.filename}" {len(self.entities)} entities'
         return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
 
+    @parse_first
+    def as_lines(self) -> List[str]:
+        return list(self.iter_lines())
+
+    @parse_first
+    def iter_lines(self) -> Iterator[str]:
+        """unparser; yields lines one at a time"""
+        if len(self.brush_spans) != 0:
+            self.load_brushes()
+        for entity in self.entities:
+            yield "{"
+            for key, value in entity.items():
+                yield f'"{key}" "{value}"'
+            for brush in entity.brushes:
+                yield "{"
+                yield from map(str, brush.sides)
+                yield "}"
+            yield "}"
+
+    def load_brushes(self, entities: Iterable[Entity] = None):
+        """decode brushes skipped by .parse_entities()"""
+        raise NotImplementedError()
+
+    def reparse(self):
+        """re-read the file & only parse top-level blocks whose text changed"""
+        # NOTE: only blocks hashed by a previous .reparse() are reused; call it instead of .parse()
+        raise NotImplementedError()
+
+    def reread(self) -> str:
+        """full text of the file; files on disk are reopened to catch external edits"""
+        stream = vars(self).get("stream")
+        if stream is not None and getattr(stream, "name", None) == self.filepath:
+            stream.close()
+            del self.stream  # cached_property; reopened on access
+        self.stream.seek(0)
+        return self.stream.read()
+
+    def save_as(self, filepath: str):
+        """save changes to file"""
+        encoding, errors = self.code_page
+        with open(filepath, "w", encoding=encoding, errors=errors, newline="\n") as out_file:
+            self.write(out_file)
+
+    def write(self, stream: io.TextIOBase, buffer_size: int = 1 << 16):
+        """stream .iter_lines() to a text file-like object, ~buffer_size characters at a time"""
+        # NOTE: output is identical to .as_bytes() (no trailing newline)
+        buffer = list()
+        buffered = 0
+        separator = ""
+        for line in self.iter_lines():
+            buffer.append(line)
+            buffered += len(line) + 1
+            if buffered >= buffer_size:
+                stream.write(separator + "\n".join(buffer))
+                separator = "\n"
+                buffer.clear()
+                buffered = 0
+        if len(buffer) != 0:
+            stream.write(separator + "\n".join(buffer))
+
+    def iter_entities(self) -> Iterator[Entity]:
+        """yield each entity; formats w/ a streaming parser don't store them"""
+        self.parse()
+        yield from self.entities
+
+    @parse_first
+    def as_physics(self, epsilon: float = clip.EPSILON) -> List[Optional[physics.Brush]]:
+        """every brush of every entity, in order; None for brushes w/o volume"""
+        if len(self.brush_spans) != 0:
+            self.load_brushes()
+        brushes = [brush for entity in self.entities for brush in entity.brushes]
+        return physics_brushes(brushes, epsilon)
+
     @parse_first
     def search(self, **search: Dict[str, str]) -> List[Entity]:
         """Search for entities by key-values; e.g. .search(key=value) -> [{"key": value, ...}, ...]"""
-        return [
-            entity
-            for entity in self.entities
-            if all([
-                entity.get(key, "") == value
-                for key, value in search.items()])]
+        return self.entities.search(**search)
 
     @parse_first
     def entities_by_classname(self) -> Dict[str, List[Entity]]:
-        out = defaultdict(str)
-        for entity in self.entities:
-            out[entity.classname].append(entity)
-        return dict(out)
+        return self.entities.by_classname()
+
+    @property
+    def entities(self) -> EntityList:
+        return self._entities
+
+    @entities.setter
+    def entities(self, entities: List[Entity]):
+        if not isinstance(entities, EntityList):
+            entities = EntityList(entities)
+        self._entities = entities
+        self._materials = None
+        self._planes = None
+
+    @property
+    @parse_first
+    def materials(self) -> MaterialTable:
+        """sides using each shader; built on first access"""
+        if self._materials is None:
+            if len(self.brush_spans) != 0:
+                self.load_brushes()
+            self._materials = MaterialTable(self.entities)
+        return self._materials
+
+    @property
+    @parse_first
+    def planes(self) -> planes.PlaneTable:
+        """unique planes of every side; built on first access"""
+        # NOTE: sides keep their own planes (& triangles) for writing; .plane_index is for comparisons
+        # -- lazy sides aren't decoded to build the table; they only gain a .plane_index
+        if self._planes is None:
+            if len(self.brush_spans) != 0:
+                self.load_brushes()
+            self._planes = planes.PlaneTable.from_entities(self.entities)
+        return self._planes
 
     @classmethod
     def from_entities(cls, filepath: str, entities: List[Entity]) -> MapFile:
@@ -0,0 +1,347 @@
+"""binary parse cache"""
+# NOTE: one file per map, named after a hash of the map's full path
+# -- entries are reused while the map's mtime & size, or content hash, match
+# -- layout: MAGIC, version & header size, JSON header, then 64-byte aligned arrays
+# -- arrays are memory-mapped on load; all strings live in one deduplicated table
+from __future__ import annotations
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import base
+from . import store
+
+
+MAGIC = b"ABEC"
+VERSION = 2
+ALIGNMENT = 64
+STORE_COLUMNS = (
+    "plane_normals", "plane_distances", "triangles",
+    "texture_axes", "texture_offsets", "texture_scales", "texture_rotations",
+    "shader_indices", "brush_offsets", "entity_offsets")
+folder: Optional[str] = os.environ.get("ABE_CACHE_DIR")
+# ^ None disables the cache
+compact: bool = False
+# ^ True leaves brushes in read-only BrushLists over the memory-mapped arrays
+# -- BrushList sides are rebuilt from floats, so they aren't written back w/ their original text
+
+
+def enable(cache_folder: str, compact_brushes: bool = False):
+    """cache all parsed maps in cache_folder"""
+    global folder, compact
+    os.makedirs(cache_folder, exist_ok=True)
+    folder = cache_folder
+    compact = compact_brushes
+
+
+def disable():
+    global folder
+    folder = None
+
+
+# MapFile HOOKS
+
+def load(map_file: base.MapFile) -> bool:
+    """fill in map_file from the cache; False if there is no valid entry"""
+    entry = entry_path(map_file)
+    if entry is None or not os.path.exists(entry):
+        return False
+    try:
+        header, arrays = read(entry)
+    except (OSError, ValueError, KeyError):
+        return False  # corrupt or outdated
+    if header.get("class") != map_file.__class__.__name__:
+        return False
+    source = header["source"]
+    stat = os.stat(map_file.filepath)
+    if (stat.st_mtime_ns, stat.st_size) != (source["mtime_ns"], source["size"]):
+        if stat.st_size != source["size"] or content_hash(map_file.filepath) != source["hash"]:
+            return False
+    strings = unpack_strings(arrays["string_offsets"], arrays["string_data"])
+    if "node_types" in arrays:
+        unpack_nodes(map_file, arrays, strings)
+    unpack_entities(map_file, arrays, strings)
+    return True
+
+
+def save(map_file: base.MapFile):
+    """write a cache entry for map_file; formats the cache can't store are skipped"""
+    entry = entry_path(map_file)
+    if entry is None:
+        return
+    strings = StringTable()
+    arrays = pack_entities(map_file, strings)
+    if hasattr(map_file, "nodes"):  # Vmf
+        arrays.update(pack_nodes(map_file, strings))
+    arrays.update(strings.as_arrays())
+    stat = os.stat(map_file.filepath)
+    header = {
+        "class": map_file.__class__.__name__,
+        "source": {
+            "path": os.path.abspath(map_file.filepath),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": content_hash(map_file.filepath)}}
+    os.makedirs(folder, exist_ok=True)
+    write(entry, header, arrays)
+
+
+def entry_path(map_file: base.MapFile) -> Optional[str]:
+    """cache file for map_file; None if the cache is disabled or map_file isn't on disk"""
+    if folder is None or map_file.archive is not None:
+        return None
+    stream = vars(map_file).get("stream")  # opened by from_file on first access
+    if stream is not None and getattr(stream, "name", None) != map_file.filepath:
+        return None  # from_lines, from_bytes or from_stream
+    if not os.path.isfile(map_file.filepath):
+        return None
+    path_hash = hashlib.sha1(os.path.abspath(map_file.filepath).encode("utf-8")).hexdigest()
+    return os.path.join(folder, f"{path_hash}.abec")
+
+
+def content_hash(filepath: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filepath, "rb") as in_file:
+        for block in iter(lambda: in_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# FILE FORMAT
+
+def read(filepath: str) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """-> (header, {name: memory-mapped array})"""
+    with open(filepath, "rb") as cache_file:
+        if cache_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} is not a cache file")
+        version, header_size = struct.unpack("<IQ", cache_file.read(12))
+        if version != VERSION:
+            raise ValueError(f"unsupported cache version: {version}")
+        header = json.loads(cache_file.read(header_size))
+    data_start = aligned(len(MAGIC) + 12 + header_size)
+    arrays = dict()
+    for name, (dtype, shape, offset) in header.pop("arrays").items():
+        shape = tuple(shape)
+        if 0 in shape:  # cannot mmap 0 bytes
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            mapped = np.memmap(filepath, dtype, "r", data_start + offset, shape)
+            arrays[name] = mapped.view(np.ndarray)  # memmap.__getitem__ is slow
+    return header, arrays
+
+
+def write(filepath: str, header: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    table = dict()
+    offset = 0
+    for name, array in arrays.items():
+        offset = aligned(offset)
+        table[name] = (array.dtype.str, array.shape, offset)
+        offset += array.nbytes
+    raw_header = json.dumps({**header, "arrays": table}).encode("utf-8")
+    data_start = aligned(len(MAGIC) + 12 + len(raw_header))
+    # NOTE: written to a temporary file first, so readers never see half an entry
+    temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp_filepath, "wb") as cache_file:
+        cache_file.write(MAGIC)
+        cache_file.write(struct.pack("<IQ", VERSION, len(raw_header)))
+        cache_file.write(raw_header)
+        for name, array in arrays.items():
+            cache_file.write(b"\0" * (data_start + table[name][2] - cache_file.tell()))
+            cache_file.write(array.tobytes())
+    os.replace(temp_filepath, filepath)
+
+
+def aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class StringTable:
+    """deduplicated strings, stored as utf-8 bytes & offsets"""
+    indices: Dict[str, int]
+
+    def __init__(self):
+        self.indices = dict()
+
+    def add(self, string: str) -> int:
+        return self.indices.setdefault(str(string), len(self.indices))
+
+    def as_arrays(self) -> Dict[str, np.ndarray]:
+        encoded = [string.encode("utf-8") for string in self.indices]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(raw) for raw in encoded])
+        return {
+            "string_offsets": offsets,
+            "string_data": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+
+
+def unpack_strings(offsets: np.ndarray, data: np.ndarray) -> List[str]:
+    raw = data.tobytes()
+    offsets = offsets.tolist()
+    return [
+        raw[start:end].decode("utf-8")
+        for start, end in zip(offsets, offsets[1:])]
+
+
+# MAP FORMATS
+
+def pack_offsets(lengths: List[int]) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    return offsets
+
+
+def pack_key_values(entries: List[List[Tuple[str, str]]], strings: StringTable) -> Tuple[np.ndarray, np.ndarray]:
+    """-> (offsets, key_values); key_values are (key, value) string indices"""
+    offsets = pack_offsets([len(key_values) for key_values in entries])
+    key_values = np.array([
+        (strings.add(key), strings.add(value))
+        for key_values in entries
+        for key, value in key_values], dtype=np.int32).reshape(-1, 2)
+    return offsets, key_values
+
+
+def unpack_key_values(offsets: np.ndarray, key_values: np.ndarray, strings: List[str]) -> List[List[Tuple[str, str]]]:
+    offsets = offsets.tolist()
+    key_values = [(strings[key], strings[value]) for key, value in key_values.tolist()]
+    return [key_values[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def pack_comments(comments: Dict[int, str], strings: StringTable) -> Dict[str, np.ndarray]:
+    return {
+        "comment_lines": np.array(list(comments.keys()), dtype=np.int64),
+        "comment_strings": np.array([strings.add(comment) for comment in comments.values()], dtype=np.int32)}
+
+
+def unpack_comments(arrays: Dict[str, np.ndarray], strings: List[str]) -> Dict[int, str]:
+    return {
+        line_no: strings[index]
+        for line_no, index in zip(arrays["comment_lines"].tolist(), arrays["comment_strings"].tolist())}
+
+
+def pack_entities(map_file: base.MapFile, strings: StringTable) -> Dict[str, np.ndarray]:
+    """entities & comments; sides as the text they'd be written w/, plus BrushStore columns if compact"""
+    # NOTE: side text keeps layout, extra words & exact numbers; lazy sides are rebuilt from it
+    # -- eager words are stored too, so sides don't need to be split again on load
+    brushes = [brush for entity in map_file.entities for brush in entity.brushes]
+    sides = [side for brush in brushes for side in brush.sides]
+    eager_words = list(map_file.BrushSideClass.eager_words)
+    kv_offsets, key_values = pack_key_values(
+        [entity.items() for entity in map_file.entities], strings)
+    arrays = {
+        "entity_kv_offsets": kv_offsets,
+        "entity_key_values": key_values,
+        **pack_comments(map_file.comments, strings),
+        "entity_brush_offsets": pack_offsets([len(entity.brushes) for entity in map_file.entities]),
+        "brush_side_offsets": pack_offsets([len(brush.sides) for brush in brushes]),
+        "side_lines": np.array([strings.add(side) for side in sides], dtype=np.int32),
+        "side_eager_words": np.array([
+            [strings.add(getattr(side, name)) for name in eager_words]
+            for side in sides], dtype=np.int32).reshape(-1, len(eager_words)),
+        "side_extra_words": np.array([
+            strings.add(" ".join(side.extra_words)) if len(side.extra_words) != 0 else -1
+            for side in sides], dtype=np.int32)}
+    if not compact:
+        return arrays  # BrushStore columns decode every side; only pay for them when they'll be used
+    try:
+        brush_store = store.BrushStore.from_entities(map_file.entities)
+    except NotImplementedError:
+        return arrays  # e.g. CoD4Map brush sides don't fit a BrushStore; no compact brushes
+    arrays.update({
+        **{
+            column: getattr(brush_store, column)
+            for column in STORE_COLUMNS},
+        "shader_strings": np.array([strings.add(shader) for shader in brush_store.shaders], dtype=np.int32)})
+    return arrays
+
+
+def unpack_entities(map_file: base.MapFile, arrays: Dict[str, np.ndarray], strings: List[str]):
+    key_values = unpack_key_values(arrays["entity_kv_offsets"], arrays["entity_key_values"], strings)
+    if compact and "shader_strings" in arrays:
+        brush_lists = unpack_brush_store(map_file, arrays, strings)
+    else:
+        brush_lists = unpack_brushes(map_file, arrays, strings)
+    entities = list()
+    for entity_key_values, brushes in zip(key_values, brush_lists):
+        entity = getattr(map_file, "EntityClass", base.Entity)()
+        for key, value in entity_key_values:
+            entity[key] = value
+        entity.brushes = brushes
+        entities.append(entity)
+    map_file.entities = entities
+    map_file.comments = unpack_comments(arrays, strings)
+
+
+def unpack_brushes(map_file: base.MapFile, arrays: Dict[str, np.ndarray], strings: List[str]) -> List[List[base.Brush]]:
+    """[[Brush] for each entity]; w/ lazy sides rebuilt from their text"""
+    from_parts = map_file.BrushSideClass.from_parts
+    sides = [
+        from_parts(
+            strings[line], [strings[i] for i in eager_words],
+            tuple(strings[extra_words].split()) if extra_words != -1 else tuple())
+        for line, eager_words, extra_words in zip(
+            arrays["side_lines"].tolist(),
+            arrays["side_eager_words"].tolist(),
+            arrays["side_extra_words"].tolist())]
+    side_offsets = arrays["brush_side_offsets"].tolist()
+    brushes = [
+        base.Brush(sides[first:last])
+        for first, last in zip(side_offsets, side_offsets[1:])]
+    brush_offsets = arrays["entity_brush_offsets"].tolist()
+    return [
+        brushes[first:last]
+        for first, last in zip(brush_offsets, brush_offsets[1:])]
+
+
+def unpack_brush_store(map_file: base.MapFile, arrays: Dict[str, np.ndarray],
+                       strings: List[str]) -> List[store.BrushList]:
+    """[BrushList for each entity]; read-only & backed by the memory-mapped arrays"""
+    brush_store = store.BrushStore()
+    for column in STORE_COLUMNS:
+        setattr(brush_store, column, arrays[column])
+    brush_store.shaders = [strings[index] for index in arrays["shader_strings"].tolist()]
+    brush_store.side_class = getattr(map_file, "BrushSideClass", base.BrushSide)
+    return [
+        store.BrushList(brush_store, i)
+        for i in range(len(arrays["entity_brush_offsets"]) - 1)]
+
+
+def pack_nodes(map_file: base.MapFile, strings: StringTable) -> Dict[str, np.ndarray]:
+    """node tree, depth first; w/o the "solid" nodes of entities (see pack_entities)"""
+    # NOTE: like .parse_entities(), .as_lines() rebuilds world & entity nodes from .entities
+    nodes, parents = list(), list()
+    stack = [(node, -1) for node in reversed(map_file.nodes)]
+    while len(stack) != 0:
+        node, parent = stack.pop()
+        parents.append(parent)
+        nodes.append(node)
+        children = node.nodes
+        if parent == -1 and node.node_type in ("world", "entity"):
+            children = [child for child in children if child.node_type != "solid"]
+        stack.extend((child, len(nodes) - 1) for child in reversed(children))
+    kv_offsets, key_values = pack_key_values([node.key_values for node in nodes], strings)
+    return {
+        "node_types": np.array([strings.add(node.node_type) for node in nodes], dtype=np.int32),
+        "node_parents": np.array(parents, dtype=np.int64),
+        "node_kv_offsets": kv_offsets,
+        "node_key_values": key_values}
+
+
+def unpack_nodes(map_file: base.MapFile, arrays: Dict[str, np.ndarray], strings: List[str]):
+    key_values = unpack_key_values(arrays["node_kv_offsets"], arrays["node_key_values"], strings)
+    nodes = list()
+    top_level = list()
+    for node_type, parent, node_key_values in zip(
+            arrays["node_types"].tolist(), arrays["node_parents"].tolist(), key_values):
+        node = map_file.NodeClass(strings[node_type])
+        node.key_values.extend(node_key_values)
+        if parent == -1:
+            top_level.append(node)
+        else:
+            nodes[parent].nodes.append(node)
+        nodes.append(node)
+    map_file.nodes = type(map_file.nodes)(top_level)
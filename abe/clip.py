@@ -0,0 +1,147 @@
+"""vectorised brush -> polygon conversion"""
+from __future__ import annotations
+import itertools
+from typing import Dict, Tuple
+
+import numpy as np
+
+from . import texture
+
+
+EPSILON = 0.01  # max distance from a plane for a point to be on it
+SNAP = 1 / 1024  # vertices are rounded to this grid
+# NOTE: brushes are processed in chunks of ~CHUNK_SIZE floats
+CHUNK_SIZE = 1 << 22
+
+_combinations: Dict[int, np.ndarray] = dict()
+# ^ {num_sides: [(i, j, k)]}
+
+
+def combinations(num_sides: int) -> np.ndarray:
+    """every unique triple of side indices"""
+    if num_sides not in _combinations:
+        _combinations[num_sides] = np.array(
+            list(itertools.combinations(range(num_sides), 3)),
+            dtype=np.int64).reshape(-1, 3)
+    return _combinations[num_sides]
+
+
+def brush_faces(normals: np.ndarray, distances: np.ndarray, brush_offsets: np.ndarray,
+                epsilon: float = EPSILON, snap: float = SNAP) -> Tuple[np.ndarray, np.ndarray]:
+    """polygon of each side, clipped by all other sides of the same brush
+
+    returns (positions, side_offsets)
+    -- positions: (vertices, 3) float64
+    -- side_offsets: (sides + 1,) int64; side i -> positions[offsets[i]:offsets[i + 1]]
+    -- sides which don't contribute to geometry (e.g. bevels) get 0 vertices"""
+    # NOTE: plane normals point out of the brush; inside is behind each plane
+    # NOTE: polygons are wound counter-clockwise, when viewed from the front
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    distances = np.asarray(distances, dtype=np.float64).reshape(-1)
+    brush_offsets = np.asarray(brush_offsets, dtype=np.int64)
+    num_sides = len(distances)
+    # normalise planes
+    lengths = np.linalg.norm(normals, axis=1)
+    lengths[lengths == 0] = 1
+    normals = normals / lengths[:, None]
+    distances = distances / lengths
+    # vertices: intersection of 3 planes, inside all others
+    face_chunks, point_chunks = list(), list()
+    side_counts = np.diff(brush_offsets)
+    for num_brush_sides in np.unique(side_counts).tolist():
+        if num_brush_sides < 4:
+            continue  # cannot be closed
+        triples = combinations(num_brush_sides)
+        brushes = np.nonzero(side_counts == num_brush_sides)[0]
+        chunk = max(1, CHUNK_SIZE // (len(triples) * num_brush_sides))
+        for first in range(0, len(brushes), chunk):
+            sides = brush_offsets[brushes[first:first + chunk], None] + np.arange(num_brush_sides)
+            faces, points = _brush_vertices(
+                normals[sides], distances[sides], sides, triples, epsilon)
+            face_chunks.append(faces)
+            point_chunks.append(points)
+    if len(face_chunks) == 0:
+        return np.zeros((0, 3)), np.zeros(num_sides + 1, dtype=np.int64)
+    faces = np.concatenate(face_chunks)
+    points = np.concatenate(point_chunks)
+    # snap & deduplicate
+    points = np.round(points / snap) * snap + 0.0  # + 0.0 turns -0.0 into 0.0
+    order = np.lexsort((points[:, 2], points[:, 1], points[:, 0], faces))
+    faces, points = faces[order], points[order]
+    is_unique = np.ones(len(faces), dtype=bool)
+    is_unique[1:] = (faces[1:] != faces[:-1]) | np.any(points[1:] != points[:-1], axis=1)
+    faces, points = faces[is_unique], points[is_unique]
+    # drop faces w/ less than 3 vertices
+    counts = np.bincount(faces, minlength=num_sides)
+    is_polygon = counts[faces] >= 3
+    faces, points = faces[is_polygon], points[is_polygon]
+    counts = np.bincount(faces, minlength=num_sides)
+    # wind vertices around the centre of each face
+    centres = np.zeros((num_sides, 3))
+    np.add.at(centres, faces, points)
+    centres /= np.maximum(counts, 1)[:, None]
+    face_normals = normals[faces]
+    helper = np.where(
+        (np.abs(face_normals[:, 2]) < 0.9)[:, None],
+        np.array([0.0, 0.0, 1.0]), np.array([1.0, 0.0, 0.0]))
+    u = np.cross(face_normals, helper)
+    u /= np.linalg.norm(u, axis=1)[:, None]
+    v = np.cross(face_normals, u)  # u x v = normal
+    relative = points - centres[faces]
+    angles = np.arctan2(
+        np.einsum("ij,ij->i", relative, v),
+        np.einsum("ij,ij->i", relative, u))
+    order = np.lexsort((angles, faces))
+    side_offsets = np.zeros(num_sides + 1, dtype=np.int64)
+    np.cumsum(counts, out=side_offsets[1:])
+    return points[order], side_offsets
+
+
+def _brush_vertices(normals: np.ndarray, distances: np.ndarray, sides: np.ndarray,
+                    triples: np.ndarray, epsilon: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(face_indices, points) for a batch of brushes w/ the same number of sides"""
+    # normals: (brushes, sides, 3); distances & sides: (brushes, sides)
+    A, B, C = [normals[:, triples[:, i]] for i in range(3)]  # (brushes, triples, 3)
+    dA, dB, dC = [distances[:, triples[:, i], None] for i in range(3)]
+    BxC = np.cross(B, C)
+    determinant = np.einsum("btj,btj->bt", A, BxC)
+    is_valid = np.abs(determinant) > 1e-9  # 3 planes w/ a single intersection
+    determinant[~is_valid] = 1
+    points = (dA * BxC + dB * np.cross(C, A) + dC * np.cross(A, B)) / determinant[..., None]
+    # distance of each point from each plane in it's brush
+    separation = np.einsum("btj,bsj->bts", points, normals) - distances[:, None, :]
+    is_inside = is_valid & np.all(separation <= epsilon, axis=2)
+    is_on_face = (np.abs(separation) <= epsilon) & is_inside[..., None]
+    brush, triple, side = np.nonzero(is_on_face)
+    return sides[brush, side], points[brush, triple]
+
+
+def face_uvs(positions: np.ndarray, side_offsets: np.ndarray, texture_axes: np.ndarray,
+             texture_offsets: np.ndarray, texture_scales: np.ndarray) -> np.ndarray:
+    """(vertices, 2) uvs for brush_faces output"""
+    sides = np.repeat(np.arange(len(side_offsets) - 1), np.diff(side_offsets))
+    return texture.project(positions, texture_axes[sides], texture_offsets[sides], texture_scales[sides])
+
+
+def brush_bounds(positions: np.ndarray, side_offsets: np.ndarray,
+                 brush_offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(mins, maxs) of each brush, from brush_faces output; NaN for brushes w/o vertices"""
+    vertex_offsets = np.asarray(side_offsets)[np.asarray(brush_offsets)]
+    num_brushes = len(vertex_offsets) - 1
+    mins = np.full((num_brushes, 3), np.nan)
+    maxs = np.full((num_brushes, 3), np.nan)
+    has_vertices = np.diff(vertex_offsets) > 0
+    if np.any(has_vertices):
+        starts = vertex_offsets[:-1][has_vertices]
+        mins[has_vertices] = np.minimum.reduceat(positions, starts)
+        maxs[has_vertices] = np.maximum.reduceat(positions, starts)
+    return mins, maxs
+
+
+def axial_planes(normals: np.ndarray) -> np.ndarray:
+    """(sides,) bool; True for planes facing along the x, y or z axis"""
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    lengths = np.linalg.norm(normals, axis=1)
+    lengths[lengths == 0] = 1
+    largest = np.abs(normals).max(axis=1) / lengths
+    return np.isclose(largest, 1, rtol=1e-09, atol=0)  # same as math.isclose
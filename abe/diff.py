@@ -0,0 +1,255 @@
+"""structural diff of 2 maps via Merkle hashes"""
+# NOTE: hashes are built bottom-up: side -> brush -> entity -> map
+# -- brush & entity hashes ignore order, so reordered sides, brushes & entities aren't changes
+# -- subtrees w/ equal hashes are skipped, so comparing is proportional to what changed
+# NOTE: hashes use python's hash(); they aren't stable across processes
+from __future__ import annotations
+import collections
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from . import base
+
+
+ENTITY_KEYS = ("id", "hammerid", "targetname")
+# ^ key-values that identify an entity across edits, in order of preference
+
+
+def side_hash(side: base.BrushSide) -> int:
+    """BrushSide.__hash__ + everything else a side writes (e.g. CoD4 projections)"""
+    return hash((
+        side, float(side.texture_rotation),
+        getattr(side, "shader_projection", None),
+        getattr(side, "lightmap", None),
+        getattr(side, "lightmap_projection", None)))
+
+
+def brush_hash(brush: base.Brush) -> int:
+    return hash(tuple(sorted(map(side_hash, brush.sides))))
+
+
+def key_values_hash(entity: base.Entity) -> int:
+    return hash(frozenset(entity.items()))
+
+
+def entity_key(entity: base.Entity) -> Tuple[Optional[str], ...]:
+    """(classname, key, value) w/ the first of ENTITY_KEYS entity has; (classname,) if none"""
+    classname = entity.get("classname")
+    for key in ENTITY_KEYS:
+        value = entity.get(key)
+        if value is not None:
+            return (classname, key, value)
+    return (classname,)
+
+
+def match(old_hashes: List[Any], new_hashes: List[Any]) -> Tuple[Dict[int, int], List[int], List[int]]:
+    """-> ({old_index: new_index}, unmatched_old, unmatched_new); equal hashes are paired in order"""
+    unmatched = collections.defaultdict(collections.deque)
+    for i, new_hash in enumerate(new_hashes):
+        unmatched[new_hash].append(i)
+    pairs, unmatched_old = dict(), list()
+    for i, old_hash in enumerate(old_hashes):
+        candidates = unmatched.get(old_hash)
+        if candidates:
+            pairs[i] = candidates.popleft()
+        else:
+            unmatched_old.append(i)
+    paired = set(pairs.values())
+    unmatched_new = [i for i in range(len(new_hashes)) if i not in paired]
+    return pairs, unmatched_old, unmatched_new
+
+
+class MerkleTree:
+    """content hashes of a map's entities & brushes"""
+    map_file: base.MapFile
+    root: int  # hash of the whole map
+    entity_hashes: List[int]
+    key_value_hashes: List[int]  # for each entity
+    brush_hashes: List[List[int]]  # for each brush of each entity
+
+    def __init__(self, map_file: base.MapFile):
+        if not map_file.is_parsed:
+            map_file.parse()
+        if len(map_file.brush_spans) != 0:
+            map_file.load_brushes()
+        self.map_file = map_file
+        self.key_value_hashes = list(map(key_values_hash, map_file.entities))
+        self.brush_hashes = [
+            list(map(brush_hash, entity.brushes))
+            for entity in map_file.entities]
+        self.entity_hashes = [
+            hash((key_values, tuple(sorted(brushes))))
+            for key_values, brushes in zip(self.key_value_hashes, self.brush_hashes)]
+        self.root = hash(tuple(sorted(self.entity_hashes)))
+
+    def __repr__(self) -> str:
+        descriptor = f'"{self.map_file.filename}" {len(self.entity_hashes)} entities'
+        return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
+
+
+class BrushDiff:
+    """sides of 1 brush that changed"""
+    old_index: int
+    new_index: int
+    added_sides: List[base.BrushSide]
+    removed_sides: List[base.BrushSide]
+
+    def __init__(self, old_index: int, new_index: int, added_sides=None, removed_sides=None):
+        self.old_index = old_index
+        self.new_index = new_index
+        self.added_sides = list() if added_sides is None else added_sides
+        self.removed_sides = list() if removed_sides is None else removed_sides
+
+    def __repr__(self) -> str:
+        descriptor = f"+{len(self.added_sides)} -{len(self.removed_sides)} sides"
+        return f"<{self.__class__.__name__} #{self.old_index} -> #{self.new_index} {descriptor}>"
+
+
+class EntityDiff:
+    """key-values & brushes of 1 entity that changed"""
+    old_index: int
+    new_index: int
+    classname: Optional[str]
+    added_keys: Dict[str, str]
+    removed_keys: Dict[str, str]
+    changed_keys: Dict[str, Tuple[str, str]]  # {key: (old_value, new_value)}
+    added_brushes: List[int]  # new brush indices
+    removed_brushes: List[int]  # old brush indices
+    modified_brushes: List[BrushDiff]
+
+    def __init__(self, old_index: int, new_index: int, classname: Optional[str] = None):
+        self.old_index = old_index
+        self.new_index = new_index
+        self.classname = classname
+        self.added_keys = dict()
+        self.removed_keys = dict()
+        self.changed_keys = dict()
+        self.added_brushes = list()
+        self.removed_brushes = list()
+        self.modified_brushes = list()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} #{self.old_index} -> #{self.new_index} ({self.classname})>"
+
+    def iter_lines(self) -> Iterator[str]:
+        yield f"~ entity #{self.old_index} -> #{self.new_index} ({self.classname})"
+        for key, (old_value, new_value) in self.changed_keys.items():
+            yield f'    ~ "{key}" "{old_value}" -> "{new_value}"'
+        for key, value in self.added_keys.items():
+            yield f'    + "{key}" "{value}"'
+        for key, value in self.removed_keys.items():
+            yield f'    - "{key}" "{value}"'
+        for brush_diff in self.modified_brushes:
+            yield f"    ~ brush #{brush_diff.old_index} -> #{brush_diff.new_index}"
+            yield from (f"        + {side!s}" for side in brush_diff.added_sides)
+            yield from (f"        - {side!s}" for side in brush_diff.removed_sides)
+        yield from (f"    + brush #{i}" for i in self.added_brushes)
+        yield from (f"    - brush #{i}" for i in self.removed_brushes)
+
+
+class MapDiff:
+    """entities added, removed & modified between 2 maps"""
+    old: MerkleTree
+    new: MerkleTree
+    added: List[int]  # new entity indices
+    removed: List[int]  # old entity indices
+    modified: List[EntityDiff]
+
+    def __init__(self, old: MerkleTree, new: MerkleTree):
+        self.old = old
+        self.new = new
+        self.added = list()
+        self.removed = list()
+        self.modified = list()
+
+    def __bool__(self) -> bool:
+        return len(self.added) + len(self.removed) + len(self.modified) != 0
+
+    def __repr__(self) -> str:
+        descriptor = f"+{len(self.added)} -{len(self.removed)} ~{len(self.modified)} entities"
+        return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
+
+    def __str__(self) -> str:
+        return "\n".join(self.iter_lines())
+
+    def iter_lines(self) -> Iterator[str]:
+        """human readable report"""
+        for entity_diff in self.modified:
+            yield from entity_diff.iter_lines()
+        old_entities, new_entities = self.old.map_file.entities, self.new.map_file.entities
+        yield from (f"+ entity #{i} ({new_entities[i].get('classname')})" for i in self.added)
+        yield from (f"- entity #{i} ({old_entities[i].get('classname')})" for i in self.removed)
+
+
+def compare(old: Union[base.MapFile, MerkleTree], new: Union[base.MapFile, MerkleTree]) -> MapDiff:
+    """diff 2 maps; pass MerkleTrees to reuse hashes across comparisons"""
+    old = old if isinstance(old, MerkleTree) else MerkleTree(old)
+    new = new if isinstance(new, MerkleTree) else MerkleTree(new)
+    out = MapDiff(old, new)
+    if old.root == new.root:
+        return out
+    _, old_left, new_left = match(old.entity_hashes, new.entity_hashes)
+    # pair changed entities by identifying key-values, then by classname (in order)
+    old_entities, new_entities = old.map_file.entities, new.map_file.entities
+    pairs = dict()
+    for key_func in (entity_key, lambda entity: entity.get("classname")):
+        by_key, old_rest, new_rest = match(
+            [key_func(old_entities[i]) for i in old_left],
+            [key_func(new_entities[i]) for i in new_left])
+        pairs.update({old_left[i]: new_left[j] for i, j in by_key.items()})
+        old_left = [old_left[i] for i in old_rest]
+        new_left = [new_left[i] for i in new_rest]
+    out.added, out.removed = new_left, old_left
+    out.modified = [compare_entities(old, new, i, j) for i, j in sorted(pairs.items())]
+    return out
+
+
+def compare_entities(old: MerkleTree, new: MerkleTree, old_index: int, new_index: int) -> EntityDiff:
+    old_entity = old.map_file.entities[old_index]
+    new_entity = new.map_file.entities[new_index]
+    out = EntityDiff(old_index, new_index, new_entity.get("classname"))
+    # key-values
+    if old.key_value_hashes[old_index] != new.key_value_hashes[new_index]:
+        old_key_values, new_key_values = dict(old_entity.items()), dict(new_entity.items())
+        for key, value in new_key_values.items():
+            if key not in old_key_values:
+                out.added_keys[key] = value
+            elif old_key_values[key] != value:
+                out.changed_keys[key] = (old_key_values[key], value)
+        out.removed_keys = {
+            key: value
+            for key, value in old_key_values.items()
+            if key not in new_key_values}
+    # brushes
+    _, removed, added = match(old.brush_hashes[old_index], new.brush_hashes[new_index])
+    if len(removed) + len(added) == 0:
+        return out
+    old_brushes = {i: old_entity.brushes[i] for i in removed}
+    new_brushes = {i: new_entity.brushes[i] for i in added}
+    # pair changed brushes that share at least half their sides
+    new_sides = {i: {side_hash(side): side for side in brush.sides} for i, brush in new_brushes.items()}
+    brushes_with_side = collections.defaultdict(list)
+    for i, sides in new_sides.items():
+        for hashed in sides:
+            brushes_with_side[hashed].append(i)
+    unpaired = set(added)
+    for i in removed:
+        old_sides = {side_hash(side): side for side in old_brushes[i].sides}
+        shared = collections.Counter(
+            j
+            for hashed in old_sides
+            for j in brushes_with_side.get(hashed, ())
+            if j in unpaired)
+        if len(shared) == 0:
+            continue
+        j, count = max(shared.items(), key=lambda item: (item[1], -item[0]))
+        if count * 2 < len(old_sides):
+            continue
+        unpaired.discard(j)
+        out.modified_brushes.append(BrushDiff(
+            i, j,
+            [side for hashed, side in new_sides[j].items() if hashed not in old_sides],
+            [side for hashed, side in old_sides.items() if hashed not in new_sides[j]]))
+    paired_old = {brush_diff.old_index for brush_diff in out.modified_brushes}
+    out.removed_brushes = [i for i in removed if i not in paired_old]
+    out.added_brushes = sorted(unpaired)
+    return out
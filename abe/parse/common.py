@@ -1,7 +1,14 @@
-"""regex toolkit"""
+"""regex & lexer toolkit"""
 from __future__ import annotations
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import hashlib
+import io
+import os
 import re
-from typing import List
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from ass import physics
 from ass import vector
@@ -17,15 +24,263 @@ key_value_pair = r'"(.*)"\s"(.*)"'  # 2 groups
 point = f"\\( ?{double} {double} {double} ?\\)"  # 9 groups
 plane = f"{point} {point} {point}"  # 27 groups
 
+# NOTE: for splitting brush sides into words w/ str.split
+unbracket = str.maketrans("()[]", "    ")
+# NOTE: re.split w/ this alternates words & the text between them (keeps layout)
+word_separator = re.compile(r"([\s()\[\]]+)")
+# NOTE: for finding {} blocks w/o parsing
+brace_line = re.compile(r"^[ \t]*([{}])[ \t]*\r?$", re.MULTILINE)
 
+
+@functools.lru_cache(maxsize=1 << 16)
 def fstr(x: float) -> str:
     """str(float) without trailing zeroes"""
+    # NOTE: cached; maps reuse the same handful of coordinates a lot
     x = round(x, 2)
     if x % 1.0 == 0.0:
         return str(int(x))
     return str(x)
 
 
+def nstr(x: float) -> str:
+    """str(float) without a trailing ".0"; unlike fstr, doesn't round"""
+    if float(x).is_integer():
+        return str(int(x))
+    return str(x)
+
+
+def split_key_value(line: str) -> Optional[Tuple[str, str]]:
+    """key_value_pair w/o the regex; returns None if line doesn't match"""
+    if not line.startswith('"'):
+        return None
+    end = line.rfind('"')
+    # NOTE: like the regex, the key is greedy
+    separator = max(line.rfind('" "', 1, end), line.rfind('"\t"', 1, end))
+    if separator == -1:
+        return None
+    return line[1:separator], line[separator + 3:end]
+
+
+def tokenise(lines: Iterable[str], first_line_no: int = 0) -> Iterator[Tuple[int, str, Any]]:
+    """single pass lexer for .map files; yields (line_no, kind, payload)"""
+    # NOTE: line kind is determined by the first character
+    # -- "Comment", "BrushSide" & "Unknown" -> line
+    # -- "KeyValuePair" -> (key, value)
+    # -- "{" & "}" -> None
+    # NOTE: blank lines are skipped
+    for line_no, line in enumerate(lines, first_line_no):
+        line = line.strip()
+        if line == "":
+            continue  # MRVN-Radiant
+        first = line[0]
+        if first == "(":
+            yield line_no, "BrushSide", line
+        elif first == '"':
+            key_value = split_key_value(line)
+            if key_value is not None:
+                yield line_no, "KeyValuePair", key_value
+            else:
+                yield line_no, "Unknown", line
+        elif line == "{":
+            yield line_no, "{", None
+        elif line == "}":
+            yield line_no, "}", None
+        elif line.startswith(("//", "\\\\")):
+            # NOTE: only catches full line comments
+            # TODO: catch trailing comments
+            yield line_no, "Comment", line
+        else:
+            yield line_no, "Unknown", line
+
+
+def scan_entities(lines: Iterable[str], first_line_no: int = 0, comments: Dict[int, str] = None,
+                  ignore: re.Pattern = None) -> Iterator[Tuple[List[Tuple[str, str]], List[Tuple[int, int]]]]:
+    """fast pass over .map lines, skipping brushes; yields (key_values, brush_spans) for each entity"""
+    # NOTE: brush bodies are skipped by counting braces; their contents are not validated
+    # -- brush_spans: [(first_line_no, last_line_no)]; braces included
+    # NOTE: lines outside brushes raise the same errors as a full parse; unless they match ignore
+    comments = dict() if comments is None else comments
+    numbered = enumerate(lines, first_line_no)
+    key_values, brush_spans = None, None
+    line_no = first_line_no
+    for line_no, line in numbered:
+        line = line.strip()
+        if line == "":
+            continue
+        elif line == "{":
+            if key_values is None:  # entity
+                key_values, brush_spans = list(), list()
+                continue
+            first = line_no
+            depth = 1
+            for line_no, line in numbered:
+                line = line.strip()
+                if line == "{":
+                    depth += 1
+                elif line == "}":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                elif line.startswith(("//", "\\\\")):
+                    comments[line_no] = line
+            assert depth == 0, f"file ends prematurely at line {line_no}"
+            brush_spans.append((first, line_no))
+        elif line == "}":
+            assert key_values is not None, f"unexpected closing brace on line #{line_no}"
+            yield key_values, brush_spans
+            key_values = None
+        elif line.startswith(("//", "\\\\")):
+            comments[line_no] = line
+        elif line.startswith("("):
+            raise AssertionError("brushside outside of brush")
+        else:
+            key_value = split_key_value(line)
+            if key_value is not None:
+                assert key_values is not None, "keyvalues outside of entity"
+                key_values.append(key_value)
+            elif ignore is None or ignore.match(line) is None:
+                raise RuntimeError(f"Couldn't parse line #{line_no}: '{line}'")
+    assert key_values is None, f"file ends prematurely at line {line_no}"
+
+
+def read_spans(lines: Iterable[str], spans: List[Tuple[int, int, Any]],
+               first_line_no: int = 0) -> Iterator[Tuple[Any, int, List[str]]]:
+    """yield (key, first_line_no, lines) for each (first_line_no, last_line_no, key)"""
+    # NOTE: spans must be sorted & cannot overlap
+    spans = iter(spans)
+    span = next(spans, None)
+    span_lines = list()
+    for line_no, line in enumerate(lines, first_line_no):
+        if span is None:
+            break
+        first, last, key = span
+        if line_no < first:
+            continue
+        span_lines.append(line)
+        if line_no == last:
+            yield key, first, span_lines
+            span_lines = list()
+            span = next(spans, None)
+
+
+def block_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of each top-level {} block"""
+    # NOTE: end is the end of the closing brace's line
+    spans = list()
+    depth = 0
+    for match in brace_line.finditer(text):
+        if match.group(1) == "{":
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                spans.append((start, match.end()))
+    return spans
+
+
+def hash_blocks(text: str, prefix_lines: int = 0) -> List[Tuple[int, int, int, int, bytes]]:
+    """(start, end, first_line_no, last_line_no, digest) of each top-level {} block"""
+    # NOTE: prefix_lines extends each block to include lines before it's opening brace
+    # -- e.g. the node type line of a .vmf node
+    blocks = list()
+    offset, line_no = 0, 0
+    for start, end in block_spans(text):
+        for _ in range(prefix_lines):
+            start = text.rfind("\n", 0, max(start - 1, 0)) + 1
+        line_no += text.count("\n", offset, start)
+        offset = start
+        block = text[start:end].encode("utf-8", "surrogatepass")
+        digest = hashlib.blake2b(block, digest_size=16).digest()
+        blocks.append((start, end, line_no, line_no + block.count(b"\n"), digest))
+    return blocks
+
+
+def reuse_blocks(old_blocks: List[Tuple[int, int, int, int, bytes]],
+                 new_blocks: List[Tuple[int, int, int, int, bytes]]) -> List[Optional[int]]:
+    """index into old_blocks of an identical block for each new block; None if it's text changed"""
+    # NOTE: duplicate blocks are matched in order
+    unchanged = dict()
+    for i, block in reversed(list(enumerate(old_blocks))):
+        unchanged.setdefault(block[-1], list()).append(i)
+    return [
+        unchanged[block[-1]].pop() if len(unchanged.get(block[-1], ())) != 0 else None
+        for block in new_blocks]
+
+
+def gaps(text: str, blocks: List[Tuple[int, int, int, int, bytes]]) -> Iterator[Tuple[int, List[str]]]:
+    """(first_line_no, lines) of text before, between & after blocks"""
+    for before, after in zip([None, *blocks], [*blocks, None]):
+        start = 0 if before is None else before[1] + 1
+        end = len(text) if after is None else after[0]
+        first_line_no = 0 if before is None else before[3] + 1
+        yield first_line_no, text[start:end].split("\n")
+
+
+def reuse_comments(text: str, blocks: List[Tuple[int, int, int, int, bytes]], reused: List[Optional[int]],
+                   old_blocks: List[Tuple[int, int, int, int, bytes]], old_comments: Dict[int, str],
+                   ignore: re.Pattern = None) -> Dict[int, str]:
+    """comments in unchanged blocks (shifted to their new line numbers) & between blocks"""
+    # NOTE: comments in changed blocks are left to the parser
+    # NOTE: other lines between blocks raise RuntimeError, like a full parse; unless they match ignore
+    comments = dict()
+    moved = {old_index: block for block, old_index in zip(blocks, reused) if old_index is not None}
+    old_firsts = [block[2] for block in old_blocks]
+    for line_no, comment in old_comments.items():
+        old_index = bisect.bisect_right(old_firsts, line_no) - 1
+        if old_index in moved and line_no <= old_blocks[old_index][3]:
+            comments[line_no - old_firsts[old_index] + moved[old_index][2]] = comment
+    for first_line_no, lines in gaps(text, blocks):
+        for line_no, kind, payload in tokenise(lines, first_line_no):
+            if kind == "Comment":
+                comments[line_no] = payload
+                continue
+            line = lines[line_no - first_line_no].strip()
+            if ignore is None or ignore.match(line) is None:
+                raise RuntimeError(f"Couldn't parse line #{line_no}: '{line}'")
+    return comments
+
+
+def split_chunks(text: str, num_chunks: int, first_line_no: int = 0) -> List[Tuple[int, str]]:
+    """split text into ~num_chunks (first_line_no, text) chunks between top-level {} blocks"""
+    # NOTE: chunks cover all of text, including lines between blocks
+    # -- so comments, line numbers & errors are the same as a serial parse
+    spans = block_spans(text)
+    target = len(text) / max(num_chunks, 1)
+    chunks = list()
+    start = 0
+    for span_start, span_end in spans:
+        if span_end - start >= target:
+            end = text.find("\n", span_end)
+            end = len(text) if end == -1 else end + 1
+            chunks.append((first_line_no, text[start:end]))
+            first_line_no += text.count("\n", start, end)
+            start = end
+    if start < len(text) or len(chunks) == 0:
+        chunks.append((first_line_no, text[start:]))
+    return chunks
+
+
+def parse_chunk(args: Tuple[type, int, str]) -> Any:
+    """process pool worker; see parse_chunks"""
+    cls, first_line_no, text = args
+    return cls.parse_chunk(io.StringIO(text), first_line_no)
+
+
+def parse_chunks(cls: type, text: str, processes: int = None, first_line_no: int = 0,
+                 chunks_per_process: int = 4) -> List[Any]:
+    """cls.parse_chunk(lines, first_line_no) for chunks of text, across multiple processes"""
+    processes = os.cpu_count() if processes is None else processes
+    chunks = split_chunks(text, processes * chunks_per_process, first_line_no)
+    if processes <= 1 or len(chunks) == 1:
+        return [parse_chunk((cls, line_no, chunk)) for line_no, chunk in chunks]
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(parse_chunk, [
+            (cls, line_no, chunk)
+            for line_no, chunk in chunks]))
+
+
 class TokenClass:
     """helper class for text <-> object conversion"""
     pattern: re.Pattern  # compiled regex w/ groups
@@ -43,6 +298,132 @@ class TokenClass:
     def from_tokens(cls, tokens: List[str]) -> TokenClass:
         raise NotImplementedError()
 
+    @classmethod
+    def from_words(cls, words: List[str]) -> TokenClass:
+        """from whitespace separated tokens (no regex groups)"""
+        raise NotImplementedError()
+
+
+class LazyField:
+    """decodes a LazyBrushSide on first access"""
+    # NOTE: non-data descriptor; decoded values go in the instance __dict__ & shadow it from then on
+    name: str
+
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    def __get__(self, instance: Optional[LazyBrushSide], owner: type) -> Any:
+        if instance is None:
+            return self
+        if instance._text is None:  # built w/ __init__; use the class default
+            return getattr(super(LazyBrushSide, instance), self.name)
+        instance.decode()
+        return instance.__dict__[self.name]
+
+
+class LazyBrushSide:
+    """BrushSide mixin; .from_line() keeps the line & floats are only converted when accessed"""
+    # NOTE: sides w/ unchanged lazy fields are written back w/ their original line (layout & all)
+    # -- changed sides are written from their fields; integral floats don't get a trailing ".0"
+    # NOTE: changes are spotted by identity; assign new objects rather than editing in-place
+    # -- e.g. side.plane = Plane(...), not side.plane.normal.x = ...; like frozen TextureVectors
+    # NOTE: invalid numbers raise ValueError on first access, not while parsing
+    # NOTE: words after the first num_words (e.g. Quake 2 surface flags) are kept, but not decoded
+    _text: Optional[str] = None  # original line
+    _decoded: Optional[tuple] = None  # .snapshot() after .decode(); None if never decoded
+    num_words: int
+    extra_words: Tuple[str, ...] = tuple()
+    text_format: str  # for .from_words(); 1 {} per word
+    eager_words: Dict[str, int] = {"shader": 9}
+    # ^ {attr: word_index}; attrs set by .from_words()
+    lazy_fields = ("plane", "texture_vector", "texture_rotation")
+    # ^ attrs set by .decode(); each needs a LazyField
+    plane = LazyField()
+    texture_vector = LazyField()
+    texture_rotation = LazyField()
+
+    def __setattr__(self, attr: str, value):
+        if attr in self.lazy_fields and not self.is_decoded:
+            self.decode()  # otherwise .verbatim() would write the old value
+        super().__setattr__(attr, value)
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._text is None or self._decoded is not None
+
+    @property
+    def is_verbatim(self) -> bool:
+        """can be written w/ .verbatim()"""
+        if self._text is None:
+            return False
+        if self._decoded is None:
+            return True
+        return all(a is b for a, b in zip(self.snapshot(), self._decoded))
+
+    def decode(self):
+        """convert all lazy fields"""
+        decoded = self.decode_words(self._text.translate(unbracket).split()[:self.num_words])
+        self.__dict__.update({name: getattr(decoded, name) for name in self.lazy_fields})
+        self._decoded = self.snapshot()
+
+    def peek_plane(self) -> Plane:
+        """.plane, w/o decoding the side; undecoded sides build a new Plane each call"""
+        if self.is_decoded:
+            return self.plane
+        return Plane.from_words(self._text.translate(unbracket).split()[:9])  # every format starts w/ 3 points
+
+    def snapshot(self) -> tuple:
+        """lazy fields (& the plane's triangle), for spotting changes"""
+        fields = [self.__dict__[name] for name in self.lazy_fields]
+        return (*fields, getattr(fields[0], "_triangle", None))
+
+    def verbatim(self) -> str:
+        """original line, w/ any changes to .eager_words & .extra_words"""
+        words = self._text.translate(unbracket).split()
+        if all(words[i] == getattr(self, name) for name, i in self.eager_words.items()):
+            if tuple(words[self.num_words:]) == self.extra_words:
+                return self._text
+        # NOTE: only swap out changed words; keeps brackets & spacing
+        parts = word_separator.split(self._text)
+        indices = [i for i in range(0, len(parts), 2) if parts[i] != ""]
+        for name, i in self.eager_words.items():
+            parts[indices[i]] = getattr(self, name)
+        head = "".join(parts[:indices[self.num_words - 1] + 1])
+        return " ".join([head, *self.extra_words])
+
+    @classmethod
+    def from_line(cls, line: str) -> LazyBrushSide:
+        return cls.from_words(line.translate(unbracket).split(), line)
+
+    @classmethod
+    def from_parts(cls, line: str, eager: List[str], extra_words: Tuple[str, ...] = tuple()) -> LazyBrushSide:
+        """like .from_line(), w/o splitting line; eager values in .eager_words order (e.g. from the cache)"""
+        out = cls.__new__(cls)
+        vars(out).update(zip(cls.eager_words, eager), _text=line)
+        if len(extra_words) != 0:
+            out.extra_words = extra_words
+        return out
+
+    @classmethod
+    def from_words(cls, words: List[str], line: str = None) -> LazyBrushSide:
+        """line defaults to the words in .text_format"""
+        if len(words) < cls.num_words:
+            raise ValueError(f"expected {cls.num_words} words, got {len(words)}")
+        out = cls.__new__(cls)
+        for name, i in cls.eager_words.items():
+            setattr(out, name, sys.intern(words[i]))
+        if len(words) > cls.num_words:
+            out.extra_words = tuple(words[cls.num_words:])
+        if line is None:
+            line = " ".join([cls.text_format.format(*words), *out.extra_words])
+        out._text = line
+        return out
+
+    @classmethod
+    def decode_words(cls, words: List[str]) -> LazyBrushSide:
+        """fully decoded side"""
+        raise NotImplementedError()
+
 
 class Plane(physics.Plane, TokenClass):
     pattern = re.compile(plane)
@@ -56,11 +437,18 @@ class Plane(physics.Plane, TokenClass):
             # force use of the loaded values
             # to avoid accuracy drift on re-save
             # due to floating point rounding errors
-        return " ".join(map(str, [Point(*A), Point(*B), Point(*C)]))
+        # NOTE: same as str(Point), w/o building Points
+        return " ".join(
+            "({} {} {})".format(*map(fstr, point))
+            for point in (A, B, C))
 
     @classmethod
     def from_tokens(cls, tokens: List[str]) -> Plane:
-        Ax, Ay, Az, Bx, By, Bz, Cx, Cy, Cz = map(float, tokens[::3])
+        return cls.from_words(tokens[::3])
+
+    @classmethod
+    def from_words(cls, words: List[str]) -> Plane:
+        Ax, Ay, Az, Bx, By, Bz, Cx, Cy, Cz = map(float, words)
         A = vector.vec3(Ax, Ay, Az)
         B = vector.vec3(Bx, By, Bz)
         C = vector.vec3(Cx, Cy, Cz)
@@ -1,84 +1,230 @@
 # https://quakewiki.org/wiki/Quake_Map_Format
 from __future__ import annotations
 import re
-from typing import List
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from .. import texture
 from .. import base
+from .. import cache
+from .. import stats
 from . import common
 
 import breki
+from breki.files.parsed import parse_first
 
 
-class BrushSide(base.BrushSide, common.TokenClass):
+class BrushSide(common.LazyBrushSide, base.BrushSide, common.TokenClass):
+    ProjectionAxisClass = texture.ProjectionAxis
     pattern = re.compile(" ".join([
         common.plane, common.filepath, *(common.double,)*5]))
+    num_words = 15
+    text_format = " ".join(["({} {} {})"] * 3 + ["{}"] * 6)
 
     def __str__(self) -> str:
-        return " ".join(map(str, [
-            self.plane,
+        if self.is_verbatim:
+            return self.verbatim()
+        return " ".join([
+            str(self.plane),
             self.shader,
-            self.texture_vector.s.offset,
-            self.texture_vector.t.offset,
-            self.texture_rotation,
-            self.texture_vector.s.scale,
-            self.texture_vector.t.scale]))
+            *map(common.nstr, [
+                self.texture_vector.s.offset,
+                self.texture_vector.t.offset,
+                self.texture_rotation,
+                self.texture_vector.s.scale,
+                self.texture_vector.t.scale]),
+            *self.extra_words])
 
     @classmethod
     def from_tokens(cls, tokens: List[str]) -> BrushSide:
-        plane = common.Plane.from_tokens(tokens[:27])
-        shader = tokens[27]
-        s_offset, t_offset, rotation, s_scale, t_scale = map(float, tokens[28::3])
-        texture_vector = texture.TextureVector.from_normal(plane.normal)
-        texture_vector.s.offset = s_offset
-        texture_vector.t.offset = t_offset
-        texture_vector.s.scale = s_scale
-        texture_vector.t.scale = t_scale
-        return cls(plane, shader, texture_vector, rotation)
+        return cls.from_words([*tokens[:27:3], tokens[27], *tokens[28::3]])
+
+    @classmethod
+    def decode_words(cls, words: List[str]) -> BrushSide:
+        plane = common.Plane.from_words(words[:9])
+        shader = sys.intern(words[9])
+        s_offset, t_offset, rotation, s_scale, t_scale = map(float, words[10:])
+        s_axis, t_axis = texture.default_axes[texture.default_axis(plane.normal)]
+        texture_vector = texture.TextureVector(
+            cls.ProjectionAxisClass(s_axis, s_offset, s_scale),
+            cls.ProjectionAxisClass(t_axis, t_offset, t_scale))
+        return cls(plane, shader, texture.intern(texture_vector), rotation)
 
 
 class QuakeMap(base.MapFile, breki.TextFile):
+    """also the base for other Quake-family .map formats (e.g. Valve220Map & CoD4Map)"""
     exts = ["*.map"]
     BrushSideClass = BrushSide
+    header: Optional[str] = None
+    # ^ first line of the file (e.g. "iwmap 4"); line numbers start after it
+    ignore: Optional[re.Pattern] = None
+    # ^ matches lines the parser should skip (e.g. CoD4 layer flags)
+
+    @parse_first
+    def iter_lines(self) -> Iterator[str]:
+        if self.header is not None:
+            yield self.header
+        yield from super().iter_lines()
+
+    def rewind(self):
+        """seek .stream to the line after .header"""
+        self.stream.seek(0)
+        if self.header is not None:
+            assert self.stream.readline().rstrip() == self.header
+
+    def split_header(self, text: str) -> str:
+        """text after .header"""
+        if self.header is None:
+            return text
+        header, _, text = text.partition("\n")
+        assert header.rstrip() == self.header
+        return text
 
     def parse(self):
         if self.is_parsed:
             return
         self.is_parsed = True
-        # regex patterns
-        patterns = {
-            "BrushSide": self.BrushSideClass.pattern,
-            "Comment": re.compile(common.comment),
-            "KeyValuePair": re.compile(common.key_value_pair)}
-        # parse lines
+        with stats.recording(self, "parse") as record:
+            with stats.phase(record, "cache_load"):
+                loaded = cache.load(self)
+            if loaded:
+                return
+            if record is None:
+                self.rewind()  # .iter_entities() may have moved it
+                lines = self.stream
+            else:
+                self.stream.seek(0)
+                lines = self.split_header(record.read(self.stream.read)).split("\n")
+            self.entities, self.comments = self.parse_chunk(lines, 0, record)
+            with stats.phase(record, "cache_save"):
+                cache.save(self)
+
+    def parse_parallel(self, processes: int = None):
+        """parse top-level entities across multiple processes"""
+        if self.is_parsed:
+            return
+        self.is_parsed = True
+        with stats.recording(self, "parse_parallel") as record:
+            with stats.phase(record, "cache_load"):
+                loaded = cache.load(self)
+            if loaded:
+                return
+            self.stream.seek(0)
+            text = self.split_header(stats.read(record, self.stream.read))
+            self.entities, self.comments = list(), dict()
+            with stats.phase(record, "workers"):
+                for entities, comments in common.parse_chunks(self.__class__, text, processes):
+                    self.entities.extend(entities)
+                    self.comments.update(comments)
+            with stats.phase(record, "cache_save"):
+                cache.save(self)
+
+    def parse_entities(self):
+        """parse key-values only; brushes are skipped & can be decoded later w/ .load_brushes()"""
+        if self.is_parsed:
+            return
+        self.is_parsed = True
+        with stats.recording(self, "parse_entities") as record, stats.phase(record, "scan"):
+            self.rewind()
+            for key_values, brush_spans in common.scan_entities(self.stream, 0, self.comments, self.ignore):
+                entity = base.Entity()
+                for key, value in key_values:
+                    entity[key] = value
+                self.brush_spans[entity] = brush_spans
+                self.entities.append(entity)
+
+    def reparse(self):
+        """re-read the file & only parse entities whose text changed since the last .reparse()"""
+        # NOTE: unchanged entities keep their identity; the first call parses every entity
+        # -- .parse() doesn't hash blocks (it'd slow every parse), so use .reparse() for the first load too
+        with stats.recording(self, "reparse") as record:
+            text = self.split_header(stats.read(record, self.reread))
+            with stats.phase(record, "hash"):
+                blocks = common.hash_blocks(text)
+                reused = common.reuse_blocks(self.block_hashes, blocks)
+                comments = common.reuse_comments(
+                    text, blocks, reused, self.block_hashes, self.comments, self.ignore)
+            entities = list()
+            with stats.phase(record, "tokenise"):
+                for (start, end, first_line_no, _, _), old_index in zip(blocks, reused):
+                    if old_index is not None:
+                        entities.append(self.block_items[old_index])
+                    else:
+                        lines = text[start:end].split("\n")
+                        entity, = self.iter_chunk(lines, first_line_no, comments, record)
+                        entities.append(entity)
+            self.block_hashes, self.block_items = blocks, entities
+            self.entities = entities
+            self.comments = dict(sorted(comments.items()))
+            self.brush_spans = dict()
+            self.is_parsed = True
+
+    def load_brushes(self, entities: Iterable[base.Entity] = None):
+        """decode brushes skipped by .parse_entities(); defaults to all entities"""
+        entities = list(self.brush_spans if entities is None else entities)
+        spans = sorted(
+            (first, last, i)
+            for i, entity in enumerate(entities)
+            for first, last in self.brush_spans.pop(entity, list()))
+        self.rewind()
+        for i, first_line_no, lines in common.read_spans(self.stream, spans):
+            loaded, = self.iter_chunk(["{", *lines, "}"], first_line_no - 1)
+            entities[i].brushes.extend(loaded.brushes)
+
+    def iter_entities(self) -> Iterator[base.Entity]:
+        """yield each entity as soon as it is parsed, w/o storing it"""
+        if self.is_parsed:
+            yield from self.entities
+            return
+        self.rewind()
+        yield from self.iter_chunk(self.stream, 0)
+
+    @classmethod
+    def parse_chunk(cls, lines: Iterable[str], first_line_no: int = 0,
+                    record: stats.ParseStats = None) -> Tuple[List[base.Entity], Dict[int, str]]:
+        """parse lines (after .header) -> (entities, comments)"""
+        comments = dict()
+        with stats.phase(record, "tokenise"):
+            entities = list(cls.iter_chunk(lines, first_line_no, comments, record))
+        return entities, comments
+
+    @classmethod
+    def iter_chunk(cls, lines: Iterable[str], first_line_no: int = 0, comments: Dict[int, str] = None,
+                   record: stats.ParseStats = None) -> Iterator[base.Entity]:
+        """parse lines, yielding each entity once it's closing brace is read"""
+        comments = dict() if comments is None else comments
+        from_line = cls.BrushSideClass.from_line
+        if record is not None:
+            from_line = record.timed("brush_sides", from_line)
         node_depth = 0
-        for line_no, line in enumerate(self.stream):
-            line = line.strip()
-            if line == "":
-                continue  # MRVN-Radiant
-            elif patterns["Comment"].match(line) is not None:
-                # NOTE: only catches full line comments
-                # TODO: catch trailing comments
-                self.comments[line_no] = line
-            elif line.strip() == "{":
+        for line_no, kind, payload in common.tokenise(lines, first_line_no):
+            if kind == "{":
                 node_depth += 1
                 if node_depth == 1:
                     entity = base.Entity()
-                    self.entities.append(entity)
                 elif node_depth == 2:
                     brush = base.Brush()
                     entity.brushes.append(brush)
                 else:
                     raise NotImplementedError()
-            elif line.strip() == "}":
+            elif kind == "}":
                 node_depth -= 1
-            elif patterns["KeyValuePair"].match(line) is not None:
+                if node_depth == 0:
+                    yield entity
+            elif kind == "KeyValuePair":
                 assert node_depth == 1, "keyvalues outside of entity"
-                key, value = patterns["KeyValuePair"].match(line).groups()
+                key, value = payload
                 entity[key] = value
-            elif patterns["BrushSide"].match(line) is not None:
+            elif kind == "BrushSide":
                 assert node_depth == 2, "brushside outside of brush"
-                brush.sides.append(self.BrushSideClass.from_string(line))
+                try:
+                    brush.sides.append(from_line(payload))
+                except ValueError:
+                    raise RuntimeError(f"Couldn't parse line #{line_no}: '{payload}'")
+            elif kind == "Comment":
+                comments[line_no] = payload
+            elif cls.ignore is not None and cls.ignore.match(payload) is not None:
+                pass
             else:
-                raise RuntimeError(f"Couldn't parse line #{line_no}: '{line}'")
+                raise RuntimeError(f"Couldn't parse line #{line_no}: '{payload}'")
         assert node_depth == 0, f"file ends prematurely at line {line_no}"
@@ -2,14 +2,19 @@
 # NOTE: might need to use Wayback Machine (web.archive.org)
 from __future__ import annotations
 import re
+import sys
 from typing import List
 
 from .. import texture
 from .. import base
 from . import common
+from . import id_software
 
 from ass import vector
-import breki
+
+
+flags = re.compile(r'"[A-Za-z0-9_ ]+"\s+flags(\s+active)?')
+# ^ layer lines, e.g. '"The Map" flags'; ignored
 
 
 # TODO: Curves & other non-brush geo
@@ -40,7 +45,7 @@ class Projection(common.TokenClass):
         return hash((self.width, self.height, *self.unknown))
 
     def __str__(self) -> str:
-        return " ".join(map(str, [self.width, self.height, *self.unknown]))
+        return " ".join([str(self.width), str(self.height), *map(common.nstr, self.unknown)])
 
     def as_texture_vector(self) -> texture.TextureVector:
         raise NotImplementedError()
@@ -54,31 +59,52 @@ class Projection(common.TokenClass):
 
     @classmethod
     def from_tokens(cls, tokens: List[str]) -> Projection:
-        width, height = map(int, tokens[:2])
-        unknown = map(float, tokens[2::3])
+        return cls.from_words([*tokens[:2], *tokens[2::3]])
+
+    @classmethod
+    def from_words(cls, words: List[str]) -> Projection:
+        width, height = map(int, words[:2])
+        unknown = map(float, words[2:])
         return cls(width, height, *unknown)
 
 
-class BrushSide(base.BrushSide, common.TokenClass):
+class BrushSide(common.LazyBrushSide, base.BrushSide, common.TokenClass):
     pattern = re.compile(" ".join([
         common.plane, common.filepath,
         *(common.integer,)*2, *(common.double,)*4,  # shader projection
         common.filepath,
         *(common.integer,)*2, *(common.double,)*4]))  # lightmap projection
+    num_words = 23
+    text_format = " ".join(["({} {} {})"] * 3 + ["{}"] * 14)
+    eager_words = {"shader": 9, "lightmap": 16}
+    lazy_fields = (*common.LazyBrushSide.lazy_fields, "shader_projection", "lightmap_projection")
+    shader_projection = common.LazyField()
+    lightmap_projection = common.LazyField()
 
     def __str__(self) -> str:
+        if self.is_verbatim:
+            return self.verbatim()
         return " ".join(map(str, [
             self.plane,
             self.shader, self.shader_projection,
-            self.lightmap, self.lightmap_projection]))
+            self.lightmap, self.lightmap_projection,
+            *self.extra_words]))
 
     @classmethod
     def from_tokens(cls, tokens: List[str]) -> BrushSide:
-        plane = common.Plane.from_tokens(tokens[:27])
-        shader = tokens[27]
-        shader_projection = Projection.from_tokens(tokens[28:][:14])
-        lightmap = tokens[42]
-        lightmap_projection = Projection.from_tokens(tokens[43:][:14])
+        return cls.from_words([
+            *tokens[:27:3], tokens[27],
+            *tokens[28:30], *tokens[30:42:3],  # shader projection
+            tokens[42],
+            *tokens[43:45], *tokens[45::3]])  # lightmap projection
+
+    @classmethod
+    def decode_words(cls, words: List[str]) -> BrushSide:
+        plane = common.Plane.from_words(words[:9])
+        shader = sys.intern(words[9])
+        shader_projection = Projection.from_words(words[10:16])
+        lightmap = sys.intern(words[16])
+        lightmap_projection = Projection.from_words(words[17:])
         out = cls(plane, shader)
         out.lightmap = lightmap
         out.shader_projection = shader_projection
@@ -89,49 +115,7 @@ class BrushSide(base.BrushSide, common.TokenClass):
         return out
 
 
-class CoD4Map(base.MapFile, breki.TextFile):
-    exts = ["*.map"]
-
-    def parse(self):
-        if self.is_parsed:
-            return
-        self.is_parsed = True
-        # regex patterns
-        patterns = {
-            "BrushSide": BrushSide.pattern,
-            "Comment": re.compile(common.comment),
-            "KeyValuePair": re.compile(common.key_value_pair),
-            "Flags": re.compile(r'"[A-Za-z0-9_ ]+"\s+flags(\s+active)?')}
-        # parse lines
-        node_depth = 0
-        assert self.stream.readline().rstrip() == "iwmap 4"
-        for line_no, line in enumerate(self.stream):
-            line = line.strip()
-            if patterns["Comment"].match(line) is not None:
-                # NOTE: only catches full line comments
-                # TODO: catch trailing comments
-                self.comments[line_no] = line
-            elif patterns["Flags"].match(line) is not None:
-                pass  # ignore
-            elif line.strip() == "{":
-                node_depth += 1
-                if node_depth == 1:
-                    entity = base.Entity()
-                    self.entities.append(entity)
-                elif node_depth == 2:
-                    brush = base.Brush()
-                    entity.brushes.append(brush)
-                else:
-                    raise NotImplementedError()
-            elif line.strip() == "}":
-                node_depth -= 1
-            elif patterns["KeyValuePair"].match(line) is not None:
-                assert node_depth == 1, "keyvalues outside of entity"
-                key, value = patterns["KeyValuePair"].match(line).groups()
-                entity[key] = value
-            elif patterns["BrushSide"].match(line) is not None:
-                assert node_depth == 2, "brushside outside of brush"
-                brush.sides.append(BrushSide.from_string(line))
-            else:
-                raise RuntimeError(f"Couldn't parse line #{line_no}: '{line}'")
-        assert node_depth == 0, f"stream ends prematurely at line {line_no}"
+class CoD4Map(id_software.QuakeMap):
+    BrushSideClass = BrushSide
+    header = "iwmap 4"
+    ignore = flags
@@ -1,6 +1,7 @@
 # https://quakewiki.org/wiki/Quake_Map_Format#Valve_variation_of_the_format
 from __future__ import annotations
 import re
+import sys
 from typing import List
 
 from ... import texture
@@ -21,35 +22,51 @@ class ProjectionAxis(texture.ProjectionAxis, common.TokenClass):
 
     @classmethod
     def from_tokens(cls, tokens: List[str]) -> ProjectionAxis:
-        x, y, z, offset = map(float, tokens[::3])
+        return cls.from_words(tokens[::3])
+
+    @classmethod
+    def from_words(cls, words: List[str]) -> ProjectionAxis:
+        x, y, z, offset = map(float, words)
         return cls((x, y, z), offset)
 
 
-class BrushSide(base.BrushSide, common.TokenClass):
+class BrushSide(common.LazyBrushSide, base.BrushSide, common.TokenClass):
+    ProjectionAxisClass = ProjectionAxis
     pattern = re.compile(" ".join([
         common.plane, common.filepath,
         *(r"\[", *(common.double,)*4, r"\]",)*2,
         *(common.double,)*3]))
+    num_words = 21
+    text_format = " ".join(["({} {} {})"] * 3 + ["{}"] + ["[ {} {} {} {} ]"] * 2 + ["{}"] * 3)
 
     def __str__(self) -> str:
-        return " ".join(map(str, [
-            self.plane, self.shader,
-            self.texture_vector.s,
-            self.texture_vector.t,
-            self.rotation,
-            self.texture_vector.s.scale,
-            self.texture_vector.t.scale]))
+        if self.is_verbatim:
+            return self.verbatim()
+        return " ".join([
+            str(self.plane), self.shader,
+            str(self.texture_vector.s),
+            str(self.texture_vector.t),
+            *map(common.nstr, [
+                self.texture_rotation,
+                self.texture_vector.s.scale,
+                self.texture_vector.t.scale]),
+            *self.extra_words])
 
     @classmethod
     def from_tokens(cls, tokens: List[str]) -> BrushSide:
-        plane = common.Plane.from_tokens(tokens[:27])
-        shader = tokens[27]
-        s_axis = ProjectionAxis.from_tokens(tokens[28:][:12])
-        t_axis = ProjectionAxis.from_tokens(tokens[40:][:12])
-        rotation = float(tokens[52])
-        s_axis.scale, t_axis.scale = map(float, tokens[55::3])
+        return cls.from_words([
+            *tokens[:27:3], tokens[27], *tokens[28:52:3], *tokens[52::3]])
+
+    @classmethod
+    def decode_words(cls, words: List[str]) -> BrushSide:
+        plane = common.Plane.from_words(words[:9])
+        shader = sys.intern(words[9])
+        s_axis = cls.ProjectionAxisClass.from_words(words[10:14])
+        t_axis = cls.ProjectionAxisClass.from_words(words[14:18])
+        rotation, s_scale, t_scale = map(float, words[18:])
+        s_axis.scale, t_axis.scale = s_scale, t_scale
         texture_vector = texture.TextureVector(s_axis, t_axis)
-        return cls(plane, shader, texture_vector, rotation)
+        return cls(plane, shader, texture.intern(texture_vector), rotation)
 
 
 class Valve220Map(id_software.QuakeMap):
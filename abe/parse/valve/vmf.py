@@ -1,13 +1,17 @@
 from __future__ import annotations
 import re
-from typing import Dict, List
+import sys
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 from ... import texture
 from ... import base
+from ... import cache
+from ... import stats
 from .. import common
 from . import map220
 
 import breki
+from breki.files.parsed import parse_first
 
 
 # TODO: Entity connections (Entity IO)
@@ -18,30 +22,73 @@ import breki
 # TODO: visgroup filtering to find ents etc.
 
 
-class BrushSide(base.BrushSide):
+class ProjectionAxis(map220.ProjectionAxis):
+    pattern = re.compile("".join([
+        r"\[", " ".join([common.double] * 4), r"\] ", common.double]))
+
+    def __init__(self, axis, offset=None, scale=None):
+        scale = 0.25 if scale is None else scale
+        super().__init__(axis, offset, scale)
+
+    def __str__(self) -> str:
+        axis = [common.fstr(a) for a in self.axis]
+        offset = common.fstr(self.offset)
+        scale = common.fstr(self.scale)
+        return "".join(["[", " ".join([*axis, offset]), "] ", scale])
+
+    @classmethod
+    def from_tokens(cls, tokens: List[str]) -> ProjectionAxis:
+        return cls.from_words(tokens[::3])
+
+    @classmethod
+    def from_words(cls, words: List[str]) -> ProjectionAxis:
+        x, y, z, offset, scale = map(float, words)
+        return cls((x, y, z), offset, scale)
+
+
+class BrushSide(common.LazyBrushSide, base.BrushSide):
+    """lazy, like .map sides; the text is the node's values joined w/ tabs"""
+    ProjectionAxisClass = ProjectionAxis
+    node_keys = ("plane", "material", "uaxis", "vaxis", "rotation")
+    num_words = 21
+    text_format = "\t".join(["({} {} {}) ({} {} {}) ({} {} {})", "{}", *["[{} {} {} {}] {}"] * 2, "{}"])
+
+    def __str__(self) -> str:
+        if self.is_verbatim:
+            return self.verbatim()
+        return "\t".join(str(value) for key, value in self.as_node().key_values)
+
     def as_node(self) -> Node:
         out = Node("side")
+        if isinstance(self, BrushSide) and self.is_verbatim:  # also called on other formats' sides
+            out.key_values.extend(zip(self.node_keys, self.verbatim().split("\t")))
+            return out
+        rotation = self.texture_rotation
+        if not isinstance(rotation, str):  # parsed .vmf rotations are kept as strings
+            rotation = common.nstr(rotation)
         out.update({
             "plane": common.Plane.from_triangle(*self.plane.as_triangle()),
             "material": self.shader,
             **{f"{axis}axis": ProjectionAxis(*projection)
                for axis, projection in zip("uv", self.texture_vector)},
-            "rotation": self.texture_rotation})
+            "rotation": rotation})
         # TODO: dispinfo child node
         return out
 
     @classmethod
     def from_node(cls, node: Node) -> BrushSide:
         assert node.node_type == "side"
-        plane = common.Plane.from_string(node["plane"])
-        shader = node["material"]
-        uaxis, vaxis = [
-            ProjectionAxis.from_string(node[f"{axis}axis"])
-            for axis in "uv"]
-        texture_vector = texture.TextureVector(uaxis, vaxis)
-        rotation = node["rotation"]
-        # TODO: node.nodes_by_type().get("dispinfo", [])
-        return cls(plane, shader, texture_vector, rotation)
+        # TODO: node.first_of_type("dispinfo")
+        return cls.from_line("\t".join(node[key] for key in cls.node_keys))
+
+    @classmethod
+    def decode_words(cls, words: List[str]) -> BrushSide:
+        plane = common.Plane.from_words(words[:9])
+        shader = sys.intern(words[9])
+        uaxis = cls.ProjectionAxisClass.from_words(words[10:15])
+        vaxis = cls.ProjectionAxisClass.from_words(words[15:20])
+        texture_vector = texture.intern(texture.TextureVector(uaxis, vaxis))
+        return cls(plane, shader, texture_vector, words[20])
 
 
 class Brush(base.Brush):
@@ -58,15 +105,16 @@ class Brush(base.Brush):
         assert node.node_type == "solid"
         return cls([
             BrushSide.from_node(node)
-            for node in node.nodes_by_type().get("side", [])])
+            for node in node.iter_type("side")])
 
 
 class Entity(base.Entity):
+    __slots__ = ()
     # TODO: Connections (Entity IO)
 
     def as_node(self) -> Node:
         out = Node("entity")
-        out.key_values = [(key, self[key]) for key in self._keys]
+        out.key_values = self.items()
         out.nodes = [
             Brush.as_node(brush)
             for brush in self.brushes]
@@ -78,32 +126,123 @@ class Entity(base.Entity):
         out = cls(**dict(node.key_values))
         out.brushes = [
             Brush.from_node(node)
-            for node in node.nodes_by_type().get("solid", [])]
+            for node in node.iter_type("solid")]
         return out
 
 
 # TODO: class DispInfo(base.DispInfo):
 
 
-class Node:
+class KeyValues(base.IndexedList):
+    """[(key, value)] w/ an index of the last occurence of each key"""
+    _index: Dict[str, int]  # {key: last_index}
+
+    def __setitem__(self, index, entry: (str, str)):
+        if isinstance(index, int) and self._index is not None:
+            if self[index][0] == entry[0]:  # same key, same index
+                list.__setitem__(self, index, entry)
+                return
+        super().__setitem__(index, entry)
+
+    def find(self, key: str) -> int:
+        """index of the last occurence of key; -1 if not found"""
+        return self.index_.get(key, -1)
+
+    def _add_to_index(self, index: int):
+        self._index[self[index][0]] = index
+
+    def _build_index(self):
+        self._index = {
+            key: index
+            for index, (key, value) in enumerate(self)}
+
+
+class Nodes(base.IndexedList):
+    """[Node] w/ an index of nodes by node_type"""
+    _index: Dict[str, List[Node]]  # {node_type: [node]}
+    # NOTE: changing the node_type of a child node will not update the index
+
+    def pop(self, index: int = -1) -> Node:
+        node = list.pop(self, index)
+        if self._index is not None:
+            self._remove_from_index(node)
+        return node
+
+    def remove(self, node: Node):
+        list.remove(self, node)
+        if self._index is not None:
+            self._remove_from_index(node)
+
+    def by_type(self, node_type: str) -> List[Node]:
+        return self.index_.get(node_type, list())
+
+    def _add_to_index(self, index: int):
+        node = self[index]
+        self._index.setdefault(node.node_type, list()).append(node)
+
+    def _build_index(self):
+        self._index = dict()
+        for node in self:
+            self._index.setdefault(node.node_type, list()).append(node)
+
+    def _remove_from_index(self, node: Node):
+        nodes = self._index[node.node_type]
+        nodes.remove(node)  # NOTE: nodes are compared by id
+        if len(nodes) == 0:
+            self._index.pop(node.node_type)
+
+
+class NodeParent:
+    """child node handlers for Node & Vmf"""
+    nodes: Nodes  # List[Node]
+
+    @property
+    def nodes(self) -> Nodes:
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes: List[Node]):
+        if not isinstance(nodes, Nodes):
+            nodes = Nodes(nodes)
+        self._nodes = nodes
+
+    def first_of_type(self, node_type: str, default=None) -> Node:
+        nodes = self.nodes.by_type(node_type)
+        return nodes[0] if len(nodes) > 0 else default
+
+    def iter_type(self, node_type: str) -> Iterator[Node]:
+        return iter(self.nodes.by_type(node_type))
+
+    def nodes_by_type(self) -> Dict[str, List[Node]]:
+        # NOTE: lists are shared w/ the index, do not edit them
+        return {
+            type_: nodes
+            for type_, nodes in sorted(self.nodes.index_.items())}
+
+
+class Node(NodeParent):
     node_type: str
-    key_values: List[(str, str)]
+    key_values: KeyValues  # List[(str, str)]
     # NOTE: like a dict, but keys can appear more than once
     # -- add new entries w/ .append((key, value)) [.extend is also valid]
     # -- dict(key_values) will use the last occurence of each key
+    # -- single key lookups & overrides use the last occurence too
     nodes: List[Node]
 
     def __init__(self, node_type: str):
         self.node_type = node_type
-        self.key_values = list()
-        self.nodes = list()
+        self.key_values = KeyValues()
+        self.nodes = Nodes()
 
     def __delitem__(self, key: str):
         index = self.key_values.index((key, self[key]))
         self.key_values.pop(index)
 
     def __getitem__(self, key: str) -> str:
-        return dict(self.key_values)[key]
+        index = self.key_values.find(key)
+        if index == -1:
+            raise KeyError(key)
+        return self.key_values[index][1]
 
     def __repr__(self) -> str:
         return "\n".join([
@@ -116,29 +255,44 @@ class Node:
             "}"])
 
     def __setitem__(self, key: str, value: str):
-        try:  # override
-            index = self.key_values.index((key, self[key]))
+        index = self.key_values.find(key)
+        if index != -1:  # override
             self.key_values[index] = (key, value)
-        except KeyError:
+        else:
             self.key_values.append((key, value))
 
     def __str__(self) -> str:
+        return "\n".join(self.iter_lines())
+
+    def iter_lines(self) -> Iterator[str]:
         # NOTE: key values are not sanitised
         # -- double quotes & curly braces will break
         # NOTE: child nodes will not be indented
-        return "\n".join([
-            self.node_type,
-            "{",
-            *[
-                f'\t"{key}" "{value}"'
-                for key, value in self.key_values],
-            *map(str, self.nodes),
-            "}"])
+        yield self.node_type
+        yield "{"
+        for key, value in self.key_values:
+            yield f'\t"{key}" "{value}"'
+        for node in self.nodes:
+            yield from node.iter_lines()
+        yield "}"
+
+    @property
+    def key_values(self) -> KeyValues:
+        return self._key_values
+
+    @key_values.setter
+    def key_values(self, entries: List[(str, str)]):
+        if not isinstance(entries, KeyValues):
+            entries = KeyValues(entries)
+        self._key_values = entries
 
     # KEY VALUE HANDLERS
 
     def get(self, key: str, default=None) -> str:
-        return dict(self.key_values).get(key, default)
+        index = self.key_values.find(key)
+        if index == -1:
+            return default
+        return self.key_values[index][1]
 
     def get_all(self, key: str) -> List[str]:
         return [
@@ -159,109 +313,228 @@ class Node:
     def values(self) -> List[str]:
         return [value for key, value in self.key_values]
 
-    # CHILD NODE HANDLERS
-
-    def nodes_by_type(self) -> Dict[str, List[Node]]:
-        return {
-            type_: [
-                node
-                for node in self.nodes
-                if node.node_type == type_]
-            for type_ in sorted(set(
-                node.node_type
-                for node in self.nodes))}
-
-
-class ProjectionAxis(map220.ProjectionAxis):
-    pattern = re.compile("".join([
-        r"\[", " ".join([common.double] * 4), r"\] ", common.double]))
-
-    def __init__(self, axis, offset=None, scale=None):
-        scale = 0.25 if scale is None else scale
-        super().__init__(axis, offset, scale)
 
-    def __str__(self) -> str:
-        axis = [common.fstr(a) for a in self.axis]
-        offset = common.fstr(self.offset)
-        scale = common.fstr(self.scale)
-        return "".join(["[", " ".join([*axis, offset]), "] ", scale])
-
-    @classmethod
-    def from_tokens(cls, tokens: List[str]) -> ProjectionAxis:
-        x, y, z, offset, scale = map(float, tokens[::3])
-        return cls((x, y, z), offset, scale)
-
-
-class Vmf(base.MapFile, breki.TextFile):
+class Vmf(NodeParent, base.MapFile, breki.TextFile):
     exts = ["*.vmf"]
+    BrushSideClass = BrushSide
+    EntityClass = Entity
+    NodeClass = Node
     nodes: List[Node]
 
     def __init__(self, filepath: str, archive=None, code_page=None):
         super().__init__(filepath, archive, code_page)
-        self.nodes = list()
+        self.nodes = Nodes()
 
+    @parse_first
     def as_lines(self) -> List[str]:
+        if len(self.brush_spans) != 0:
+            self.load_brushes()
         self.rebuild_nodes()
-        return list(map(str, self.nodes))
-
-    def nodes_by_type(self) -> Dict[str, List[Node]]:
-        return {
-            type_: [
-                node
-                for node in self.nodes
-                if node.node_type == type_]
-            for type_ in sorted(set(
-                node.node_type
-                for node in self.nodes))}
+        return [
+            line
+            for node in self.nodes
+            for line in node.iter_lines()]
+
+    @parse_first
+    def iter_lines(self) -> Iterator[str]:
+        """like .as_lines(), but entity nodes are built one at a time & .nodes is left as-is"""
+        if len(self.brush_spans) != 0:
+            self.load_brushes()
+        for node in self.iter_rebuilt_nodes():
+            yield from node.iter_lines()
 
     def parse(self):
         if self.is_parsed:
             return
         self.is_parsed = True
-        # regex patters
-        patterns = {
-            "KeyValuePair": re.compile(common.key_value_pair),
-            "NodeType": re.compile(r"[a-z_]+")}
-
-        def parent() -> Node:
-            parent_node = self
-            for i in range(node_depth):
-                parent_node = parent_node.nodes[-1]
-            return parent_node
-
-        # parse lines
-        node_depth = 0
+        with stats.recording(self, "parse") as record:
+            with stats.phase(record, "cache_load"):
+                loaded = cache.load(self)
+            if loaded:
+                return
+            self.stream.seek(0)  # .iter_entities() may have moved it
+            lines = self.stream if record is None else record.read(self.stream.read).split("\n")
+            self.nodes, entities = self.parse_chunk(lines, 0, record)
+            with stats.phase(record, "entities"):
+                self.entities = self.sort_entities(self.nodes, entities)
+            with stats.phase(record, "cache_save"):
+                cache.save(self)
+
+    def parse_parallel(self, processes: int = None):
+        """parse top-level nodes across multiple processes"""
+        if self.is_parsed:
+            return
+        self.is_parsed = True
+        with stats.recording(self, "parse_parallel") as record:
+            with stats.phase(record, "cache_load"):
+                loaded = cache.load(self)
+            if loaded:
+                return
+            self.stream.seek(0)
+            text = stats.read(record, self.stream.read)
+            self.nodes = Nodes()
+            entities = list()
+            with stats.phase(record, "workers"):
+                for nodes, chunk_entities in common.parse_chunks(self.__class__, text, processes):
+                    self.nodes.extend(nodes)
+                    entities.extend(chunk_entities)
+            with stats.phase(record, "entities"):
+                self.entities = self.sort_entities(self.nodes, entities)
+            with stats.phase(record, "cache_save"):
+                cache.save(self)
+
+    def iter_entities(self) -> Iterator[Entity]:
+        """yield each entity as soon as it is parsed, w/o storing it"""
+        # NOTE: yields in file order; .entities always puts worldspawn first
+        if self.is_parsed:
+            yield from self.entities
+            return
+        self.stream.seek(0)
+        for node in self.iter_nodes(self.stream):
+            if node.node_type in ("world", "entity"):
+                yield Entity.from_node(node)
+
+    @classmethod
+    def parse_chunk(cls, lines: Iterable[str], first_line_no: int = 0,
+                    record: stats.ParseStats = None) -> Tuple[Nodes, List[Entity]]:
+        """parse lines -> (top-level nodes, [Entity or None for each node])"""
+        with stats.phase(record, "tokenise"):
+            nodes = Nodes(cls.iter_nodes(lines, first_line_no))
+        with stats.phase(record, "entities"):
+            entities = [
+                Entity.from_node(node) if node.node_type in ("world", "entity") else None
+                for node in nodes]
+        return nodes, entities
+
+    @classmethod
+    def iter_nodes(cls, lines: Iterable[str], first_line_no: int = 0,
+                   skipped: List[Tuple[int, int]] = None) -> Iterator[Node]:
+        """parse lines, yielding each top-level node once it's closing brace is read"""
+        # NOTE: if skipped is a list, "solid" nodes of top-level nodes are skipped
+        # -- (first_line_no, last_line_no) of each is appended to skipped instead
+        stack = list()  # open nodes
         node_type = None
-        for line_no, line in enumerate(self.stream):
+        node_type_line_no = None
+        numbered = enumerate(lines, first_line_no)
+        for line_no, line in numbered:
             line = line.strip()  # ignore indentation & trailing newline
-            # TODO: assert each open curly brace is preceded by a nodetype
-            if patterns["NodeType"].match(line) is not None:
-                node_type = line
+            if line == "":
+                continue
+            first = line[0]
+            if first == '"':
+                key_value = common.split_key_value(line)
+                if key_value is None or len(stack) == 0:
+                    raise RuntimeError(f"Couldn't parse line #{line_no}: '{line}'")
+                stack[-1].key_values.append(key_value)
             elif line == "{":
+                if skipped is not None and len(stack) == 1 and node_type == "solid":
+                    depth = 1  # skip by counting braces
+                    for line_no, line in numbered:
+                        line = line.strip()
+                        if line == "{":
+                            depth += 1
+                        elif line == "}":
+                            depth -= 1
+                            if depth == 0:
+                                break
+                    assert depth == 0, f"file ends prematurely at line {line_no}"
+                    skipped.append((node_type_line_no, line_no))
+                    continue
+                # TODO: assert each open curly brace is preceded by a nodetype
                 node = Node(node_type)
-                parent().nodes.append(node)
-                node_depth += 1
-            elif patterns["KeyValuePair"].match(line) is not None:
-                key, value = patterns["KeyValuePair"].match(line).groups()
-                node.key_values.append((key, value))
+                if len(stack) > 0:
+                    stack[-1].nodes.append(node)
+                stack.append(node)
             elif line == "}":
-                node_depth -= 1
-                node = parent()
+                assert len(stack) > 0, f"unexpected closing brace on line #{line_no}"
+                node = stack.pop()
+                if len(stack) == 0:
+                    yield node
+            elif first.islower() or first == "_":
+                node_type = line
+                node_type_line_no = line_no
             else:
                 raise RuntimeError(f"Couldn't parse line #{line_no}: '{line}'")
-        assert node_depth == 0
+        assert len(stack) == 0, f"file ends prematurely at line {line_no}"
 
-        # nodes -> entities
-        nodes_dict = self.nodes_by_type()
-        assert len(nodes_dict["world"]) == 1
-        self.entities = [
-            Entity.from_node(node)
-            for node in [
-                nodes_dict["world"][0],
-                *nodes_dict.get("entity", [])]]
+    def parse_entities(self):
+        """parse nodes, skipping "solid" nodes; brushes can be decoded later w/ .load_brushes()"""
+        if self.is_parsed:
+            return
+        self.is_parsed = True
+        entities = list()
+        skipped = list()
+        with stats.recording(self, "parse_entities") as record, stats.phase(record, "scan"):
+            self.stream.seek(0)
+            for node in self.iter_nodes(self.stream, 0, skipped):
+                self.nodes.append(node)
+                if node.node_type in ("world", "entity"):
+                    entity = Entity.from_node(node)
+                    self.brush_spans[entity] = skipped.copy()
+                    entities.append(entity)
+                else:
+                    entities.append(None)
+                skipped.clear()
+            self.entities = self.sort_entities(self.nodes, entities)
+
+    def reparse(self):
+        """re-read the file & only parse top-level nodes whose text changed since the last .reparse()"""
+        # NOTE: unchanged nodes & their entities keep their identity; the first call parses every node
+        # -- .parse() doesn't hash blocks (it'd slow every parse), so use .reparse() for the first load too
+        # NOTE: assumes each node type is on the line before it's opening brace (as written by Hammer)
+        with stats.recording(self, "reparse") as record:
+            text = stats.read(record, self.reread)
+            with stats.phase(record, "hash"):
+                blocks = common.hash_blocks(text, prefix_lines=1)
+                reused = common.reuse_blocks(self.block_hashes, blocks)
+                for first_line_no, lines in common.gaps(text, blocks):
+                    for _ in self.iter_nodes(lines, first_line_no):
+                        pass  # raises RuntimeError on junk, like a full parse
+            items = list()
+            for (start, end, first_line_no, _, _), old_index in zip(blocks, reused):
+                if old_index is not None:
+                    items.append(self.block_items[old_index])
+                else:
+                    nodes, entities = self.parse_chunk(text[start:end].split("\n"), first_line_no, record)
+                    item, = zip(nodes, entities)
+                    items.append(item)
+            self.block_hashes, self.block_items = blocks, items
+            self.nodes = Nodes(node for node, entity in items)
+            with stats.phase(record, "entities"):
+                self.entities = self.sort_entities(self.nodes, [entity for node, entity in items])
+            self.brush_spans = dict()
+            self.is_parsed = True
+
+    def load_brushes(self, entities: Iterable[Entity] = None):
+        """decode brushes skipped by .parse_entities(); defaults to all entities"""
+        # NOTE: solid nodes are not added to .nodes; .as_lines() rebuilds from .entities
+        entities = list(self.brush_spans if entities is None else entities)
+        spans = sorted(
+            (first, last, i)
+            for i, entity in enumerate(entities)
+            for first, last in self.brush_spans.pop(entity, list()))
+        self.stream.seek(0)
+        for i, first_line_no, lines in common.read_spans(self.stream, spans):
+            node, = self.iter_nodes(lines, first_line_no)
+            entities[i].brushes.append(Brush.from_node(node))
+
+    @staticmethod
+    def sort_entities(nodes: List[Node], entities: List[Entity]) -> List[Entity]:
+        """[Entity or None for each top-level node] -> [worldspawn, *entities]"""
+        types = [node.node_type for node in nodes]
+        assert types.count("world") == 1
+        return [
+            entities[types.index("world")],
+            *[
+                entity
+                for node_type, entity in zip(types, entities)
+                if node_type == "entity"]]
 
     def rebuild_nodes(self):
-        new_nodes = list()
+        self.nodes = list(self.iter_rebuilt_nodes())
+
+    def iter_rebuilt_nodes(self) -> Iterator[Node]:
+        """top-level nodes to write, w/ world & entity nodes generated from .entities"""
         nodes_dict = self.nodes_by_type()
 
         if "versioninfo" in nodes_dict:
@@ -275,14 +548,14 @@ class Vmf(base.MapFile, breki.TextFile):
                 "mapversion": 1,
                 "prefab": 0})
         # NOTE: "editorbuild" can vary, and seems to be optional
-        new_nodes.append(version_info)
+        yield version_info
 
         if "visgroups" in nodes_dict:
             assert len(nodes_dict["visgroups"]) == 1
             visgroups = nodes_dict["visgroups"][0]
         else:
             visgroups = Node("visgroups")
-        new_nodes.append(visgroups)
+        yield visgroups
 
         if "viewsettings" in nodes_dict:
             assert len(nodes_dict["viewsettings"]) == 1
@@ -295,7 +568,7 @@ class Vmf(base.MapFile, breki.TextFile):
                 "bShowLogicalGrid": 0,
                 "bSnapToGrid": 1,
                 "nGridSpacing": 16})
-        new_nodes.append(view_settings)
+        yield view_settings
 
         if len(self.entities) != 0:
             worldspawn = self.entities[0]
@@ -320,12 +593,10 @@ class Vmf(base.MapFile, breki.TextFile):
         world_node = Entity.as_node(worldspawn)
         world_node.node_type = "world"
         world_node.update(world_settings)
-        new_nodes.append(world_node)
+        yield world_node
 
-        if len(self.entities) > 1:
-            new_nodes.extend([
-                Entity.as_node(entity)
-                for entity in self.entities[1:]])
+        for entity in self.entities[1:]:
+            yield Entity.as_node(entity)
 
         if "cameras" in nodes_dict:
             assert len(nodes_dict["cameras"]) == 1
@@ -333,7 +604,7 @@ class Vmf(base.MapFile, breki.TextFile):
         else:
             cameras = Node("cameras")
             cameras["activecamera"] = -1
-        new_nodes.append(cameras)
+        yield cameras
 
         if "cordon" in nodes_dict:
             cordons = nodes_dict["cordon"]
@@ -344,6 +615,4 @@ class Vmf(base.MapFile, breki.TextFile):
                 "maxs": common.Point(+1024, +1024, +1024),
                 "active": 0})
             cordons = [cordon]
-        new_nodes.extend(cordons)
-
-        self.nodes = new_nodes
+        yield from cordons
@@ -0,0 +1,186 @@
+"""per-map table of unique planes"""
+# NOTE: planes are snapped & matched w/ epsilons, like q3map2's FindFloatPlane
+# NOTE: each plane is stored as a pair: even indices face "positive", index ^ 1 is the opposite plane
+# -- index >> 1 is the same for both faces, so coplanar tests ignore facing
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ass import physics
+from ass import vector
+import numpy as np
+
+
+NORMAL_EPSILON = 0.00001
+DISTANCE_EPSILON = 0.01
+# NOTE: distances are bucketed by rounding; DISTANCE_EPSILON must be < 0.5
+
+
+def snap(normal: Sequence[float], distance: float, normal_epsilon: float = NORMAL_EPSILON,
+         distance_epsilon: float = DISTANCE_EPSILON) -> Tuple[Tuple[float, float, float], float]:
+    """near-axial normals become axial & near-integer distances become integers"""
+    normal = tuple(float(n) for n in normal)
+    for axis, n in enumerate(normal):
+        if abs(abs(n) - 1) < normal_epsilon:
+            normal = tuple(math.copysign(1.0, n) if i == axis else 0.0 for i in range(3))
+            break
+    else:
+        normal = tuple(0.0 if abs(n) < normal_epsilon else n for n in normal)
+    distance = float(distance)
+    if abs(distance - round(distance)) < distance_epsilon:
+        distance = float(round(distance))
+    return normal, distance
+
+
+def snap_arrays(normals: np.ndarray, distances: np.ndarray, normal_epsilon: float = NORMAL_EPSILON,
+                distance_epsilon: float = DISTANCE_EPSILON) -> Tuple[np.ndarray, np.ndarray]:
+    """snap() for many planes at once"""
+    normals = np.array(normals, dtype=np.float64).reshape(-1, 3)
+    distances = np.array(distances, dtype=np.float64).reshape(-1)
+    unit = np.abs(np.abs(normals) - 1) < normal_epsilon
+    is_axial = unit.any(axis=1)
+    axis = unit.argmax(axis=1)[is_axial]
+    signs = np.sign(normals[is_axial, axis])
+    normals[np.abs(normals) < normal_epsilon] = 0
+    normals[is_axial] = 0
+    normals[np.flatnonzero(is_axial), axis] = signs
+    rounded = np.round(distances)
+    near = np.abs(distances - rounded) < distance_epsilon
+    distances[near] = rounded[near]
+    return normals, distances
+
+
+def is_positive(normal: Sequence[float]) -> bool:
+    """first non-zero component of normal is positive"""
+    for n in normal:
+        if n != 0:
+            return n > 0
+    return True
+
+
+class PlaneTable:
+    """unique planes (& their opposites), referred to by index"""
+    normal_epsilon: float
+    distance_epsilon: float
+    normals: List[Tuple[float, float, float]]
+    distances: List[float]
+    buckets: Dict[int, List[int]]
+    # ^ {round(distance): [plane_index]}
+    uses: Dict[int, List[object]]
+    # ^ {plane_index: [BrushSide]}; only filled by .rebuild()
+    # NOTE: sides moved w/o .add() & .rebuild() keep stale .plane_index values
+
+    def __init__(self, normal_epsilon: float = NORMAL_EPSILON, distance_epsilon: float = DISTANCE_EPSILON):
+        self.normal_epsilon = normal_epsilon
+        self.distance_epsilon = distance_epsilon
+        self.normals = list()
+        self.distances = list()
+        self.buckets = dict()
+        self.uses = dict()
+
+    def __getitem__(self, index: int) -> physics.Plane:
+        return physics.Plane(vector.vec3(*self.normals[index]), self.distances[index])
+
+    def __iter__(self) -> Iterator[physics.Plane]:
+        return (self[i] for i in range(len(self)))
+
+    def __len__(self) -> int:
+        return len(self.normals)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {len(self) // 2} planes @ 0x{id(self):016X}>"
+
+    def add(self, normal: Sequence[float], distance: float) -> int:
+        """index of (snapped) plane; new planes are added w/ their opposite"""
+        normal, distance = snap(normal, distance, self.normal_epsilon, self.distance_epsilon)
+        index = self._find(normal, distance)
+        if index is not None:
+            return index
+        index = len(self.normals)
+        opposite = (tuple(-n + 0.0 for n in normal), -distance + 0.0)
+        pair = [(normal, distance), opposite]
+        if not is_positive(normal):
+            pair.reverse()
+        for i, (pair_normal, pair_distance) in enumerate(pair):
+            self.normals.append(pair_normal)
+            self.distances.append(pair_distance)
+            self.buckets.setdefault(round(pair_distance), list()).append(index + i)
+        return index if is_positive(normal) else index + 1
+
+    def add_plane(self, plane: physics.Plane) -> int:
+        return self.add(plane.normal, plane.distance)
+
+    def find(self, normal: Sequence[float], distance: float) -> Optional[int]:
+        """index of (snapped) plane; None if it isn't in the table"""
+        return self._find(*snap(normal, distance, self.normal_epsilon, self.distance_epsilon))
+
+    def _find(self, normal: Tuple[float, float, float], distance: float) -> Optional[int]:
+        # NOTE: planes w/in epsilon can round into neighbouring buckets
+        bucket = round(distance)
+        for key in (bucket, bucket - 1, bucket + 1):
+            for index in self.buckets.get(key, ()):
+                if abs(self.distances[index] - distance) >= self.distance_epsilon:
+                    continue
+                if all(abs(a - b) < self.normal_epsilon for a, b in zip(self.normals[index], normal)):
+                    return index
+        return None
+
+    @staticmethod
+    def opposite(index: int) -> int:
+        return index ^ 1
+
+    @staticmethod
+    def coplanar(index_a: int, index_b: int) -> bool:
+        """same plane, facing either way"""
+        return index_a >> 1 == index_b >> 1
+
+    def add_arrays(self, normals: np.ndarray, distances: np.ndarray) -> np.ndarray:
+        """.add() for many planes at once; -> plane_indices (int64)"""
+        normals, distances = snap_arrays(normals, distances, self.normal_epsilon, self.distance_epsilon)
+        if len(distances) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # NOTE: only exactly unique planes go through .add(); most sides share planes w/ a neighbour
+        unique, inverse = np.unique(np.column_stack([normals, distances]), axis=0, return_inverse=True)
+        indices = np.array([self.add(row[:3], row[3]) for row in unique.tolist()], dtype=np.int64)
+        return indices[inverse.reshape(-1)]
+
+    def as_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """-> normals (planes, 3), distances (planes,)"""
+        normals = np.array(self.normals, dtype=np.float64).reshape(-1, 3)
+        return normals, np.array(self.distances, dtype=np.float64)
+
+    def rebuild(self, entities: Iterable):
+        """index every side of every brush; sets each side's .plane_index"""
+        # NOTE: store.BrushList views build new sides on every access, so .plane_index can't stick
+        # -- their planes are added from the store's arrays instead & they aren't in .uses
+        # -- indices for those sides: .add_arrays(store.plane_normals, store.plane_distances)
+        self.uses = dict()
+        sides, stores = list(), dict()
+        for entity in entities:
+            store = getattr(entity.brushes, "store", None)  # store.BrushList
+            if store is not None:
+                stores[id(store)] = store
+            else:
+                sides.extend(side for brush in entity.brushes for side in brush.sides)
+        for store in stores.values():
+            self.add_arrays(store.plane_normals, store.plane_distances)
+        normals = np.zeros((len(sides), 3), dtype=np.float64)
+        distances = np.zeros(len(sides), dtype=np.float64)
+        for i, side in enumerate(sides):
+            plane = side.peek_plane()  # leaves lazy sides undecoded
+            normals[i] = tuple(plane.normal)
+            distances[i] = plane.distance
+        for side, index in zip(sides, self.add_arrays(normals, distances).tolist()):
+            side.plane_index = index
+            self.uses.setdefault(index, list()).append(side)
+
+    def sides_on(self, index: int, facing: bool = True) -> List[object]:
+        """sides on plane; facing=False for sides on the opposite plane"""
+        return self.uses.get(index if facing else index ^ 1, list())
+
+    @classmethod
+    def from_entities(cls, entities: Iterable, normal_epsilon: float = NORMAL_EPSILON,
+                      distance_epsilon: float = DISTANCE_EPSILON) -> PlaneTable:
+        out = cls(normal_epsilon, distance_epsilon)
+        out.rebuild(entities)
+        return out
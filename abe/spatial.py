@@ -0,0 +1,349 @@
+"""bounding volume hierarchy for spatial queries"""
+from __future__ import annotations
+import math
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+
+import numpy as np
+
+from . import base
+from . import clip
+from . import store
+
+
+LEAF_SIZE = 8  # items per leaf node
+MIN_PENDING = 64  # inserts held outside the tree before a rebuild
+# NOTE: rebuilds also happen when pending inserts or removed items
+# -- outnumber 1/8th or 1/2 of the tree respectively
+
+
+def morton_codes(points: np.ndarray) -> np.ndarray:
+    """30-bit z-order curve index of each point, relative to the bounds of all points"""
+    lowest = points.min(axis=0)
+    extents = points.max(axis=0) - lowest
+    extents[extents == 0] = 1
+    grid = ((points - lowest) / extents * 1023).astype(np.int64)
+    codes = np.zeros(len(points), dtype=np.int64)
+    for axis in range(3):
+        x = grid[:, axis]
+        x = (x | (x << 16)) & 0x030000FF
+        x = (x | (x << 8)) & 0x0300F00F
+        x = (x | (x << 4)) & 0x030C30C3
+        x = (x | (x << 2)) & 0x09249249
+        codes |= x << axis
+    return codes
+
+
+def box_distances(point: np.ndarray, mins: np.ndarray, maxs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(nearest, furthest) distance from point to each box"""
+    nearest = np.maximum(np.maximum(mins - point, point - maxs), 0)
+    furthest = np.maximum(np.abs(mins - point), np.abs(maxs - point))
+    return np.linalg.norm(nearest, axis=1), np.linalg.norm(furthest, axis=1)
+
+
+def ray_distances(origin: np.ndarray, direction: np.ndarray, mins: np.ndarray, maxs: np.ndarray,
+                  max_distance: float = math.inf) -> np.ndarray:
+    """distance along a normalised ray to each box; inf if it misses"""
+    is_parallel = direction == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1 / np.where(is_parallel, 1, direction)
+        near = (mins - origin) * inverse
+        far = (maxs - origin) * inverse
+    near, far = np.minimum(near, far), np.maximum(near, far)
+    # parallel axes either always or never overlap the slab
+    is_outside = is_parallel & ((origin < mins) | (origin > maxs))
+    near = np.where(is_parallel, np.where(is_outside, math.inf, -math.inf), near)
+    far = np.where(is_parallel, np.where(is_outside, -math.inf, math.inf), far)
+    enter = np.maximum(near.max(axis=1), 0)
+    leave = np.minimum(far.min(axis=1), max_distance)
+    return np.where(enter <= leave, enter, math.inf)
+
+
+class BVH:
+    """bounding volume hierarchy of axis-aligned boxes, built along a z-order curve"""
+    # NOTE: items must be hashable & unique; Brush & Entity hash by identity
+    # tree (sorted along z-order curve)
+    _items: List[Hashable]
+    _mins: np.ndarray  # (items, 3) float64
+    _maxs: np.ndarray  # (items, 3) float64
+    _alive: np.ndarray  # (items,) bool; False once removed
+    _levels: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+    # ^ [(mins, maxs, live_counts)]; root first, leaves last
+    # -- node i has children 2i & 2i + 1 on the next level
+    # -- leaf i holds items [i * LEAF_SIZE:(i + 1) * LEAF_SIZE]
+    _slots: Dict[Hashable, int]  # {item: index}
+    # NOTE: removed items stay in the tree (flagged in _alive) until the next rebuild
+    _pending: Dict[Hashable, Tuple[np.ndarray, np.ndarray]]  # {item: (mins, maxs)}
+    _pending_arrays: Any  # (items, mins, maxs); cached
+
+    def __init__(self):
+        self._items = list()
+        self._mins = np.zeros((0, 3))
+        self._maxs = np.zeros((0, 3))
+        self._alive = np.zeros((0,), dtype=bool)
+        self._levels = list()
+        self._slots = dict()
+        self._pending = dict()
+        self._pending_arrays = None
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._pending or (item in self._slots and self._alive[self._slots[item]])
+
+    def __iter__(self) -> Iterator[Hashable]:
+        yield from (item for item, alive in zip(self._items, self._alive) if alive)
+        yield from self._pending
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._alive)) + len(self._pending)
+
+    def __repr__(self) -> str:
+        descriptor = f"{len(self)} items {len(self._levels)} levels"
+        return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
+
+    # EDITS
+
+    def bounds(self, item: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        """(mins, maxs) of item"""
+        if item in self._pending:
+            return self._pending[item]
+        if item not in self:
+            raise KeyError(item)
+        index = self._slots[item]
+        return self._mins[index], self._maxs[index]
+
+    def insert(self, item: Hashable, mins: Any, maxs: Any):
+        mins = np.asarray(tuple(mins), dtype=np.float64)
+        maxs = np.asarray(tuple(maxs), dtype=np.float64)
+        if not (np.all(np.isfinite(mins)) and np.all(np.isfinite(maxs)) and np.all(mins <= maxs)):
+            raise ValueError(f"invalid bounds for {item!r}: {mins}, {maxs}")
+        if item in self:
+            raise KeyError(f"{item!r} is already indexed")
+        self._pending[item] = (mins, maxs)
+        self._pending_arrays = None
+        if len(self._pending) > max(MIN_PENDING, len(self._items) // 8):
+            self.rebuild()
+
+    def remove(self, item: Hashable):
+        if item in self._pending:
+            del self._pending[item]
+            self._pending_arrays = None
+            return
+        if item not in self:
+            raise KeyError(item)
+        index = self._slots.pop(item)
+        self._alive[index] = False
+        node = index // LEAF_SIZE
+        for mins, maxs, counts in reversed(self._levels):
+            counts[node] -= 1
+            node //= 2
+        if len(self._items) - len(self._slots) > len(self._items) // 2:
+            self.rebuild()
+
+    def update(self, item: Hashable, mins: Any, maxs: Any):
+        """move an item; e.g. after editing a brush"""
+        self.remove(item)
+        self.insert(item, mins, maxs)
+
+    def rebuild(self):
+        """rebuild the tree from all items, including pending inserts"""
+        alive = self._alive
+        items = [item for item, is_alive in zip(self._items, alive) if is_alive]
+        mins, maxs = self._mins[alive], self._maxs[alive]
+        if len(self._pending) != 0:
+            pending_items, pending_mins, pending_maxs = self._pending_items()
+            items.extend(pending_items)
+            mins = np.concatenate([mins, pending_mins])
+            maxs = np.concatenate([maxs, pending_maxs])
+        order = np.argsort(morton_codes((mins + maxs) / 2), kind="stable") if len(items) != 0 else []
+        self._items = [items[i] for i in order]
+        self._mins = mins[order]
+        self._maxs = maxs[order]
+        self._alive = np.ones(len(items), dtype=bool)
+        self._slots = {item: index for index, item in enumerate(self._items)}
+        self._pending = dict()
+        self._pending_arrays = None
+        self._build_levels()
+
+    def _build_levels(self):
+        self._levels = list()
+        if len(self._items) == 0:
+            return
+        starts = np.arange(0, len(self._items), LEAF_SIZE)
+        mins = np.minimum.reduceat(self._mins, starts)
+        maxs = np.maximum.reduceat(self._maxs, starts)
+        counts = np.add.reduceat(self._alive.astype(np.int64), starts)
+        self._levels.append((mins, maxs, counts))
+        while len(counts) > 1:
+            if len(counts) % 2 == 1:  # pad w/ an empty node
+                mins = np.concatenate([mins, np.full((1, 3), math.inf)])
+                maxs = np.concatenate([maxs, np.full((1, 3), -math.inf)])
+                counts = np.concatenate([counts, [0]])
+            mins = mins.reshape(-1, 2, 3).min(axis=1)
+            maxs = maxs.reshape(-1, 2, 3).max(axis=1)
+            counts = counts.reshape(-1, 2).sum(axis=1)
+            self._levels.append((mins, maxs, counts))
+        self._levels.reverse()
+
+    def _pending_items(self) -> Tuple[List[Hashable], np.ndarray, np.ndarray]:
+        if self._pending_arrays is None:
+            items = list(self._pending)
+            bounds = list(self._pending.values())
+            mins = np.array([mins for mins, maxs in bounds]).reshape(-1, 3)
+            maxs = np.array([maxs for mins, maxs in bounds]).reshape(-1, 3)
+            self._pending_arrays = (items, mins, maxs)
+        return self._pending_arrays
+
+    # QUERIES
+
+    def _descend(self, keep) -> np.ndarray:
+        """indices of live tree items in leaves where keep(mins, maxs, counts) -> mask"""
+        # NOTE: each level is filtered w/ a handful of vectorised operations
+        nodes = np.zeros(1, dtype=np.int64)
+        for depth, (mins, maxs, counts) in enumerate(self._levels):
+            if depth != 0:
+                nodes = np.concatenate([nodes * 2, nodes * 2 + 1])
+                nodes = nodes[nodes < len(counts)]
+            nodes = nodes[keep(mins[nodes], maxs[nodes], counts[nodes])]
+            if len(nodes) == 0:
+                break
+        indices = (nodes[:, None] * LEAF_SIZE + np.arange(LEAF_SIZE)).reshape(-1)
+        indices = np.sort(indices[indices < len(self._items)])
+        return indices[self._alive[indices]]
+
+    def query_box(self, mins: Any, maxs: Any) -> List[Hashable]:
+        """items overlapping the box mins -> maxs"""
+        mins = np.asarray(tuple(mins), dtype=np.float64)
+        maxs = np.asarray(tuple(maxs), dtype=np.float64)
+
+        def overlaps(node_mins, node_maxs, counts=None) -> np.ndarray:
+            return np.all((node_mins <= maxs) & (node_maxs >= mins), axis=1)
+
+        indices = self._descend(overlaps)
+        indices = indices[overlaps(self._mins[indices], self._maxs[indices])]
+        out = [self._items[i] for i in indices.tolist()]
+        if len(self._pending) != 0:
+            items, pending_mins, pending_maxs = self._pending_items()
+            out.extend(items[i] for i in np.nonzero(overlaps(pending_mins, pending_maxs))[0].tolist())
+        return out
+
+    def query_ray(self, origin: Any, direction: Any, max_distance: float = math.inf) -> List[Tuple[float, Hashable]]:
+        """[(distance, item)] for each item the ray passes through, nearest first"""
+        origin = np.asarray(tuple(origin), dtype=np.float64)
+        direction = np.asarray(tuple(direction), dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+
+        def hits(node_mins, node_maxs, counts=None) -> np.ndarray:
+            return np.isfinite(ray_distances(origin, direction, node_mins, node_maxs, max_distance))
+
+        indices = self._descend(hits)
+        distances = ray_distances(origin, direction, self._mins[indices], self._maxs[indices], max_distance)
+        items = [self._items[i] for i in indices.tolist()]
+        if len(self._pending) != 0:
+            pending_items, pending_mins, pending_maxs = self._pending_items()
+            items.extend(pending_items)
+            distances = np.concatenate([
+                distances, ray_distances(origin, direction, pending_mins, pending_maxs, max_distance)])
+        order = np.argsort(distances, kind="stable")
+        return [
+            (float(distances[i]), items[i])
+            for i in order.tolist()
+            if math.isfinite(distances[i])]
+
+    def nearest(self, point: Any, count: int = 1, max_distance: float = math.inf) -> List[Tuple[float, Hashable]]:
+        """[(distance, item)] for the count items closest to point, nearest first"""
+        # NOTE: distance is measured to the closest point of each item's box
+        point = np.asarray(tuple(point), dtype=np.float64)
+        limit = max_distance
+        candidates, distances = list(), np.zeros((0,))
+        if len(self._pending) != 0:
+            candidates, pending_mins, pending_maxs = self._pending_items()
+            distances = box_distances(point, pending_mins, pending_maxs)[0]
+            if len(distances) >= count:
+                limit = min(limit, np.partition(distances, count - 1)[count - 1])
+
+        def could_contain_nearest(node_mins, node_maxs, counts) -> np.ndarray:
+            nearest, furthest = box_distances(point, node_mins, node_maxs)
+            # every node contains counts items no further than furthest
+            order = np.argsort(furthest)
+            enough = np.searchsorted(np.cumsum(counts[order]), count)
+            bound = limit if enough == len(order) else min(limit, furthest[order[enough]])
+            return (counts > 0) & (nearest <= bound)
+
+        indices = self._descend(could_contain_nearest)
+        candidates = [*candidates, *(self._items[i] for i in indices.tolist())]
+        distances = np.concatenate([
+            distances, box_distances(point, self._mins[indices], self._maxs[indices])[0]])
+        order = np.argsort(distances, kind="stable")[:count]
+        return [
+            (float(distances[i]), candidates[i])
+            for i in order.tolist()
+            if distances[i] <= max_distance]
+
+    # INITIALISERS
+
+    @classmethod
+    def from_bounds(cls, items: List[Hashable], mins: np.ndarray, maxs: np.ndarray) -> BVH:
+        """bulk build; items w/ NaN bounds are skipped"""
+        mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
+        assert len(items) == len(mins) == len(maxs)
+        is_valid = np.all(np.isfinite(mins) & np.isfinite(maxs) & (mins <= maxs), axis=1)
+        out = cls()
+        out._items = [item for item, valid in zip(items, is_valid) if valid]
+        if len(set(out._items)) != len(out._items):
+            raise KeyError("items must be unique")
+        out._mins = mins[is_valid]
+        out._maxs = maxs[is_valid]
+        out._alive = np.ones(len(out._items), dtype=bool)
+        out.rebuild()
+        return out
+
+    @classmethod
+    def from_brushes(cls, brushes: List[base.Brush]) -> BVH:
+        """index of brushes, bounded by their vertices; brushes w/o vertices are skipped"""
+        return cls.from_bounds(brushes, *brush_bounds(brushes))
+
+    @classmethod
+    def from_entities(cls, entities: List[base.Entity]) -> BVH:
+        """index of entities w/ an "origin" key"""
+        entities = [entity for entity in entities if entity.get("origin") is not None]
+        origins = entity_origins(entities)
+        return cls.from_bounds(entities, origins, origins)
+
+    @classmethod
+    def from_map(cls, map_file: base.MapFile) -> BVH:
+        """index of every brush & every entity w/ an "origin" key"""
+        if not map_file.is_parsed:
+            map_file.parse()
+        if len(map_file.brush_spans) != 0:
+            map_file.load_brushes()
+        brushes = [brush for entity in map_file.entities for brush in entity.brushes]
+        entities = [entity for entity in map_file.entities if entity.get("origin") is not None]
+        brush_mins, brush_maxs = brush_bounds(brushes)
+        origins = entity_origins(entities)
+        return cls.from_bounds(
+            [*brushes, *entities],
+            np.concatenate([brush_mins, origins]),
+            np.concatenate([brush_maxs, origins]))
+
+    @classmethod
+    def from_store(cls, brush_store: store.BrushStore) -> BVH:
+        """index of brush indices"""
+        return cls.from_bounds(range(brush_store.num_brushes), *brush_store.bounds())
+
+
+def brush_bounds(brushes: List[base.Brush]) -> Tuple[np.ndarray, np.ndarray]:
+    """(mins, maxs) of each brush; NaN for brushes w/o vertices"""
+    normals, distances, brush_offsets = base.plane_arrays(brushes)
+    positions, side_offsets = clip.brush_faces(normals, distances, brush_offsets)
+    return clip.brush_bounds(positions, side_offsets, brush_offsets)
+
+
+def entity_origins(entities: List[base.Entity]) -> np.ndarray:
+    """(entities, 3) origin of each entity; NaN if unreadable"""
+    out = np.full((len(entities), 3), np.nan)
+    for i, entity in enumerate(entities):
+        try:
+            out[i] = [float(a) for a in entity["origin"].split()]
+        except (KeyError, ValueError):
+            pass  # NaN origins are skipped
+    return out
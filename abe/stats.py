@@ -0,0 +1,199 @@
+"""opt-in parse statistics & profiling hooks"""
+# NOTE: disabled by default; parsers only check `listeners` once per call
+# -- when enabled, files are read in full before tokenising, so I/O is timed separately
+# -- phase times are exclusive (nested phases are subtracted from their parent)
+# NOTE: phases
+# -- "cache_load" & "cache_save": see abe.cache
+# -- "read": stream I/O & decoding
+# -- "tokenise": lexing & building Entities / Brushes / Nodes
+# -- "brush_sides": BrushSide.from_line (shaders only; floats are decoded lazily, see common.LazyBrushSide)
+# -- "entities": .vmf Entity.from_node (including brush sides) & sorting
+# -- "workers": .parse_parallel() process pool
+# -- "scan" & "hash": .parse_entities() & .reparse()
+from __future__ import annotations
+import contextlib
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+listeners: List[Callable[[ParseStats], None]] = list()
+# ^ called w/ the ParseStats of every parse; empty disables stats
+
+
+def enable(callback: Callable[[ParseStats], None] = None):
+    """record stats for every parse; callback (if any) is called after each parse"""
+    # NOTE: w/o a callback, stats are still kept in MapFile.parse_stats
+    listeners.append(ignore if callback is None else callback)
+
+
+def disable(callback: Callable[[ParseStats], None] = None):
+    """remove callback; all listeners if callback is None"""
+    if callback is None:
+        listeners.clear()
+    else:
+        listeners.remove(callback)
+
+
+def ignore(parse_stats: ParseStats):
+    """default listener; parse_stats are only kept on the MapFile"""
+    pass
+
+
+# MapFile HOOKS
+
+@contextlib.contextmanager
+def recording(map_file: Any, method: str) -> Iterator[Optional[ParseStats]]:
+    """record map_file.<method>(); yields None if stats are disabled"""
+    if len(listeners) == 0:
+        yield None
+        return
+    record = ParseStats(map_file.filename, map_file.__class__.__name__, method)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as exc:
+        record.error = f"{exc.__class__.__name__}: {exc}"
+        raise
+    finally:
+        record.total = time.perf_counter() - start
+        record.count(map_file)
+        map_file.parse_stats = record
+        for listener in list(listeners):
+            listener(record)
+
+
+def phase(record: Optional[ParseStats], name: str):
+    """record.phase(name); does nothing if record is None"""
+    if record is None:
+        return contextlib.nullcontext()
+    return record.phase(name)
+
+
+def read(record: Optional[ParseStats], read_text: Callable[[], str]) -> str:
+    """read_text(), timed & counted if record isn't None"""
+    if record is None:
+        return read_text()
+    return record.read(read_text)
+
+
+class ParseStats:
+    """wall time & counts for a single parse"""
+    filename: str
+    map_class: str  # e.g. "QuakeMap"
+    method: str  # e.g. "parse"
+    seconds: Dict[str, float]
+    # ^ {phase: exclusive wall time}
+    total: float  # wall time of the whole parse
+    bytes_read: int
+    lines: int
+    entities: int
+    brushes: int
+    sides: int
+    comments: int
+    error: Optional[str] = None
+    # ^ "ExceptionType: message" if the parse failed
+    _nested: List[float]
+    # ^ time spent in child phases, for each open phase
+
+    def __init__(self, filename: str, map_class: str, method: str):
+        self.filename = filename
+        self.map_class = map_class
+        self.method = method
+        self.seconds = dict()
+        self.total = 0.0
+        self.bytes_read = 0
+        self.lines = 0
+        self.entities = 0
+        self.brushes = 0
+        self.sides = 0
+        self.comments = 0
+        self._nested = list()
+
+    def __repr__(self) -> str:
+        descriptor = " ".join([
+            f'"{self.filename}" {self.map_class}.{self.method}()',
+            f"{self.total:.3f}s",
+            f"{self.entities} entities",
+            f"{self.brushes} brushes",
+            f"{self.sides} sides"])
+        return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
+
+    @property
+    def cache_hit(self) -> bool:
+        return "cache_load" in self.seconds and "read" not in self.seconds
+
+    @property
+    def untracked(self) -> float:
+        """time outside of any phase"""
+        return self.total - sum(self.seconds.values())
+
+    def add_time(self, name: str, elapsed: float, nested: float = 0.0):
+        self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - nested
+        if len(self._nested) != 0:
+            self._nested[-1] += elapsed
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """add the wall time of a with block to .seconds[name]"""
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, self._nested.pop())
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """wrap func to add the wall time of each call to .seconds[name]"""
+        # NOTE: for hot leaf functions; func cannot open phases of it's own
+        perf_counter = time.perf_counter
+        add_time = self.add_time
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add_time(name, perf_counter() - start)
+
+        return wrapper
+
+    def read(self, read_text: Callable[[], str]) -> str:
+        """time read_text() as "read" & count it's lines & bytes"""
+        # NOTE: bytes_read is the size of the text as utf-8, not of the file on disk
+        with self.phase("read"):
+            text = read_text()
+        self.lines += text.count("\n") + 1
+        self.bytes_read += len(text.encode("utf-8", "surrogatepass"))
+        return text
+
+    def count(self, map_file: Any):
+        """count entities, brushes, sides & comments in map_file"""
+        self.entities = len(map_file.entities)
+        self.comments = len(map_file.comments)
+        self.brushes, self.sides = 0, 0
+        for entity in map_file.entities:
+            brushes = entity.brushes
+            self.brushes += len(brushes)
+            if hasattr(brushes, "store"):  # store.BrushList; don't build Brushes
+                first, last = brushes.store.entity_offsets[brushes.entity_index:brushes.entity_index + 2]
+                offsets = brushes.store.brush_offsets
+                self.sides += int(offsets[last] - offsets[first])
+            else:
+                self.sides += sum(len(brush.sides) for brush in brushes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON-friendly copy, e.g. for service metrics"""
+        return {
+            "filename": self.filename,
+            "map_class": self.map_class,
+            "method": self.method,
+            "seconds": dict(self.seconds),
+            "total": self.total,
+            "cache_hit": self.cache_hit,
+            "bytes_read": self.bytes_read,
+            "lines": self.lines,
+            "entities": self.entities,
+            "brushes": self.brushes,
+            "sides": self.sides,
+            "comments": self.comments,
+            "error": self.error}
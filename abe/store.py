@@ -0,0 +1,276 @@
+"""columnar brush storage"""
+from __future__ import annotations
+from array import array
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import base
+from . import clip
+from . import planes
+from . import texture
+from .parse import common
+
+from ass import geometry
+from ass import physics
+from ass import vector
+
+
+class BrushStore:
+    """all brushes in a map, as contiguous arrays (1 row per side)"""
+    # sides
+    plane_normals: np.ndarray  # (sides, 3) float64
+    plane_distances: np.ndarray  # (sides,) float64
+    triangles: np.ndarray  # (sides, 3, 3) float64; NaN if plane had no _triangle
+    texture_axes: np.ndarray  # (sides, 2, 3) float64; [s, t]
+    texture_offsets: np.ndarray  # (sides, 2) float64
+    texture_scales: np.ndarray  # (sides, 2) float64
+    texture_rotations: np.ndarray  # (sides,) float64
+    shader_indices: np.ndarray  # (sides,) int32
+    shaders: List[str]  # interned shader names
+    # offsets
+    brush_offsets: np.ndarray  # (brushes + 1,) int64; first side of each brush
+    entity_offsets: np.ndarray  # (entities + 1,) int64; first brush of each entity
+    # views
+    side_class: type = base.BrushSide
+    # NOTE: BrushSide subclasses w/o a texture_vector (e.g. CoD4) are not supported
+
+    def __init__(self):
+        self.plane_normals = np.zeros((0, 3))
+        self.plane_distances = np.zeros((0,))
+        self.triangles = np.zeros((0, 3, 3))
+        self.texture_axes = np.zeros((0, 2, 3))
+        self.texture_offsets = np.zeros((0, 2))
+        self.texture_scales = np.zeros((0, 2))
+        self.texture_rotations = np.zeros((0,))
+        self.shader_indices = np.zeros((0,), dtype=np.int32)
+        self.shaders = list()
+        self.brush_offsets = np.zeros((1,), dtype=np.int64)
+        self.entity_offsets = np.zeros((1,), dtype=np.int64)
+
+    def __repr__(self) -> str:
+        descriptor = " ".join([
+            f"{self.num_brushes} brushes",
+            f"{self.num_sides} sides",
+            f"{len(self.shaders)} shaders"])
+        return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
+
+    @property
+    def num_brushes(self) -> int:
+        return len(self.brush_offsets) - 1
+
+    @property
+    def num_entities(self) -> int:
+        return len(self.entity_offsets) - 1
+
+    @property
+    def num_sides(self) -> int:
+        return len(self.plane_distances)
+
+    # GEOMETRY
+
+    def as_models(self, epsilon: float = clip.EPSILON, snap: float = clip.SNAP) -> List[geometry.Model]:
+        """geometry.Model for every brush, in order"""
+        # NOTE: vertices are built here; side_class overrides of .vertex_at & .vertices_at aren't used
+        positions, side_offsets = self.polygons(epsilon, snap)
+        uvs = self.uvs(positions, side_offsets).tolist()
+        positions = positions.tolist()
+        side_offsets = side_offsets.tolist()
+        normals = self.plane_normals.tolist()
+        brush_offsets = self.brush_offsets.tolist()
+        materials = [geometry.Material(shader) for shader in self.shaders]
+        shader_indices = self.shader_indices.tolist()
+        out = list()
+        for first_side, last_side in zip(brush_offsets, brush_offsets[1:]):
+            meshes = list()
+            for side in range(first_side, last_side):
+                first, last = side_offsets[side:side + 2]
+                if last - first < 3:
+                    continue  # doesn't contribute to geometry
+                normal = vector.vec3(*normals[side])
+                polygon = geometry.Polygon([
+                    geometry.Vertex(vector.vec3(*positions[i]), normal, vector.vec2(*uvs[i]))
+                    for i in range(first, last)])
+                meshes.append(geometry.Mesh(materials[shader_indices[side]], [polygon]))
+            out.append(geometry.Model(meshes))
+        return out
+
+    def bounds(self, epsilon: float = clip.EPSILON) -> Tuple[np.ndarray, np.ndarray]:
+        """(mins, maxs) of every brush; see clip.brush_bounds"""
+        positions, side_offsets = self.polygons(epsilon)
+        return clip.brush_bounds(positions, side_offsets, self.brush_offsets)
+
+    def as_physics(self, epsilon: float = clip.EPSILON) -> List[Optional[physics.Brush]]:
+        """physics.Brush for every brush, in order; None for brushes w/o volume"""
+        side_planes = [
+            physics.Plane(vector.vec3(*normal), distance)
+            for normal, distance in zip(self.plane_normals.tolist(), self.plane_distances.tolist())]
+        return base.physics_from_arrays(
+            side_planes, self.plane_normals, self.plane_distances, self.brush_offsets, epsilon)
+
+    def plane_table(self, normal_epsilon: float = planes.NORMAL_EPSILON,
+                    distance_epsilon: float = planes.DISTANCE_EPSILON) -> Tuple[planes.PlaneTable, np.ndarray]:
+        """-> unique planes, plane index of each side (sides,) int64"""
+        table = planes.PlaneTable(normal_epsilon, distance_epsilon)
+        return table, table.add_arrays(self.plane_normals, self.plane_distances)
+
+    def polygons(self, epsilon: float = clip.EPSILON, snap: float = clip.SNAP) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions, side_offsets) of every brush face; see clip.brush_faces"""
+        return clip.brush_faces(
+            self.plane_normals, self.plane_distances, self.brush_offsets, epsilon, snap)
+
+    def uvs(self, positions: np.ndarray, side_offsets: np.ndarray) -> np.ndarray:
+        """(vertices, 2) uvs for the output of .polygons()"""
+        return clip.face_uvs(
+            positions, side_offsets,
+            self.texture_axes, self.texture_offsets, self.texture_scales)
+
+    # VIEWS
+
+    def brush(self, index: int) -> base.Brush:
+        """build a Brush from the arrays"""
+        first, last = self.brush_offsets[index:index + 2].tolist()
+        return base.Brush([self.side(i) for i in range(first, last)])
+
+    def brushes(self, entity_index: int) -> BrushList:
+        return BrushList(self, entity_index)
+
+    def side(self, index: int) -> base.BrushSide:
+        """build a BrushSide from the arrays"""
+        plane = common.Plane(
+            vector.vec3(*self.plane_normals[index].tolist()),
+            float(self.plane_distances[index]))
+        triangle = self.triangles[index]
+        if not np.isnan(triangle[0, 0]):
+            plane._triangle = tuple(
+                vector.vec3(*point)
+                for point in triangle.tolist())
+        shader = self.shaders[self.shader_indices[index]]
+        texture_vector = texture.TextureVector(*[
+            self.side_class.ProjectionAxisClass(axis, offset, scale)
+            for axis, offset, scale in zip(
+                self.texture_axes[index].tolist(),
+                self.texture_offsets[index].tolist(),
+                self.texture_scales[index].tolist())])
+        rotation = float(self.texture_rotations[index])
+        return self.side_class(plane, shader, texture.intern(texture_vector), rotation)
+
+    def sides_of(self, brush_index: int) -> slice:
+        """slice of side arrays for a brush"""
+        first, last = self.brush_offsets[brush_index:brush_index + 2].tolist()
+        return slice(first, last)
+
+    # INITIALISERS
+
+    @classmethod
+    def from_brushes(cls, brushes: List[base.Brush]) -> BrushStore:
+        """store for a single entity's brushes"""
+        return cls.from_brush_lists([brushes])
+
+    @classmethod
+    def from_entities(cls, entities: List[base.Entity]) -> BrushStore:
+        return cls.from_brush_lists([entity.brushes for entity in entities])
+
+    @classmethod
+    def from_brush_lists(cls, brush_lists: List[List[base.Brush]]) -> BrushStore:
+        out = cls()
+        # NOTE: array.array is more compact than lists of python floats
+        plane_rows = array("d")  # normal.xyz, distance
+        triangles = array("d")
+        texture_vectors = array("d")  # s.axis, t.axis, offsets, scales, rotation
+        shader_indices = array("i")
+        brush_offsets = array("q", [0])
+        entity_offsets = array("q", [0])
+        shaders = dict()  # {shader: index}
+        no_triangle = [np.nan] * 9
+        side_class = None
+        for brushes in brush_lists:
+            for brush in brushes:
+                for side in brush.sides:
+                    if side.texture_vector is None:
+                        raise NotImplementedError(f"cannot store {side!r} w/o a texture_vector")
+                    if side_class is None:
+                        side_class = type(side)
+                    plane = side.plane
+                    plane_rows.extend([*plane.normal, plane.distance])
+                    triangle = getattr(plane, "_triangle", None)
+                    if triangle is None:
+                        triangles.extend(no_triangle)
+                    else:
+                        triangles.extend([a for point in triangle for a in point])
+                    s, t = side.texture_vector
+                    texture_vectors.extend([
+                        *s.axis, *t.axis,
+                        s.offset, t.offset,
+                        s.scale, t.scale,
+                        float(side.texture_rotation)])  # .vmf rotations are strings
+                    shader_index = shaders.setdefault(side.shader, len(shaders))
+                    shader_indices.append(shader_index)
+                brush_offsets.append(len(shader_indices))
+            entity_offsets.append(len(brush_offsets) - 1)
+        # arrays -> columns
+        plane_rows = np.frombuffer(plane_rows, dtype=np.float64).reshape(-1, 4)
+        out.plane_normals = plane_rows[:, :3].copy()
+        out.plane_distances = plane_rows[:, 3].copy()
+        out.triangles = np.frombuffer(triangles, dtype=np.float64).reshape(-1, 3, 3).copy()
+        texture_vectors = np.frombuffer(texture_vectors, dtype=np.float64).reshape(-1, 11)
+        out.texture_axes = texture_vectors[:, :6].reshape(-1, 2, 3).copy()
+        out.texture_offsets = texture_vectors[:, 6:8].copy()
+        out.texture_scales = texture_vectors[:, 8:10].copy()
+        out.texture_rotations = texture_vectors[:, 10].copy()
+        out.shader_indices = np.frombuffer(shader_indices, dtype=np.int32).copy()
+        out.shaders = list(shaders)
+        out.brush_offsets = np.frombuffer(brush_offsets, dtype=np.int64).copy()
+        out.entity_offsets = np.frombuffer(entity_offsets, dtype=np.int64).copy()
+        if side_class is not None:
+            out.side_class = side_class
+        return out
+
+
+class BrushList(Sequence):
+    """read-only Entity.brushes, w/ Brushes built on access"""
+    store: BrushStore
+    entity_index: int
+
+    def __init__(self, store: BrushStore, entity_index: int):
+        self.store = store
+        self.entity_index = entity_index
+
+    def __getitem__(self, index):
+        first, last = self.store.entity_offsets[self.entity_index:self.entity_index + 2].tolist()
+        if isinstance(index, slice):
+            return [
+                self.store.brush(first + i)
+                for i in range(*index.indices(last - first))]
+        if index < 0:
+            index += last - first
+        if not 0 <= index < last - first:
+            raise IndexError("brush index out of range")
+        return self.store.brush(first + index)
+
+    def __iter__(self) -> Iterator[base.Brush]:
+        first, last = self.store.entity_offsets[self.entity_index:self.entity_index + 2].tolist()
+        for index in range(first, last):
+            yield self.store.brush(index)
+
+    def __len__(self) -> int:
+        first, last = self.store.entity_offsets[self.entity_index:self.entity_index + 2].tolist()
+        return last - first
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {len(self)} brushes @ 0x{id(self):016X}>"
+
+
+def compact(map_file: base.MapFile) -> BrushStore:
+    """move all brushes into a BrushStore; entity.brushes become read-only"""
+    store = BrushStore.from_entities(map_file.entities)
+    for i, entity in enumerate(map_file.entities):
+        entity.brushes = BrushList(store, i)
+    return store
+
+
+def expand(map_file: base.MapFile):
+    """rebuild Brush objects for all compacted entities"""
+    for entity in map_file.entities:
+        if isinstance(entity.brushes, BrushList):
+            entity.brushes = list(entity.brushes)
@@ -1,17 +1,92 @@
 from __future__ import annotations
+import weakref
+from typing import List, Tuple
 
 from ass import vector
+import numpy as np
+
+
+# source-sdk-2013/src/utils/vbsp.textures.cpp (TextureAxisFromPlane)
+default_axes = [
+    (vector.vec3(y=1), vector.vec3(z=-1)),  # X: east / west wall
+    (vector.vec3(x=1), vector.vec3(z=-1)),  # Y: north / south wall
+    (vector.vec3(x=1), vector.vec3(y=-1))]  # Z: floor / ceiling
+# ^ [(s, t)] for each default_axis; copied by ProjectionAxis.__init__
+DEFAULT_AXES = np.array([
+    [tuple(s), tuple(t)]
+    for s, t in default_axes], dtype=np.float64)
+# ^ (3, 2, 3) default_axes
+shared = weakref.WeakValueDictionary()
+# ^ {intern_key(texture_vector): TextureVector}; see intern
+# NOTE: keys must not reference the TextureVector, or it'd never be released
+
+
+def default_axis(normal: vector.vec3) -> int:
+    """index into DEFAULT_AXES for a plane normal"""
+    # NOTE: picks the largest component (w/ sign); ties go to the first axis
+    x, y, z = normal
+    if x >= y and x >= z:
+        return 0
+    return 1 if y >= z else 2
+
+
+def default_axis_indices(normals: np.ndarray) -> np.ndarray:
+    """default_axis for (N, 3) normals -> (N,) indices into DEFAULT_AXES"""
+    return np.argmax(normals, axis=1)
+
+
+def project(points: np.ndarray, axes: np.ndarray, offsets: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """(N, 3) points -> (N, 2) uvs; axes (2, 3) or (N, 2, 3), offsets & scales (2,) or (N, 2)"""
+    # NOTE: same projection as ProjectionAxis.project
+    if axes.ndim == 2:  # 1 TextureVector for all points
+        return (points @ axes.T + offsets) * scales
+    return (np.einsum("nj,naj->na", points, axes) + offsets) * scales
+
+
+def texture_arrays(texture_vectors: List[TextureVector]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """-> (axes, offsets, scales) w/ shapes (N, 2, 3), (N, 2) & (N, 2) for project"""
+    rows = np.array([
+        (*s.axis, *t.axis, s.offset, t.offset, s.scale, t.scale)
+        for s, t in texture_vectors], dtype=np.float64).reshape(-1, 10)
+    return rows[:, :6].reshape(-1, 2, 3), rows[:, 6:8], rows[:, 8:]
+
+
+def intern_key(texture_vector: TextureVector) -> tuple:
+    """hashable value equal for all equal TextureVectors"""
+    s, t = texture_vector.s, texture_vector.t
+    return (type(texture_vector), type(s), *s.as_tuple(), type(t), *t.as_tuple())
+
+
+def intern(texture_vector: TextureVector) -> TextureVector:
+    """-> frozen TextureVector shared w/ all equal TextureVectors (like sys.intern)"""
+    # NOTE: unused TextureVectors are dropped from the pool once garbage collected
+    shared_vector = shared.setdefault(intern_key(texture_vector), texture_vector)
+    if shared_vector is texture_vector:
+        texture_vector.freeze()
+    return shared_vector
 
 
 class ProjectionAxis:
     axis: vector.vec3
     offset: float
     scale: float
+    frozen: bool = False
+    # NOTE: frozen axes are shared by many BrushSides; edit a .copy() instead
 
     def __init__(self, axis, offset=None, scale=None):
-        self.axis = vector.vec3(*axis)
-        self.offset = 0 if offset is None else offset
-        self.scale = 1 if scale is None else scale
+        # NOTE: skips __setattr__
+        self.__dict__.update(
+            axis=vector.vec3(*axis),
+            offset=0 if offset is None else offset,
+            scale=1 if scale is None else scale)
+
+    def __eq__(self, other: ProjectionAxis) -> bool:
+        if not isinstance(other, ProjectionAxis):
+            return NotImplemented
+        return type(self) is type(other) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash((type(self), *self.as_tuple()))
 
     def __repr__(self) -> str:
         return f"ProjectionAxis({self.axis!r}, {self.offset}, {self.scale})"
@@ -19,18 +94,52 @@ class ProjectionAxis:
     def __iter__(self):
         return iter((self.axis, self.offset, self.scale))
 
+    def __setattr__(self, attr: str, value):
+        if self.frozen:
+            raise AttributeError(f"cannot set .{attr} of a frozen {self.__class__.__name__}; edit a .copy()")
+        super().__setattr__(attr, value)
+
+    def as_tuple(self) -> tuple:
+        axis = self.axis
+        return (axis.x, axis.y, axis.z, self.offset, self.scale)
+
+    def copy(self) -> ProjectionAxis:
+        """unfrozen copy"""
+        return self.__class__(self.axis, self.offset, self.scale)
+
+    def freeze(self):
+        object.__setattr__(self, "frozen", True)
+
     def project(self, point: vector.vec3) -> float:
         return (vector.dot(point, self.axis) + self.offset) * self.scale
 
+    def project_array(self, points: np.ndarray) -> np.ndarray:
+        """(N, 3) points -> (N,) coordinates"""
+        return (np.asarray(points, dtype=np.float64) @ tuple(self.axis) + self.offset) * self.scale
+
 
 class TextureVector:
     s: ProjectionAxis
     t: ProjectionAxis
     # TODO: rotation (editor only)
 
+    frozen: bool = False
+    # NOTE: frozen TextureVectors (see intern) are shared by many BrushSides
+    # -- assign a .copy() to edit a single side
+
     def __init__(self, s=None, t=None):
-        self.s = ProjectionAxis([1, 0]) if s is None else s
-        self.t = ProjectionAxis([0, 1]) if t is None else t
+        # NOTE: skips __setattr__
+        self.__dict__.update(
+            s=ProjectionAxis([1, 0]) if s is None else s,
+            t=ProjectionAxis([0, 1]) if t is None else t)
+
+    def __eq__(self, other: TextureVector) -> bool:
+        if not isinstance(other, TextureVector):
+            return NotImplemented
+        return type(self) is type(other) and (self.s, self.t) == (other.s, other.t)
+
+    def __hash__(self):
+        return hash((type(self), self.s, self.t))
 
     def __iter__(self):
         return iter((self.s, self.t))
@@ -38,18 +147,35 @@ class TextureVector:
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.s!r}, {self.t!r})"
 
+    def __setattr__(self, attr: str, value):
+        if self.frozen:
+            raise AttributeError(f"cannot set .{attr} of a frozen {self.__class__.__name__}; edit a .copy()")
+        super().__setattr__(attr, value)
+
+    def copy(self) -> TextureVector:
+        """unfrozen copy"""
+        return self.__class__(self.s.copy(), self.t.copy())
+
+    def freeze(self):
+        self.s.freeze()
+        self.t.freeze()
+        object.__setattr__(self, "frozen", True)
+
+    def as_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """-> (axes, offsets, scales) w/ shapes (2, 3), (2,) & (2,) for project"""
+        axes, offsets, scales = texture_arrays([self])
+        return axes[0], offsets[0], scales[0]
+
     def uv_at(self, point: vector.vec3) -> vector.vec2:
         u = self.s.project(point)
         v = self.t.project(point)
         return vector.vec2(u, v)
 
+    def uv_array(self, points: np.ndarray) -> np.ndarray:
+        """(N, 3) points -> (N, 2) uvs"""
+        return project(np.asarray(points, dtype=np.float64), *self.as_arrays())
+
     @classmethod
     def from_normal(cls, normal: vector.vec3) -> TextureVector:
-        # source-sdk-2013/src/utils/vbsp.textures.cpp (TextureAxisFromPlane)
-        axes = [(vector.vec3(y=1), vector.vec3(z=-1)),  # X: east / west wall
-                (vector.vec3(x=1), vector.vec3(z=-1)),  # Y: north / south wall
-                (vector.vec3(x=1), vector.vec3(y=-1))]  # Z: floor / ceiling
-        # defaults to floor / ceiling if equally on 2 axes
-        best_axis = 2 if len(set(normal)) == 0 else list(normal).index(max(normal))
-        s, t = axes[best_axis]
-        return cls(*map(ProjectionAxis, [s, t]))
+        s, t = default_axes[default_axis(normal)]
+        return cls(ProjectionAxis(s), ProjectionAxis(t))
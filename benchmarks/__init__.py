@@ -0,0 +1 @@
+"""throughput & memory benchmarks; see README.md"""
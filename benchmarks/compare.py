@@ -0,0 +1,55 @@
+"""compare 2 benchmark results; python -m benchmarks.compare old.json new.json"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[Tuple[str, str, float, float, float, float]]:
+    """-> [(format, step, old_best, new_best, time_ratio, memory_ratio)] for steps in both"""
+    rows = list()
+    for map_format, new_result in new["formats"].items():
+        old_result = old["formats"].get(map_format)
+        if old_result is None:
+            continue
+        for name, new_step in new_result["steps"].items():
+            old_step = old_result["steps"].get(name)
+            if old_step is None or "skipped" in old_step or "skipped" in new_step:
+                continue
+            rows.append((
+                map_format, name,
+                old_step["best"], new_step["best"],
+                new_step["best"] / max(old_step["best"], 1e-9),
+                new_step["peak_bytes"] / max(old_step["peak_bytes"], 1)))
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.partition(";")[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="time or memory ratio counted as a regression")
+    args = parser.parse_args(argv)
+    with open(args.old) as old_file, open(args.new) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    if old["meta"]["params"] != new["meta"]["params"]:
+        print("WARNING: results were generated w/ different parameters")
+    print(f"old: {old['meta']['commit']}\nnew: {new['meta']['commit']}")
+    print(f"{'format':<10} {'step':<18} {'old':>9} {'new':>9} {'time':>7} {'memory':>7}")
+    regressions = 0
+    for map_format, name, old_best, new_best, time_ratio, memory_ratio in compare(old, new):
+        flag = ""
+        if time_ratio > args.threshold or memory_ratio > args.threshold:
+            flag = "  <- regression"
+            regressions += 1
+        print(" ".join([
+            f"{map_format:<10} {name:<18}",
+            f"{old_best:8.3f}s {new_best:8.3f}s",
+            f"{time_ratio:6.2f}x {memory_ratio:6.2f}x{flag}"]))
+    return 1 if regressions != 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""deterministic synthetic maps for benchmarking"""
+from __future__ import annotations
+import itertools
+import math
+import random
+from typing import Dict, Iterator, List, Tuple
+
+from abe import texture
+
+
+formats = ("quake", "valve220", "cod4", "vmf")
+extensions = {"quake": "map", "valve220": "map", "cod4": "map", "vmf": "vmf"}
+shaders = [f"bench/{kind}_{i:02d}" for kind in ("wall", "floor", "trim", "metal") for i in range(16)]
+point_classnames = ["light", "info_null", "info_player_start", "ambient_generic"]
+brush_classnames = ["func_detail", "func_wall", "func_door", "trigger_multiple"]
+
+Vec = Tuple[float, float, float]
+
+
+def cut_normals() -> Iterator[Vec]:
+    """extra side normals after the 6 box sides; corners first, then edges"""
+    for signs in itertools.product((-1, 1), repeat=3):
+        yield normalise(signs)
+    for axis in range(3):
+        for signs in itertools.product((-1, 1), repeat=2):
+            normal = list(signs)
+            normal.insert(axis, 0)
+            yield normalise(normal)
+    # fibonacci sphere for anything beyond 26 sides
+    for i in itertools.count():
+        z = 1 - 2 * ((i * 0.618034) % 1)
+        angle = i * 2.399963
+        radius = math.sqrt(1 - z * z)
+        yield (radius * math.cos(angle), radius * math.sin(angle), z)
+
+
+def normalise(vec: Vec) -> Vec:
+    length = math.sqrt(sum(a * a for a in vec))
+    return tuple(a / length for a in vec)
+
+
+def cross(a: Vec, b: Vec) -> Vec:
+    return (
+        a[1] * b[2] - a[2] * b[1],
+        a[2] * b[0] - a[0] * b[2],
+        a[0] * b[1] - a[1] * b[0])
+
+
+def triangle(normal: Vec, distance: float) -> Tuple[Vec, Vec, Vec]:
+    """(A, B, C) w/ normal == cross(C - A, B - A), as written by map editors"""
+    helper = (0, 0, 1) if abs(normal[2]) < 0.9 else (1, 0, 0)
+    u = normalise(cross(normal, helper))
+    v = cross(u, normal)
+    origin = tuple(n * distance for n in normal)
+    A = origin
+    B = tuple(o + a * 64 for o, a in zip(origin, u))
+    C = tuple(o + a * 64 for o, a in zip(origin, v))
+    return A, B, C
+
+
+def brush_planes(mins: Vec, maxs: Vec, num_sides: int) -> List[Tuple[Vec, float]]:
+    """box sides, then corners & edges cut off to reach num_sides (>= 6)"""
+    planes = list()
+    for axis in range(3):
+        for sign, bound in ((1, maxs), (-1, mins)):
+            normal = [0, 0, 0]
+            normal[axis] = sign
+            planes.append((tuple(normal), sign * bound[axis]))
+    centre = tuple((a + b) / 2 for a, b in zip(mins, maxs))
+    extents = tuple((b - a) / 2 for a, b in zip(mins, maxs))
+    for normal in itertools.islice(cut_normals(), max(num_sides - 6, 0)):
+        support = sum(abs(n) * e for n, e in zip(normal, extents))
+        centre_distance = sum(n * c for n, c in zip(normal, centre))
+        planes.append((normal, centre_distance + support * 0.9))
+    return planes
+
+
+def fstr(x: float) -> str:
+    """compact, deterministic float formatting"""
+    x = round(x, 3)
+    return str(int(x)) if x == int(x) else f"{x:g}"
+
+
+def point(vec: Vec, separator: str = " ") -> str:
+    return separator.join(map(fstr, vec))
+
+
+# SIDE FORMATS
+
+def quake_side(normal: Vec, distance: float, shader: str) -> str:
+    A, B, C = triangle(normal, distance)
+    return f"( {point(A)} ) ( {point(B)} ) ( {point(C)} ) {shader} 0 0 0 1 1"
+
+
+def valve220_side(normal: Vec, distance: float, shader: str) -> str:
+    A, B, C = triangle(normal, distance)
+    s, t = texture.default_axes[texture.default_axis(normal)]
+    return " ".join([
+        f"( {point(A)} ) ( {point(B)} ) ( {point(C)} ) {shader}",
+        f"[ {point(s)} 0 ] [ {point(t)} 0 ] 0 0.5 0.5"])
+
+
+def cod4_side(normal: Vec, distance: float, shader: str) -> str:
+    A, B, C = triangle(normal, distance)
+    return " ".join([
+        f" ( {point(A)} ) ( {point(B)} ) ( {point(C)} ) {shader} 128 128 0 0 0 0",
+        "lightmap_gray 16384 16384 0 0 0 0"])
+
+
+def vmf_side(normal: Vec, distance: float, shader: str, side_id: int, indent: str) -> List[str]:
+    A, B, C = triangle(normal, distance)
+    s, t = texture.default_axes[texture.default_axis(normal)]
+    return [
+        f"{indent}side",
+        f"{indent}{{",
+        f'{indent}\t"id" "{side_id}"',
+        f'{indent}\t"plane" "({point(A)}) ({point(B)}) ({point(C)})"',
+        f'{indent}\t"material" "{shader.upper()}"',
+        f'{indent}\t"uaxis" "[{point(s)} 0] 0.25"',
+        f'{indent}\t"vaxis" "[{point(t)} 0] 0.25"',
+        f'{indent}\t"rotation" "0"',
+        f'{indent}\t"lightmapscale" "16"',
+        f'{indent}\t"smoothing_groups" "0"',
+        f"{indent}}}"]
+
+
+# MAP CONTENTS
+
+class Generator:
+    """random, but repeatable map contents"""
+    rng: random.Random
+    num_sides: int
+    spread: float
+
+    def __init__(self, seed: int, num_sides: int, num_brushes: int):
+        self.rng = random.Random(seed)
+        self.num_sides = num_sides
+        self.spread = 64 * max(num_brushes, 1) ** (1 / 3) * 2
+
+    def brush(self) -> Tuple[List[Tuple[Vec, float]], List[str]]:
+        """(planes, shaders)"""
+        rng = self.rng
+        mins = tuple(rng.randrange(-int(self.spread), int(self.spread), 8) for axis in range(3))
+        size = tuple(rng.choice((16, 32, 64, 128)) for axis in range(3))
+        maxs = tuple(a + s for a, s in zip(mins, size))
+        planes = brush_planes(mins, maxs, self.num_sides)
+        shader = rng.choice(shaders)
+        return planes, [shader if rng.random() < 0.8 else rng.choice(shaders) for plane in planes]
+
+    def point_entity(self, index: int) -> Dict[str, str]:
+        rng = self.rng
+        origin = tuple(rng.randrange(-int(self.spread), int(self.spread)) for axis in range(3))
+        key_values = {
+            "classname": rng.choice(point_classnames),
+            "origin": point(origin),
+            "targetname": f"target_{index % 97}"}
+        if key_values["classname"] == "light":
+            key_values["light"] = str(rng.choice((150, 200, 300)))
+            key_values["style"] = str(rng.randrange(4))
+        return key_values
+
+    def brush_entity(self, index: int) -> Dict[str, str]:
+        return {
+            "classname": self.rng.choice(brush_classnames),
+            "targetname": f"group_{index % 31}"}
+
+
+def generate(map_format: str, entities: int = 100, brushes: int = 1000, sides: int = 6,
+             brush_entities: int = 10, entity_brushes: int = 4, depth: int = 2, seed: int = 0) -> List[str]:
+    """lines of a synthetic map; same arguments -> same lines"""
+    # NOTE: brushes go in worldspawn; each of the brush_entities gets entity_brushes more
+    # -- depth sets how deeply .vmf visgroups are nested
+    if map_format not in formats:
+        raise ValueError(f"unknown format: {map_format!r}; expected one of {formats}")
+    if sides < 6:
+        raise ValueError("brushes are boxes w/ corners cut off; need at least 6 sides")
+    generator = Generator(seed, sides, brushes)
+    world = [generator.brush() for i in range(brushes)]
+    point_entities = [generator.point_entity(i) for i in range(entities)]
+    brush_entity_list = [
+        (generator.brush_entity(i), [generator.brush() for j in range(entity_brushes)])
+        for i in range(brush_entities)]
+    all_entities = [
+        ({"classname": "worldspawn", "message": "synthetic benchmark map"}, world),
+        *[(key_values, list()) for key_values in point_entities],
+        *brush_entity_list]
+    if map_format == "vmf":
+        return vmf_lines(all_entities, depth)
+    return map_lines(map_format, all_entities)
+
+
+def map_lines(map_format: str, entities: List[Tuple[Dict[str, str], List]]) -> List[str]:
+    side_line = {"quake": quake_side, "valve220": valve220_side, "cod4": cod4_side}[map_format]
+    lines = list()
+    if map_format == "cod4":
+        lines.extend(["iwmap 4", '"000_Global" flags  active', '"The Map" flags '])
+    else:
+        lines.append("// Game: Benchmark")
+    for i, (key_values, brushes) in enumerate(entities):
+        lines.extend([f"// entity {i}", "{"])
+        if i == 0 and map_format == "valve220":
+            key_values = {"mapversion": "220", **key_values}
+        lines.extend(f'"{key}" "{value}"' for key, value in key_values.items())
+        for j, (planes, brush_shaders) in enumerate(brushes):
+            lines.extend([f"// brush {j}", "{"])
+            lines.extend(
+                side_line(normal, distance, shader)
+                for (normal, distance), shader in zip(planes, brush_shaders))
+            lines.append("}")
+        lines.append("}")
+    return lines
+
+
+def vmf_lines(entities: List[Tuple[Dict[str, str], List]], depth: int) -> List[str]:
+    lines = [
+        "versioninfo", "{",
+        '\t"editorversion" "400"', '\t"editorbuild" "8000"', '\t"mapversion" "1"',
+        '\t"formatversion" "100"', '\t"prefab" "0"', "}"]
+    # nested visgroups
+    lines.extend(["visgroups", "{"])
+    for level in range(depth):
+        indent = "\t" * (level + 1)
+        lines.extend([
+            f"{indent}visgroup", f"{indent}{{",
+            f'{indent}\t"name" "group_{level}"',
+            f'{indent}\t"visgroupid" "{level + 1}"',
+            f'{indent}\t"color" "255 128 0"'])
+    for level in reversed(range(depth)):
+        lines.append("\t" * (level + 1) + "}")
+    lines.append("}")
+    ids = itertools.count(1)
+    for i, (key_values, brushes) in enumerate(entities):
+        lines.extend(["world" if i == 0 else "entity", "{", f'\t"id" "{next(ids)}"'])
+        lines.extend(f'\t"{key}" "{value}"' for key, value in key_values.items())
+        for planes, brush_shaders in brushes:
+            lines.extend(["\tsolid", "\t{", f'\t\t"id" "{next(ids)}"'])
+            for (normal, distance), shader in zip(planes, brush_shaders):
+                lines.extend(vmf_side(normal, distance, shader, next(ids), "\t\t"))
+            lines.extend([
+                "\t\teditor", "\t\t{",
+                '\t\t\t"color" "0 128 255"',
+                f'\t\t\t"visgroupid" "{max(depth, 1)}"',
+                '\t\t\t"visgroupshown" "1"', "\t\t}",
+                "\t}"])
+        lines.append("}")
+    return lines
@@ -0,0 +1,181 @@
+"""time abe on synthetic maps; python -m benchmarks.run --help"""
+from __future__ import annotations
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+import abe
+from abe import cache
+from abe import spatial
+from abe import store
+
+from . import generate
+
+
+map_classes = {
+    "quake": abe.QuakeMap,
+    "valve220": abe.Valve220Map,
+    "cod4": abe.CoD4Map,
+    "vmf": abe.Vmf}
+
+
+# STEPS
+# NOTE: each step is (setup, run); setup(filepath) -> state; run(state) is timed
+# -- run raising NotImplementedError marks the step as skipped for that format
+
+def parsed(filepath: str) -> abe.MapFile:
+    map_file = map_classes[format_of(filepath)](filepath)
+    map_file.parse()
+    return map_file
+
+
+def unparsed(filepath: str) -> abe.MapFile:
+    return map_classes[format_of(filepath)](filepath)
+
+
+def reparsed(filepath: str) -> abe.MapFile:
+    map_file = unparsed(filepath)
+    map_file.reparse()
+    return map_file
+
+
+def searches(map_file: abe.MapFile):
+    """100 searches; the first builds the index"""
+    for i in range(25):
+        map_file.search(classname="light")
+        map_file.search(targetname=f"target_{i}")
+        map_file.search(classname="func_door", targetname=f"group_{i}")
+        map_file.search(style="")
+
+
+def models(map_file: abe.MapFile):
+    try:
+        brush_store = store.BrushStore.from_entities(map_file.entities)
+    except NotImplementedError:  # e.g. CoD4 sides w/o a texture_vector
+        return [brush.as_model() for entity in map_file.entities for brush in entity.brushes]
+    return brush_store.as_models()
+
+
+steps: Dict[str, Tuple[Callable[[str], Any], Callable[[Any], Any]]] = {
+    "parse": (unparsed, lambda m: m.parse()),
+    "parse_entities": (unparsed, lambda m: m.parse_entities()),
+    "reparse_unchanged": (reparsed, lambda m: m.reparse()),
+    "as_lines": (parsed, lambda m: m.as_lines()),
+    "write": (parsed, lambda m: m.write(io.StringIO())),
+    "search": (parsed, searches),
+    "as_physics": (parsed, lambda m: m.as_physics()),
+    "as_models": (parsed, models),
+    "bvh": (parsed, spatial.BVH.from_map)}
+
+
+def format_of(filepath: str) -> str:
+    return os.path.basename(filepath).split(".")[0]
+
+
+def measure(setup: Callable[[str], Any], run: Callable[[Any], Any], filepath: str, repeat: int) -> Dict[str, Any]:
+    """-> {"seconds": [...], "best": float, "median": float, "peak_bytes": int}"""
+    seconds = list()
+    for i in range(repeat):
+        state = setup(filepath)
+        gc.collect()
+        start = time.perf_counter()
+        run(state)
+        seconds.append(time.perf_counter() - start)
+        del state
+    # NOTE: memory is measured on a separate run; tracemalloc slows python down a lot
+    state = setup(filepath)
+    gc.collect()
+    tracemalloc.start()
+    run(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "best": min(seconds),
+        "median": statistics.median(seconds),
+        "peak_bytes": peak}
+
+
+def benchmark(map_format: str, folder: str, repeat: int, selected: List[str], **params) -> Dict[str, Any]:
+    lines = generate.generate(map_format, **params)
+    filepath = os.path.join(folder, f"{map_format}.{generate.extensions[map_format]}")
+    with open(filepath, "w", encoding="utf-8", newline="\n") as map_file:
+        map_file.write("\n".join(lines))
+    out = {"lines": len(lines), "bytes": os.path.getsize(filepath), "steps": dict()}
+    for name in selected:
+        setup, run = steps[name]
+        try:
+            out["steps"][name] = measure(setup, run, filepath, repeat)
+        except NotImplementedError as exc:
+            out["steps"][name] = {"skipped": str(exc)[:80] or "NotImplementedError"}
+    return out
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.partition(";")[0])
+    parser.add_argument("--formats", nargs="+", default=list(generate.formats), choices=generate.formats)
+    parser.add_argument("--steps", nargs="+", default=list(steps), choices=list(steps))
+    parser.add_argument("--entities", type=int, default=500, help="point entities")
+    parser.add_argument("--brushes", type=int, default=5000, help="worldspawn brushes")
+    parser.add_argument("--sides", type=int, default=6, help="sides per brush (>= 6)")
+    parser.add_argument("--brush-entities", type=int, default=50)
+    parser.add_argument("--entity-brushes", type=int, default=4, help="brushes per brush entity")
+    parser.add_argument("--depth", type=int, default=2, help=".vmf visgroup nesting")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark.json", help="results file (JSON)")
+    args = parser.parse_args(argv)
+    params = {
+        "entities": args.entities, "brushes": args.brushes, "sides": args.sides,
+        "brush_entities": args.brush_entities, "entity_brushes": args.entity_brushes,
+        "depth": args.depth, "seed": args.seed}
+    cache.disable()  # measure parsing, not the cache
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": sys.version,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "params": params},
+        "formats": dict()}
+    with tempfile.TemporaryDirectory() as folder:
+        for map_format in args.formats:
+            result = benchmark(map_format, folder, args.repeat, args.steps, **params)
+            results["formats"][map_format] = result
+            print(f"{map_format}: {result['lines']} lines, {result['bytes'] / 2 ** 20:.1f} MiB")
+            for name, step in result["steps"].items():
+                if "skipped" in step:
+                    print(f"  {name:<18} skipped ({step['skipped']})")
+                else:
+                    print(f"  {name:<18} {step['best']:8.3f}s  {step['peak_bytes'] / 2 ** 20:8.1f} MiB peak")
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=2)
+    print(f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 # rebuild of bsp_tool.extensions.decompile_rbsp
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import functools
+import operator
 import os
-from typing import Dict, Set
+import sys
+from typing import Dict, Iterator, List, Set, Tuple
 
 import abe
+from abe.parse import common
+from abe.parse.valve import map220
 import ass
+import numpy as np
 
 
 # TODO:
@@ -15,6 +24,19 @@ import ass
 # -- currently built for titanfall 2 maps
 # -- getting brushes from CM_GRID is limiting us to clips
 # -- hammer reports only clip, npcclip & blocklight textures
+# -- decompile_map uses RbspArrays; decompile_brush etc. are the per-brush reference
+
+
+BOUNDS_NORMALS = np.array([
+    (+1, 0, 0), (-1, 0, 0),
+    (0, +1, 0), (0, -1, 0),
+    (0, 0, +1), (0, 0, -1)], dtype=np.float64)
+# ^ normals of each side from abe.Brush.from_bounds, in order
+
+
+@functools.lru_cache(maxsize=None)
+def normalise_shader(name: str) -> str:
+    return sys.intern(name.replace("\\", "/").lower())
 
 
 def decompile_brush(bsp, brush_index: int) -> abe.Brush:
@@ -35,7 +57,7 @@ def decompile_brush(bsp, brush_index: int) -> abe.Brush:
     for i, side in enumerate(abe_brush.sides):
         properties = bsp.CM_BRUSH_SIDE_PROPERTIES[i + first_brush_side]
         texdata = bsp.TEXTURE_DATA[properties.texture_data]
-        side.shader = bsp.TEXTURE_DATA_STRING_DATA[texdata.name_index].replace("\\", "/").lower()
+        side.shader = normalise_shader(bsp.TEXTURE_DATA_STRING_DATA[texdata.name_index])
         tv = bsp.CM_BRUSH_SIDE_TEXTURE_VECTORS[first_brush_side + i]
         side.texture_vector.s.axis = tv.s.axis
         side.texture_vector.t.axis = tv.t.axis
@@ -69,53 +91,286 @@ def geosets_range_brush_indices(bsp, start: int, end: int) -> Set[int]:
 # -- so where are the other brushes?
 # -- are they also indexed by cm_grid?
 # -- is this titanfall 2 specific?
-def decompile_brush_entity(bsp, bsp_entity: Dict[str, str]) -> abe.Entity:
-    abe_entity = abe.Entity(**bsp_entity)
+def geo_set_range(bsp, abe_entity: abe.Entity) -> Tuple[int, int]:
+    """(start, end) of abe_entity's CM_GEO_SETS; removes it's "model" key"""
     if abe_entity.classname == "worldspawn":
         # NOTE: this should get all the worldspawn geosets, but we'll see
         grid_cell = bsp.CM_GRID_CELLS[-len(bsp.MODELS)]
-        start = 0
-        end = grid_cell.first_geo_set + grid_cell.num_geo_sets
+        return 0, grid_cell.first_geo_set + grid_cell.num_geo_sets
     elif abe_entity.get("model", "").startswith("*"):
         model_index = int(abe_entity.model[1:])
         grid_cell = bsp.CM_GRID_CELLS[-len(bsp.MODELS):][model_index]
-        start = grid_cell.first_geo_set
-        end = start + grid_cell.num_geo_sets
         del abe_entity["model"]
+        return grid_cell.first_geo_set, grid_cell.first_geo_set + grid_cell.num_geo_sets
     else:
         raise RuntimeError("not a brush entity!")
+
+
+def decompile_brush_entity(bsp, bsp_entity: Dict[str, str]) -> abe.Entity:
+    abe_entity = abe.Entity(**bsp_entity)
+    start, end = geo_set_range(bsp, abe_entity)
     brush_indices = geosets_range_brush_indices(bsp, start, end)
-    if len(brush_indices) > 0:
-        print(f"{min(brush_indices)=}, {max(brush_indices)=}")
     abe_entity.brushes = [
         decompile_brush(bsp, i)
         for i in sorted(brush_indices)]
     return abe_entity
 
 
-def decompile_map(bsp) -> abe.MapFile:
-    base_filename = os.path.splitext(bsp.filename)[0]
-    out = abe.MapFile(f"{base_filename}.map")
+def ragged_arange(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """concatenated range(start, start + count) for each start & count"""
+    counts = np.asarray(counts, dtype=np.int64)
+    firsts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(np.asarray(starts, dtype=np.int64), counts) + np.arange(firsts.size) - firsts
+
+
+class RbspArrays:
+    """lumps read by decompile_brush & geosets_range_brush_indices, as arrays"""
+    # NOTE: each lump is read once; lookups are vectorised gathers
+    # -- picklable, unlike the bsp, so it can be shared w/ worker processes
+    # CM_BRUSHES
+    brush_origins: np.ndarray  # (brushes, 3) float64
+    brush_extents: np.ndarray  # (brushes, 3) float64
+    brush_num_plane_offsets: np.ndarray  # (brushes,) int64
+    brush_side_offsets: np.ndarray  # (brushes,) int64
+    brush_indices: np.ndarray  # (brushes,) int64; CM_BRUSH.index
+    # brush sides
+    side_plane_offsets: np.ndarray  # (CM_BRUSH_SIDE_PLANE_OFFSETS,) int64
+    side_texture_data: np.ndarray  # (CM_BRUSH_SIDE_PROPERTIES,) int64
+    side_texture_axes: np.ndarray  # (CM_BRUSH_SIDE_TEXTURE_VECTORS, 2, 3) float64; [s, t]
+    side_texture_offsets: np.ndarray  # (CM_BRUSH_SIDE_TEXTURE_VECTORS, 2) float64
+    first_brush_plane: int  # CM_GRID.first_brush_plane
+    # PLANES
+    plane_normals: np.ndarray  # (planes, 3) float64
+    plane_distances: np.ndarray  # (planes,) float64
+    # TEXTURE_DATA
+    shaders: List[str]  # normalised shader name for each TEXTURE_DATA index
+    # CM_GEO_SETS & CM_PRIMITIVES
+    geo_set_num_primitives: np.ndarray  # (geo_sets,) int64
+    geo_set_primitive_types: np.ndarray  # (geo_sets,) int64
+    geo_set_primitive_indices: np.ndarray  # (geo_sets,) int64
+    primitive_types: np.ndarray  # (primitives,) int64
+    primitive_indices: np.ndarray  # (primitives,) int64
+
+    def __repr__(self) -> str:
+        descriptor = " ".join([
+            f"{len(self.brush_indices)} brushes",
+            f"{len(self.plane_distances)} planes",
+            f"{len(self.shaders)} shaders"])
+        return f"<{self.__class__.__name__} {descriptor} @ 0x{id(self):016X}>"
+
+    def geosets_brush_indices(self, start: int, end: int) -> np.ndarray:
+        """sorted CM_BRUSHES indices; vectorised geosets_range_brush_indices"""
+        num_primitives = self.geo_set_num_primitives[start:end]
+        types = self.geo_set_primitive_types[start:end]
+        indices = self.geo_set_primitive_indices[start:end]
+        single = num_primitives == 1
+        direct = indices[single & (types == 0x00)]
+        primitives = np.unique(ragged_arange(indices[~single], num_primitives[~single]))
+        indirect = self.primitive_indices[primitives][self.primitive_types[primitives] == 0x00]
+        return np.unique(np.concatenate([direct, indirect]))
+
+    def brushes(self, brush_indices: np.ndarray, side_class: type = map220.BrushSide) -> List[abe.Brush]:
+        """decompile_brush for each of brush_indices; default side_class can be written to a .map"""
+        brush_indices = np.asarray(brush_indices, dtype=np.int64)
+        num_plane_offsets = self.brush_num_plane_offsets[brush_indices]
+        side_offsets = self.brush_side_offsets[brush_indices]
+        num_sides = num_plane_offsets + 6
+        brush_firsts = np.cumsum(num_sides) - num_sides
+        # 6 bounds sides (see abe.Brush.from_bounds)
+        origins = self.brush_origins[brush_indices]
+        extents = self.brush_extents[brush_indices]
+        mins, maxs = origins - extents, origins + extents
+        normals = np.zeros((int(num_sides.sum()), 3), dtype=np.float64)
+        distances = np.zeros((len(normals),), dtype=np.float64)
+        bounds_sides = (brush_firsts[:, np.newaxis] + np.arange(6)).reshape(-1)
+        normals[bounds_sides] = np.tile(BOUNDS_NORMALS, (len(brush_indices), 1))
+        distances[bounds_sides] = np.stack([
+            maxs[:, 0], -mins[:, 0],
+            maxs[:, 1], -mins[:, 1],
+            maxs[:, 2], -mins[:, 2]], axis=1).reshape(-1)
+        # plane sides
+        offsets = ragged_arange(side_offsets, num_plane_offsets)
+        plane_indices = self.first_brush_plane + offsets - self.side_plane_offsets[offsets]
+        plane_sides = ragged_arange(brush_firsts + 6, num_plane_offsets)
+        normals[plane_sides] = self.plane_normals[plane_indices]
+        distances[plane_sides] = self.plane_distances[plane_indices]
+        # shaders & texture vectors
+        sides = ragged_arange(self.brush_indices[brush_indices] * 6 + side_offsets, num_sides)
+        shaders = [self.shaders[i] for i in self.side_texture_data[sides].tolist()]
+        texture_rows = np.concatenate([
+            self.side_texture_axes[sides].reshape(-1, 6),
+            self.side_texture_offsets[sides]], axis=1)
+        unique_rows, texture_indices = np.unique(texture_rows, axis=0, return_inverse=True)
+        texture_vectors = [  # 1 interned TextureVector per unique row
+            abe.texture.intern(abe.TextureVector(
+                side_class.ProjectionAxisClass(row[0:3], row[6]),
+                side_class.ProjectionAxisClass(row[3:6], row[7])))
+            for row in unique_rows.tolist()]
+        # objects
+        sides = [
+            side_class(
+                common.Plane(ass.vector.vec3(*normal), distance),
+                shader, texture_vectors[texture_index])
+            for normal, distance, shader, texture_index in zip(
+                normals.tolist(), distances.tolist(), shaders, texture_indices.reshape(-1).tolist())]
+        return [
+            abe.Brush(sides[first:first + count])
+            for first, count in zip(brush_firsts.tolist(), num_sides.tolist())]
+
+    @classmethod
+    def from_bsp(cls, bsp) -> RbspArrays:
+        out = cls()
+
+        def gather(lump, *attrs: str, dtype=np.int64) -> List[np.ndarray]:
+            get = operator.attrgetter(*attrs)
+            rows = np.array(list(map(get, lump)), dtype=dtype).reshape(-1, len(attrs))
+            return [rows[:, i].copy() for i in range(len(attrs))]
+
+        def vec3s(lump, attr: str) -> np.ndarray:
+            get = operator.attrgetter(attr)
+            return np.array([tuple(get(entry)) for entry in lump], dtype=np.float64).reshape(-1, 3)
+
+        # CM_BRUSHES
+        brushes = bsp.CM_BRUSHES
+        out.brush_origins = vec3s(brushes, "origin")
+        out.brush_extents = vec3s(brushes, "extents")
+        out.brush_num_plane_offsets, out.brush_side_offsets, out.brush_indices = gather(
+            brushes, "num_plane_offsets", "brush_side_offset", "index")
+        # brush sides
+        out.side_plane_offsets = np.array(list(bsp.CM_BRUSH_SIDE_PLANE_OFFSETS), dtype=np.int64)
+        out.side_texture_data, = gather(bsp.CM_BRUSH_SIDE_PROPERTIES, "texture_data")
+        texture_vectors = bsp.CM_BRUSH_SIDE_TEXTURE_VECTORS
+        out.side_texture_axes = np.stack([
+            vec3s(texture_vectors, "s.axis"),
+            vec3s(texture_vectors, "t.axis")], axis=1)
+        out.side_texture_offsets = np.stack(
+            gather(texture_vectors, "s.offset", "t.offset", dtype=np.float64), axis=1)
+        out.first_brush_plane = bsp.CM_GRID.first_brush_plane
+        # PLANES
+        planes = [(tuple(normal), distance) for normal, distance in bsp.PLANES]
+        out.plane_normals = np.array([normal for normal, distance in planes], dtype=np.float64).reshape(-1, 3)
+        out.plane_distances = np.array([distance for normal, distance in planes], dtype=np.float64)
+        # TEXTURE_DATA
+        out.shaders = [
+            normalise_shader(bsp.TEXTURE_DATA_STRING_DATA[texture_data.name_index])
+            for texture_data in bsp.TEXTURE_DATA]
+        # CM_GEO_SETS & CM_PRIMITIVES
+        geo_sets = gather(bsp.CM_GEO_SETS, "num_primitives", "primitive.type", "primitive.index")
+        out.geo_set_num_primitives, out.geo_set_primitive_types, out.geo_set_primitive_indices = geo_sets
+        out.primitive_types, out.primitive_indices = gather(bsp.CM_PRIMITIVES, "type", "index")
+        return out
 
+
+worker_arrays: RbspArrays = None
+# ^ set in each worker process by iter_brush_chunks
+
+
+def set_worker_arrays(arrays: RbspArrays):
+    global worker_arrays
+    worker_arrays = arrays
+
+
+def decompile_brushes(brush_indices: np.ndarray, side_class: type) -> List[abe.Brush]:
+    """process pool worker; see iter_brush_chunks"""
+    return worker_arrays.brushes(brush_indices, side_class)
+
+
+def iter_brush_chunks(arrays: RbspArrays, chunks: List[np.ndarray], processes: int = None,
+                      side_class: type = map220.BrushSide) -> Iterator[List[abe.Brush]]:
+    """yield arrays.brushes(brush_indices) for each chunk, in order"""
+    # NOTE: at most 2 chunks per process are decompiled ahead of the consumer
+    processes = os.cpu_count() if processes is None else processes
+    if processes <= 1 or len(chunks) <= 1:
+        for brush_indices in chunks:
+            yield arrays.brushes(brush_indices, side_class)
+        return
+    with ProcessPoolExecutor(processes, initializer=set_worker_arrays, initargs=(arrays,)) as executor:
+        pending = collections.deque()
+        try:
+            for brush_indices in chunks:
+                pending.append(executor.submit(decompile_brushes, brush_indices, side_class))
+                if len(pending) >= processes * 2:
+                    yield pending.popleft().result()
+            while len(pending) != 0:
+                yield pending.popleft().result()
+        finally:  # e.g. interrupted; don't wait on chunks no one will read
+            for future in pending:
+                future.cancel()
+
+
+def brush_entities(bsp) -> List[Dict[str, str]]:
+    """worldspawn & all brush entities (entity lump & .ent files)"""
     bsp_worldspawn = bsp.ENTITIES[0]
     assert bsp_worldspawn.get("classname", "") == "worldspawn"
-    abe_worldspawn = decompile_brush_entity(bsp, bsp_worldspawn)
-    out.entities.append(abe_worldspawn)
-
+    out = [bsp_worldspawn]
     # NOTE: currently only brush entities
     # -- skipping point entities to save on filesize
-
     # *.0000.bsp_lump brush entities
-    out.entities.extend([
-        decompile_brush_entity(bsp, bsp_entity)
+    out.extend(
+        bsp_entity
         for bsp_entity in bsp.ENTITIES
-        if bsp_entity.get("model", "").startswith("*")])
-
+        if bsp_entity.get("model", "").startswith("*"))
     # *.ent brush entities
     for ent_file in ("env", "fx", "script", "snd", "spawn"):
-        out.entities.extend([
-            decompile_brush_entity(bsp, bsp_entity)
+        out.extend(
+            bsp_entity
             for bsp_entity in getattr(bsp, f"ENTITIES_{ent_file}")
-            if bsp_entity.get("model", "").startswith("*")])
-
+            if bsp_entity.get("model", "").startswith("*"))
     return out
+
+
+def entity_chunks(bsp, arrays: RbspArrays, chunk_size: int = 1024) -> Iterator[Tuple[abe.Entity, List[np.ndarray]]]:
+    """yield (entity w/o brushes, [brush_indices]) for each brush entity"""
+    for bsp_entity in brush_entities(bsp):
+        abe_entity = abe.Entity(**bsp_entity)
+        brush_indices = arrays.geosets_brush_indices(*geo_set_range(bsp, abe_entity))
+        yield abe_entity, [
+            brush_indices[first:first + chunk_size]
+            for first in range(0, len(brush_indices), chunk_size)]
+
+
+def decompile_map(bsp, processes: int = None, chunk_size: int = 1024) -> abe.Valve220Map:
+    """decompile brush entities; brushes are split into chunks across multiple processes"""
+    # NOTE: processes=1 decompiles in this process
+    # NOTE: holds every brush in memory; see decompile_to_file for large maps
+    base_filename = os.path.splitext(bsp.filename)[0]
+    arrays = RbspArrays.from_bsp(bsp)
+    abe_entities, chunks = list(), list()  # [(entity_index, brush_indices)]
+    for abe_entity, brush_chunks in entity_chunks(bsp, arrays, chunk_size):
+        chunks.extend((len(abe_entities), brush_indices) for brush_indices in brush_chunks)
+        abe_entities.append(abe_entity)
+    results = iter_brush_chunks(arrays, [brush_indices for i, brush_indices in chunks], processes)
+    for (i, _), brushes in zip(chunks, results):
+        abe_entities[i].brushes.extend(brushes)
+    return abe.Valve220Map.from_entities(f"{base_filename}.map", abe_entities)
+
+
+def decompile_to_file(bsp, filepath: str = None, processes: int = None, chunk_size: int = 1024) -> str:
+    """decompile_map, writing each entity & brush to a Valve 220 .map file as soon as it's decompiled"""
+    # NOTE: only a few chunks of brushes are held in memory at a time
+    # NOTE: open braces are closed if interrupted (e.g. KeyboardInterrupt), so partial output still loads
+    # -- brushes are written whole; the last entity may be missing brushes
+    if filepath is None:
+        filepath = f"{os.path.splitext(bsp.filename)[0]}.map"
+    arrays = RbspArrays.from_bsp(bsp)
+    entities = list(entity_chunks(bsp, arrays, chunk_size))
+    results = iter_brush_chunks(
+        arrays, [brush_indices for abe_entity, chunks in entities for brush_indices in chunks], processes)
+    with open(filepath, "w", newline="\n") as map_file:
+        try:
+            separator = ""
+            for abe_entity, chunks in entities:
+                map_file.write("\n".join([
+                    f"{separator}{{",
+                    *[f'"{key}" "{value}"' for key, value in abe_entity.items()]]))
+                separator = "\n"
+                try:
+                    for _ in chunks:
+                        brushes = next(results)
+                        if len(brushes) != 0:  # 1 write per chunk
+                            map_file.write("\n" + "\n".join(map(str, brushes)))
+                finally:
+                    map_file.write("\n}")
+        finally:
+            results.close()  # stops & cancels process pool work
+    return filepath
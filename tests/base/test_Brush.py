@@ -0,0 +1,72 @@
+from abe import base
+from ass import physics
+from ass import vector
+
+import pytest
+
+
+def test_as_model():
+    bounds = physics.AABB.from_mins_maxs(
+        mins=vector.vec3(-3, -2, -1),
+        maxs=vector.vec3(4, 5, 6))
+    brush = base.Brush.from_bounds(bounds, "tools/toolsnodraw")
+    model = brush.as_model()
+    assert len(model.meshes) == 6
+    for mesh in model.meshes:
+        assert len(mesh.polygons) == 1
+        assert len(mesh.polygons[0].vertices) == 4
+
+
+def test_polygons():
+    bounds = physics.AABB.from_mins_maxs(
+        mins=vector.vec3(0, 0, 0),
+        maxs=vector.vec3(1, 1, 1))
+    brush = base.Brush.from_bounds(bounds)
+    polygons = brush.polygons()
+    assert len(polygons) == 6
+    assert all(polygon.shape == (4, 3) for polygon in polygons)
+
+
+def test_as_physics():
+    bounds = physics.AABB.from_mins_maxs(
+        mins=vector.vec3(-3, -2, -1),
+        maxs=vector.vec3(4, 5, 6))
+    brush = base.Brush.from_bounds(bounds)
+    # cut off the +X +Y edge
+    normal = vector.vec3(1, 1, 0).normalised()
+    brush.sides.append(base.BrushSide(physics.Plane(normal, vector.dot(normal, vector.vec3(3, 5, 0)))))
+    out = brush.as_physics()
+    assert len(out.axial_planes) == 6
+    assert out.other_planes == [brush.sides[-1].plane]
+    assert tuple(out.bounds.mins) == (-3, -2, -1)
+    assert tuple(out.bounds.maxs) == (4, 5, 6)
+
+
+def test_as_physics_invalid():
+    brush = base.Brush(base.Brush.from_bounds(physics.AABB.from_mins_maxs(
+        mins=vector.vec3(0, 0, 0),
+        maxs=vector.vec3(1, 1, 1))).sides[:5])  # not closed
+    with pytest.raises(ValueError):
+        brush.as_physics()
+    assert base.physics_brushes([brush]) == [None]
+
+
+class TracedSide(base.BrushSide):
+    """overrides .vertex_at, w/ a call to the default"""
+    calls = list()
+
+    def vertex_at(self, position, parent=None):
+        self.calls.append(tuple(position))
+        return super().vertex_at(position, parent)
+
+
+def test_vertex_at_override():
+    bounds = physics.AABB.from_mins_maxs(
+        mins=vector.vec3(0, 0, 0),
+        maxs=vector.vec3(1, 1, 1))
+    brush = base.Brush.from_bounds(bounds)
+    for side in brush.sides:
+        side.__class__ = TracedSide
+    model = brush.as_model()
+    assert len(TracedSide.calls) == 6 * 4
+    assert sum(len(mesh.polygons[0].vertices) for mesh in model.meshes) == 6 * 4
@@ -3,7 +3,7 @@ from abe import base
 import pytest
 
 
-# TODO: test __str__ (and maybe __repr__)
+# TODO: test __repr__
 
 
 inits = {
@@ -38,3 +38,28 @@ def test_init_invalid():
 def test_getitem():
     entity = base.Entity(classname="worldspawn")
     assert entity.classname == "worldspawn"
+
+
+def test_setitem_override():
+    entity = base.Entity(classname="light", origin="0 0 0")
+    entity["classname"] = "light_spot"
+    entity.origin = "0 0 64"
+    assert entity._keys == ["classname", "origin"]
+    assert str(entity) == '{\n"classname" "light_spot"\n"origin" "0 0 64"\n}'
+
+
+def test_delitem():
+    entity = base.Entity(classname="light", origin="0 0 0")
+    del entity["origin"]
+    assert entity._keys == ["classname"]
+    assert entity.get("origin") is None
+    with pytest.raises(AttributeError):
+        entity.origin
+    with pytest.raises(AssertionError):
+        del entity["origin"]
+
+
+def test_slots():
+    entity = base.Entity(classname="worldspawn")
+    assert not hasattr(entity, "__dict__")
+    assert entity.get("get") is None  # methods aren't keys
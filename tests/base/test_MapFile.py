@@ -0,0 +1,75 @@
+from abe import base
+from ass import physics
+from ass import vector
+
+import pytest
+
+
+def map_file() -> base.MapFile:
+    return base.MapFile.from_entities("test.map", [
+        base.Entity(classname="worldspawn"),
+        base.Entity(classname="light", targetname="lamp"),
+        base.Entity(classname="light", style="1"),
+        base.Entity(classname="info_player_start", origin="0 0 0")])
+
+
+def test_search():
+    test_map = map_file()
+    worldspawn, lamp, light, player_start = test_map.entities
+    assert test_map.search(classname="light") == [lamp, light]
+    assert test_map.search(classname="light", targetname="lamp") == [lamp]
+    assert test_map.search(classname="light", targetname="") == [light]
+    assert test_map.search(classname="func_door") == list()
+    assert len(test_map.search()) == 4
+
+
+def test_search_updates():
+    test_map = map_file()
+    worldspawn, lamp, light, player_start = test_map.entities
+    assert test_map.search(classname="light") == [lamp, light]  # builds index
+    lamp["classname"] = "light_spot"
+    assert test_map.search(classname="light") == [light]
+    assert test_map.search(classname="light_spot") == [lamp]
+    del light.style
+    assert test_map.search(style="1") == list()
+    new_light = base.Entity(classname="light")
+    test_map.entities.append(new_light)
+    assert test_map.search(classname="light") == [light, new_light]
+    test_map.entities.remove(light)
+    assert test_map.search(classname="light") == [new_light]
+    light["classname"] = "light"  # no longer in the map
+    assert test_map.search(classname="light") == [new_light]
+    assert light._watchers == tuple()
+
+
+def test_entities_by_classname():
+    test_map = map_file()
+    worldspawn, lamp, light, player_start = test_map.entities
+    assert test_map.entities_by_classname() == {
+        "info_player_start": [player_start],
+        "light": [lamp, light],
+        "worldspawn": [worldspawn]}
+
+
+@pytest.mark.parametrize("copy", [list, base.EntityList])
+def test_entities_setter(copy):
+    test_map = map_file()
+    test_map.entities = copy(test_map.entities[:2])
+    assert isinstance(test_map.entities, base.EntityList)
+    assert len(test_map.search(classname="light")) == 1
+
+
+def test_materials():
+    test_map = map_file()
+    worldspawn, lamp, light, player_start = test_map.entities
+    bounds = physics.AABB.from_mins_maxs(vector.vec3(-1, -1, -1), vector.vec3(1, 1, 1))
+    worldspawn.brushes = [base.Brush.from_bounds(bounds, "a"), base.Brush.from_bounds(bounds, "b")]
+    materials = test_map.materials
+    assert materials.counts() == {"a": 6, "b": 6}
+    assert materials["a"] == worldspawn.brushes[0].sides
+    assert materials.replace("a", "b") == 6
+    assert materials.counts() == {"b": 12}
+    assert {side.shader for brush in worldspawn.brushes for side in brush.sides} == {"b"}
+    assert materials.replace("missing", "b") == 0
+    test_map.entities = test_map.entities[:1]  # new entities, new table
+    assert test_map.materials is not materials
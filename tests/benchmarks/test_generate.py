@@ -0,0 +1,34 @@
+from abe.parse import id_software
+from abe.parse import infinity_ward
+from abe.parse import valve
+from benchmarks import generate
+
+import pytest
+
+
+map_classes = {
+    "quake": id_software.QuakeMap,
+    "valve220": valve.Valve220Map,
+    "cod4": infinity_ward.CoD4Map,
+    "vmf": valve.Vmf}
+
+
+@pytest.mark.parametrize("map_format", generate.formats)
+def test_generate(map_format: str):
+    kwargs = dict(entities=8, brushes=12, sides=10, brush_entities=2, entity_brushes=3)
+    lines = generate.generate(map_format, **kwargs)
+    assert lines == generate.generate(map_format, **kwargs)  # deterministic
+    assert lines != generate.generate(map_format, **kwargs, seed=1)
+    map_file = map_classes[map_format].from_lines(f"test.{generate.extensions[map_format]}", lines)
+    map_file.parse()
+    assert len(map_file.entities) == 1 + 8 + 2
+    assert [len(entity.brushes) for entity in map_file.entities] == [12, *[0] * 8, 3, 3]
+    assert all(len(brush.sides) == 10 for entity in map_file.entities for brush in entity.brushes)
+    assert None not in map_file.as_physics()  # every brush is solid
+
+
+def test_generate_invalid():
+    with pytest.raises(ValueError):
+        generate.generate("quake3")
+    with pytest.raises(ValueError):
+        generate.generate("quake", sides=4)
@@ -0,0 +1,15 @@
+"""shared .map test brushes"""
+
+
+box = [
+    "( -64 -64 {0} ) ( -64 -63 {0} ) ( -64 -64 {1} ) base/wall 0 0 0 1 1",
+    "( -64 -64 {0} ) ( -64 -64 {1} ) ( -63 -64 {0} ) base/wall 0 0 0 1 1",
+    "( -64 -64 {0} ) ( -63 -64 {0} ) ( -64 -63 {0} ) base/floor 0 0 0 1 1",
+    "( 64 64 {2} ) ( 64 65 {2} ) ( 65 64 {2} ) base/floor 0 0 0 1 1",
+    "( 64 64 {2} ) ( 65 64 {2} ) ( 64 64 {3} ) base/wall 0 0 0 1 1",
+    "( 64 64 {2} ) ( 64 64 {3} ) ( 64 65 {2} ) base/wall 0 0 0 1 1"]
+
+
+def brush(z: int = 0):
+    """32 unit tall box, starting at z - 16"""
+    return ["{", *[side.format(z - 16, z - 15, z + 16, z + 17) for side in box], "}"]
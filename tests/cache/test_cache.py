@@ -0,0 +1,205 @@
+import os
+
+from abe import cache
+from abe import store
+from abe.parse import id_software
+from abe.parse import infinity_ward
+from abe.parse.valve import map220
+from abe.parse.valve import vmf
+
+import pytest
+
+
+quake_map = """// test map
+{
+"classname" "worldspawn"
+{
+( 0 0 0 ) ( 0 1 0 ) ( 0 0 1 ) base/wall 0 0 0 1 1
+( 8 0 0 ) ( 8 0 1 ) ( 8 1 0 ) base/wall 0 0 0 1 1
+( 0 0 0 ) ( 0 0 1 ) ( 1 0 0 ) base/wall 0 0 0 1 1
+( 0 8 0 ) ( 1 8 0 ) ( 0 8 1 ) base/wall 0 0 0 1 1
+( 0 0 0 ) ( 1 0 0 ) ( 0 1 0 ) base/floor 0 0 0 1 1
+( 0 0 8 ) ( 0 1 8 ) ( 1 0 8 ) base/floor 0 0 0 1 1
+}
+}
+{
+"classname" "light"
+"origin" "4 4 4"
+}
+"""
+
+quake2_map = """{
+"classname" "worldspawn"
+{
+( 0 0 0 ) ( 0 1 0 ) ( 0 0 1 ) e1u1/wall 16.125 -0.5 0 0.125 1 0 1 0
+( 8.5 0 0 ) ( 8.5 0 1 ) ( 8.5 1 0 ) e1u1/wall 0 0 22.5 1 1 0 0 0
+( 0 0 0 ) ( 0 0 1 ) ( 1 0 0 ) e1u1/floor 0.125 0 0 1 1 0 8 0
+( 0 8 0 ) ( 1 8 0 ) ( 0 8 1 ) e1u1/wall 0 0 0 1 1
+( 0 0 0 ) ( 1 0 0 ) ( 0 1 0 ) e1u1/floor 0 0 0 1 1 0 8 0
+( 0 0 8 ) ( 0 1 8 ) ( 1 0 8 ) e1u1/floor 0 0 0 1 1 0 8 0
+}
+}
+"""
+
+cod4_map = """iwmap 4
+"000_Global" flags  active
+{
+"classname" "worldspawn"
+{
+( 0 0 0 ) ( 0 1 0 ) ( 0 0 1 ) caulk 64 64 0 0 0 0 lightmap_gray 16384 16384 0 0 0 0
+( 8 0 0 ) ( 8 0 1 ) ( 8 1 0 ) caulk 64 64 0.5 0 0 0 lightmap_gray 16384 16384 0 0 0 0
+( 0 0 0 ) ( 0 0 1 ) ( 1 0 0 ) caulk 64 64 0 0 0 0 lightmap_gray 16384 16384 0 0 0 0
+( 0 8 0 ) ( 1 8 0 ) ( 0 8 1 ) caulk 64 64 0 0 0 0 lightmap_gray 16384 16384 0 0 0 0
+( 0 0 0 ) ( 1 0 0 ) ( 0 1 0 ) caulk 64 64 0 0 0 0 lightmap_gray 16384 16384 0 0 0 0
+( 0 0 8 ) ( 0 1 8 ) ( 1 0 8 ) caulk 64 64 0 0 0 0 lightmap_gray 16384 16384 0 0 0 0
+}
+}
+"""
+
+valve_map = """{
+"classname" "worldspawn"
+"mapversion" "220"
+{
+( 0 0 0 ) ( 0 1 0 ) ( 0 0 1 ) tools/nodraw [ 0 1 0 8 ] [ 0 0 -1 0 ] 90 0.5 0.5
+( 8 0 0 ) ( 8 0 1 ) ( 8 1 0 ) tools/nodraw [ 0 1 0 0 ] [ 0 0 -1 0 ] 0 1 1
+( 0 0 0 ) ( 0 0 1 ) ( 1 0 0 ) tools/nodraw [ 1 0 0 0 ] [ 0 0 -1 0 ] 0 1 1
+( 0 8 0 ) ( 1 8 0 ) ( 0 8 1 ) tools/nodraw [ 1 0 0 0 ] [ 0 0 -1 0 ] 0 1 1
+( 0 0 0 ) ( 1 0 0 ) ( 0 1 0 ) tools/nodraw [ 1 0 0 0 ] [ 0 -1 0 0 ] 0 1 1
+( 0 0 8 ) ( 0 1 8 ) ( 1 0 8 ) tools/nodraw [ 1 0 0 0 ] [ 0 -1 0 0 ] 0 1 1
+}
+}
+"""
+
+valve_vmf = """versioninfo
+{
+\t"editorversion" "400"
+}
+world
+{
+\t"id" "1"
+\t"classname" "worldspawn"
+\tsolid
+\t{
+\t\t"id" "2"
+\t\tside
+\t\t{
+\t\t\t"id" "1"
+\t\t\t"plane" "(0 0 0) (0 1 0) (1 0 0)"
+\t\t\t"material" "TOOLS/TOOLSNODRAW"
+\t\t\t"uaxis" "[1 0 0 0] 0.25"
+\t\t\t"vaxis" "[0 -1 0 0] 0.25"
+\t\t\t"rotation" "0"
+\t\t}
+\t}
+}
+entity
+{
+\t"id" "3"
+\t"classname" "info_player_start"
+}
+"""
+
+
+@pytest.fixture
+def cache_folder(tmp_path):
+    cache.enable(str(tmp_path / "cache"))
+    yield tmp_path / "cache"
+    cache.disable()
+    cache.compact = False
+
+
+@pytest.mark.parametrize("map_class,text,filename", [
+    (id_software.QuakeMap, quake_map, "test.map"),
+    (id_software.QuakeMap, quake2_map, "test.map"),
+    (infinity_ward.CoD4Map, cod4_map, "test.map"),
+    (map220.Valve220Map, valve_map, "test.map"),
+    (vmf.Vmf, valve_vmf, "test.vmf")])
+def test_round_trip(cache_folder, tmp_path, map_class, text, filename):
+    filepath = str(tmp_path / filename)
+    with open(filepath, "w") as map_file:
+        map_file.write(text)
+    parsed = map_class(filepath)
+    parsed.parse()
+    assert len(os.listdir(cache_folder)) == 1
+    cached = map_class(filepath)
+    assert cache.load(cached)
+    assert cached.as_lines() == parsed.as_lines()
+    assert cached.comments == parsed.comments
+    assert cached.search(classname="worldspawn") == cached.entities[:1]
+
+
+def test_quake2_text(cache_folder, tmp_path):
+    """non-integer values & surface flags come back exactly"""
+    filepath = str(tmp_path / "test.map")
+    with open(filepath, "w") as map_file:
+        map_file.write(quake2_map)
+    parsed = id_software.QuakeMap(filepath)
+    parsed.parse()
+    cached = id_software.QuakeMap(filepath)
+    assert cache.load(cached)
+    sides = cached.entities[0].brushes[0].sides
+    assert not any(side.is_decoded for side in sides)
+    assert sides[0].extra_words == ("0", "1", "0")
+    assert sides[0].texture_vector.s.offset == 16.125
+    assert cached.as_lines() == parsed.as_lines()
+    assert cached.as_lines()[2:] == quake2_map.split("\n")[2:-1]
+
+
+def test_vmf_skips_nodes(cache_folder, tmp_path, monkeypatch):
+    """cache hits build entities & lazy sides from the cache, not from nodes"""
+    filepath = str(tmp_path / "test.vmf")
+    with open(filepath, "w") as map_file:
+        map_file.write(valve_vmf)
+    parsed = vmf.Vmf(filepath)
+    parsed.parse()
+    monkeypatch.setattr(vmf.Entity, "from_node", None)
+    monkeypatch.setattr(vmf.BrushSide, "from_line", None)
+    cached = vmf.Vmf(filepath)
+    cached.parse()
+    assert cached.first_of_type("world").first_of_type("solid") is None
+    side = cached.worldspawn.brushes[0].sides[0]
+    assert not side.is_decoded
+    assert side.shader == "TOOLS/TOOLSNODRAW"
+    assert cached.as_lines() == parsed.as_lines()
+
+
+def test_invalidate(cache_folder, tmp_path):
+    filepath = str(tmp_path / "test.map")
+    with open(filepath, "w") as map_file:
+        map_file.write(quake_map)
+    id_software.QuakeMap(filepath).parse()
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(id_software.QuakeMap(filepath))  # same content
+    with open(filepath, "w") as map_file:
+        map_file.write(quake_map.replace("4 4 4", "4 4 5"))
+    assert not cache.load(id_software.QuakeMap(filepath))
+    edited = id_software.QuakeMap(filepath)
+    edited.parse()
+    assert edited.entities[1].origin == "4 4 5"
+
+
+def test_compact(cache_folder, tmp_path):
+    filepath = str(tmp_path / "test.map")
+    with open(filepath, "w") as map_file:
+        map_file.write(quake_map)
+    parsed = id_software.QuakeMap(filepath)
+    parsed.parse()
+    cache.compact = True
+    cached = id_software.QuakeMap(filepath)
+    cached.parse()  # saved w/o BrushStore columns
+    assert isinstance(cached.entities[0].brushes, list)
+    os.remove(cache.entry_path(cached))
+    id_software.QuakeMap(filepath).parse()
+    cached = id_software.QuakeMap(filepath)
+    cached.parse()
+    assert isinstance(cached.entities[0].brushes, store.BrushList)
+    for side, expected in zip(cached.entities[0].brushes[0].sides, parsed.entities[0].brushes[0].sides):
+        assert side.plane == expected.plane
+        assert side.shader == expected.shader
+
+
+def test_from_lines(cache_folder):
+    in_memory = id_software.QuakeMap.from_lines("test.map", quake_map.split("\n"))
+    in_memory.parse()
+    assert not os.path.exists(cache_folder) or len(os.listdir(cache_folder)) == 0
@@ -0,0 +1,74 @@
+from abe import clip
+
+import numpy as np
+
+
+def cube_planes(mins, maxs):
+    normals, distances = list(), list()
+    for axis in range(3):
+        for sign, bound in [(+1, maxs), (-1, mins)]:
+            normal = [0, 0, 0]
+            normal[axis] = sign
+            normals.append(normal)
+            distances.append(sign * bound[axis])
+    return normals, distances
+
+
+def face_normal(polygon: np.ndarray) -> np.ndarray:
+    normal = np.cross(polygon[1] - polygon[0], polygon[2] - polygon[0])
+    return normal / np.linalg.norm(normal)
+
+
+def test_cube():
+    normals, distances = cube_planes((-1, -2, -3), (4, 5, 6))
+    positions, side_offsets = clip.brush_faces(normals, distances, [0, 6])
+    assert side_offsets.tolist() == [0, 4, 8, 12, 16, 20, 24]
+    assert positions.min(axis=0).tolist() == [-1, -2, -3]
+    assert positions.max(axis=0).tolist() == [4, 5, 6]
+    for i, normal in enumerate(normals):
+        polygon = positions[side_offsets[i]:side_offsets[i + 1]]
+        assert np.allclose(polygon @ normal, distances[i])
+        assert np.allclose(face_normal(polygon), normal)  # counter-clockwise
+
+
+def test_wedge():
+    normals, distances = cube_planes((0, 0, 0), (64, 64, 64))
+    normals.append([1 / np.sqrt(2), 0, 1 / np.sqrt(2)])  # slope
+    distances.append(64 / np.sqrt(2))
+    positions, side_offsets = clip.brush_faces(normals, distances, [0, 7])
+    counts = np.diff(side_offsets).tolist()
+    # +X & +Z faces are clipped away entirely
+    assert counts == [0, 4, 3, 3, 0, 4, 4]
+    slope = positions[side_offsets[6]:]
+    assert np.allclose(face_normal(slope), normals[6])
+
+
+def test_multiple_brushes():
+    normals_a, distances_a = cube_planes((0, 0, 0), (1, 1, 1))
+    normals_b, distances_b = cube_planes((2, 2, 2), (3, 3, 3))
+    bevel = [[0, 0, 1]], [5]  # does not touch the brush
+    normals = [*normals_a, *normals_b, *bevel[0]]
+    distances = [*distances_a, *distances_b, *bevel[1]]
+    positions, side_offsets = clip.brush_faces(normals, distances, [0, 6, 13])
+    assert np.diff(side_offsets).tolist() == [4] * 12 + [0]
+    assert positions[side_offsets[6]:].min() == 2
+
+
+def test_snap():
+    normals, distances = cube_planes((0, 0, 0), (1.0001, 1, 1))
+    positions, side_offsets = clip.brush_faces(normals, distances, [0, 6], snap=1 / 8)
+    assert positions.max() == 1
+
+
+def test_face_uvs():
+    normals, distances = cube_planes((0, 0, 0), (64, 64, 64))
+    positions, side_offsets = clip.brush_faces(normals, distances, [0, 6])
+    axes = np.array([[[0, 1, 0], [0, 0, -1]]] * 6, dtype=float)
+    offsets = np.array([[16, 0]] * 6, dtype=float)
+    scales = np.array([[0.5, 1]] * 6, dtype=float)
+    uvs = clip.face_uvs(positions, side_offsets, axes, offsets, scales)
+    assert uvs.shape == (24, 2)
+    expected = np.stack([
+        (positions[:, 1] + 16) * 0.5,
+        -positions[:, 2]], axis=1)
+    assert np.allclose(uvs, expected)
@@ -0,0 +1,121 @@
+import random
+from types import SimpleNamespace
+
+import abe
+from ass import vector
+import decompile_rbsp
+
+import numpy as np
+import pytest
+
+
+def fake_bsp(num_brushes: int = 64, seed: int = 0) -> SimpleNamespace:
+    """deterministic stand-in w/ just the lumps decompile_rbsp reads"""
+    rng = random.Random(seed)
+    brushes, num_offsets = list(), 0
+    for i in range(num_brushes):
+        num_plane_offsets = rng.randint(0, 3)
+        brushes.append(SimpleNamespace(
+            origin=vector.vec3(rng.randint(-512, 512), rng.randint(-512, 512), 0),
+            extents=vector.vec3(8, 16, 32),
+            num_plane_offsets=num_plane_offsets,
+            brush_side_offset=num_offsets,
+            index=i))
+        num_offsets += num_plane_offsets
+    num_sides = num_brushes * 6 + num_offsets
+    texture_vectors = [
+        SimpleNamespace(
+            s=SimpleNamespace(axis=vector.vec3(1, 0, 0), offset=rng.randint(0, 8)),
+            t=SimpleNamespace(axis=vector.vec3(0, 0, -1), offset=rng.randint(0, 8)))
+        for i in range(num_sides)]
+    # geo sets: single brushes, single non-brush primitives & runs of primitives
+    geo_sets, primitives = list(), list()
+    brush_index = 0
+    while brush_index < num_brushes:
+        if rng.random() < 0.5:
+            primitive = SimpleNamespace(type=rng.choice([0, 0, 1]), index=brush_index)
+            geo_sets.append(SimpleNamespace(num_primitives=1, primitive=primitive))
+            brush_index += 1
+        else:
+            count = rng.randint(2, 4)
+            primitive = SimpleNamespace(type=0, index=len(primitives))
+            geo_sets.append(SimpleNamespace(num_primitives=count, primitive=primitive))
+            primitives.extend(
+                SimpleNamespace(type=rng.choice([0, 0, 2]), index=min(brush_index + i, num_brushes - 1))
+                for i in range(count))
+            brush_index += count
+    half = len(geo_sets) // 2
+    return SimpleNamespace(
+        filename="fake.bsp",
+        CM_BRUSHES=brushes,
+        CM_BRUSH_SIDE_PLANE_OFFSETS=[rng.randint(0, 3) for i in range(num_offsets)],
+        CM_BRUSH_SIDE_PROPERTIES=[SimpleNamespace(texture_data=rng.randint(0, 3)) for i in range(num_sides)],
+        CM_BRUSH_SIDE_TEXTURE_VECTORS=texture_vectors,
+        CM_GEO_SETS=geo_sets,
+        CM_GRID=SimpleNamespace(first_brush_plane=2),
+        CM_GRID_CELLS=[
+            SimpleNamespace(first_geo_set=0, num_geo_sets=half),
+            SimpleNamespace(first_geo_set=half, num_geo_sets=len(geo_sets) - half)],
+        CM_PRIMITIVES=primitives,
+        MODELS=[0, 1],
+        PLANES=[(vector.vec3(0.6, 0.8, 0), float(rng.randint(-64, 64))) for i in range(num_offsets + 8)],
+        TEXTURE_DATA=[SimpleNamespace(name_index=i) for i in range(4)],
+        TEXTURE_DATA_STRING_DATA=["TOOLS\\ToolsClip", "world\\Dev\\A", "b", "C\\D"],
+        ENTITIES=[
+            {"classname": "worldspawn"},
+            {"classname": "func_brush", "model": "*1"},
+            {"classname": "light"}],
+        **{f"ENTITIES_{ent_file}": list() for ent_file in ("env", "fx", "script", "snd", "spawn")})
+
+
+def side_key(side: abe.BrushSide) -> tuple:
+    s, t = side.texture_vector
+    return (
+        tuple(side.plane.normal), side.plane.distance, side.shader,
+        tuple(s.axis), s.offset, tuple(t.axis), t.offset)
+
+
+def test_geosets_brush_indices():
+    bsp = fake_bsp()
+    arrays = decompile_rbsp.RbspArrays.from_bsp(bsp)
+    num_geo_sets = len(bsp.CM_GEO_SETS)
+    for start, end in [(0, num_geo_sets), (0, num_geo_sets // 2), (num_geo_sets // 2, num_geo_sets), (3, 3)]:
+        expected = sorted(decompile_rbsp.geosets_range_brush_indices(bsp, start, end))
+        assert arrays.geosets_brush_indices(start, end).tolist() == expected
+
+
+def test_brushes():
+    bsp = fake_bsp()
+    arrays = decompile_rbsp.RbspArrays.from_bsp(bsp)
+    brush_indices = np.arange(len(bsp.CM_BRUSHES))
+    brushes = arrays.brushes(brush_indices)
+    expected = [decompile_rbsp.decompile_brush(bsp, i) for i in brush_indices.tolist()]
+    assert [[side_key(side) for side in brush.sides] for brush in brushes] == [
+        [side_key(side) for side in brush.sides] for brush in expected]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_decompile_map(processes: int):
+    bsp = fake_bsp()
+    out = decompile_rbsp.decompile_map(bsp, processes, chunk_size=8)
+    expected = [
+        decompile_rbsp.decompile_brush_entity(bsp, bsp_entity)
+        for bsp_entity in bsp.ENTITIES[:2]]
+    assert [entity.items() for entity in out.entities] == [entity.items() for entity in expected]
+    assert all(len(entity.brushes) > 8 for entity in out.entities)  # multiple chunks
+    assert [[[side_key(side) for side in brush.sides] for brush in entity.brushes] for entity in out.entities] == [
+        [[side_key(side) for side in brush.sides] for brush in entity.brushes] for entity in expected]
+
+
+def test_decompile_to_file(tmp_path):
+    bsp = fake_bsp()
+    filepath = decompile_rbsp.decompile_to_file(bsp, str(tmp_path / "fake.map"), processes=1, chunk_size=8)
+    with open(filepath) as map_file:
+        text = map_file.read()
+    assert text == "\n".join(decompile_rbsp.decompile_map(bsp, processes=1).as_lines())
+    # round-trip
+    loaded = abe.Valve220Map(filepath)
+    loaded.parse()
+    expected = decompile_rbsp.decompile_map(bsp, processes=1)
+    assert [len(entity.brushes) for entity in loaded.entities] == [len(entity.brushes) for entity in expected.entities]
+    assert loaded.as_lines() == expected.as_lines()
@@ -0,0 +1,80 @@
+from abe import diff
+from abe.parse import id_software
+
+from tests.boxes import brush
+
+
+def quake_map(*entities):
+    lines = [line for entity in entities for line in entity]
+    out = id_software.QuakeMap.from_lines("test.map", lines)
+    out.parse()
+    return out
+
+
+def entity(*lines, brushes=()):
+    return ["{", *lines, *[line for brush_lines in brushes for line in brush_lines], "}"]
+
+
+worldspawn = entity('"classname" "worldspawn"', brushes=[brush(0), brush(64), brush(128)])
+player_start = entity('"classname" "info_player_start"', '"origin" "0 0 24"')
+light = entity('"classname" "light"', '"origin" "0 0 64"')
+
+
+def test_identical():
+    old = quake_map(worldspawn, player_start)
+    new = quake_map(worldspawn, player_start)
+    result = diff.compare(old, new)
+    assert not result
+    assert str(result) == ""
+
+
+def test_reordered():
+    reordered = entity('"classname" "worldspawn"', brushes=[brush(128), brush(0), brush(64)])
+    old = quake_map(worldspawn, player_start)
+    new = quake_map(player_start, reordered)
+    assert diff.MerkleTree(old).root == diff.MerkleTree(new).root
+    assert not diff.compare(old, new)
+
+
+def test_entities():
+    old = quake_map(worldspawn, player_start)
+    moved_start = entity('"classname" "info_player_start"', '"origin" "0 0 32"', '"angle" "90"')
+    new = quake_map(worldspawn, moved_start, light)
+    result = diff.compare(old, new)
+    assert result.added == [2]
+    assert result.removed == []
+    entity_diff, = result.modified
+    assert (entity_diff.old_index, entity_diff.new_index) == (1, 1)
+    assert entity_diff.changed_keys == {"origin": ("0 0 24", "0 0 32")}
+    assert entity_diff.added_keys == {"angle": "90"}
+    assert entity_diff.removed_keys == dict()
+    result = diff.compare(new, old)
+    assert result.removed == [2]
+
+
+def test_brushes():
+    old = quake_map(worldspawn)
+    stretched = brush(64)
+    stretched[-2] = stretched[-2].replace("64 ", "96 ", 1)  # 1 side moved
+    new = quake_map(entity('"classname" "worldspawn"', brushes=[brush(0), stretched, brush(512)]))
+    entity_diff, = diff.compare(old, new).modified
+    assert entity_diff.added_brushes == entity_diff.removed_brushes == []
+    stretched_diff, moved_diff = entity_diff.modified_brushes
+    assert (stretched_diff.old_index, stretched_diff.new_index) == (1, 1)
+    assert len(stretched_diff.added_sides) == len(stretched_diff.removed_sides) == 1
+    # NOTE: walls are shared, so moving up only changes the floor & ceiling
+    assert (moved_diff.old_index, moved_diff.new_index) == (2, 2)
+    assert len(moved_diff.added_sides) == len(moved_diff.removed_sides) == 2
+    # brushes w/o enough shared sides are added & removed
+    new = quake_map(entity('"classname" "worldspawn"', brushes=[brush(0), brush(64)]))
+    entity_diff, = diff.compare(old, new).modified
+    assert entity_diff.removed_brushes == [2]
+    assert entity_diff.modified_brushes == []
+
+
+def test_tree_reuse():
+    old = diff.MerkleTree(quake_map(worldspawn, player_start))
+    assert not diff.compare(old, quake_map(worldspawn, player_start))
+    result = diff.compare(old, quake_map(worldspawn, light))
+    assert result.old is old
+    assert (result.added, result.removed, result.modified) == ([1], [1], [])
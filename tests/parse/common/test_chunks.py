@@ -0,0 +1,38 @@
+from abe.parse import common
+
+import pytest
+
+
+text = "\n".join([
+    "// comment",
+    "{",
+    '"classname" "worldspawn"',
+    "{",
+    "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) __TB_empty 0 0 0 1 1",
+    "}",
+    "}",
+    "// entity 1",
+    "{",
+    '"classname" "info_player_start"',
+    "}",
+    "  {  ",
+    "}",
+    ""])
+
+
+def test_block_spans():
+    spans = common.block_spans(text)
+    assert len(spans) == 3
+    assert [text[start:end].strip()[0] for start, end in spans] == ["{"] * 3
+    assert [text[start:end].strip()[-1] for start, end in spans] == ["}"] * 3
+
+
+@pytest.mark.parametrize("num_chunks", [1, 2, 3, 8])
+def test_split_chunks(num_chunks: int):
+    chunks = common.split_chunks(text, num_chunks, first_line_no=10)
+    assert 1 <= len(chunks) <= max(num_chunks, 3)
+    assert "".join(chunk for line_no, chunk in chunks) == text
+    line_no = 10
+    for first_line_no, chunk in chunks:
+        assert first_line_no == line_no
+        line_no += chunk.count("\n")
@@ -0,0 +1,54 @@
+import re
+
+from abe.parse import common
+
+import pytest
+
+
+keyvalues = {
+    "basic": '"key" "value"',
+    "empty value": '"key" ""',
+    "tab": '"key"\t"value"',
+    "spaces": '"key with spaces" "value with spaces"',
+    "quoted value": r'"targetname" "door \"quoted\""'}
+
+
+@pytest.mark.parametrize("line", keyvalues.values(), ids=keyvalues.keys())
+def test_split_key_value(line: str):
+    """same groups as the key_value_pair regex"""
+    match = re.compile(common.key_value_pair).match(line)
+    assert match is not None
+    assert common.split_key_value(line) == match.groups()
+
+
+not_keyvalues = {
+    "no quotes": "key value",
+    "flags": '"000_Global" flags active',
+    "one quoted": '"key"'}
+
+
+@pytest.mark.parametrize("line", not_keyvalues.values(), ids=not_keyvalues.keys())
+def test_split_key_value_invalid(line: str):
+    assert common.split_key_value(line) is None
+
+
+lines = {
+    "blank": ("", []),
+    "open": ("{", [(0, "{", None)]),
+    "close": ("  }\n", [(0, "}", None)]),
+    "comment": ("// brush 0", [(0, "Comment", "// brush 0")]),
+    "keyvalue": ('"classname" "worldspawn"', [(0, "KeyValuePair", ("classname", "worldspawn"))]),
+    "brushside": (
+        "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) __TB_empty [ 1 0 0 0 ] [ 0 -1 0 0 ] 0 1 1",
+        [(0, "BrushSide", "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) __TB_empty [ 1 0 0 0 ] [ 0 -1 0 0 ] 0 1 1")]),
+    "unknown": ("iwmap 4", [(0, "Unknown", "iwmap 4")])}
+
+
+@pytest.mark.parametrize("line,expected", lines.values(), ids=lines.keys())
+def test_tokenise(line: str, expected):
+    assert list(common.tokenise([line])) == expected
+
+
+def test_tokenise_line_numbers():
+    tokens = list(common.tokenise(["{", "", "}"], first_line_no=4))
+    assert [line_no for line_no, kind, payload in tokens] == [4, 6]
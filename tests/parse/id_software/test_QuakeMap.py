@@ -0,0 +1,250 @@
+import io
+
+from abe import base
+from abe import spatial
+from abe.parse import common
+from abe.parse import id_software
+
+import pytest
+
+
+lines = [
+    "// Game: Quake",
+    "// entity 0",
+    "{",
+    '"classname" "worldspawn"',
+    "// brush 0",
+    "{",
+    "( -64 -64 -16 ) ( -64 -63 -16 ) ( -64 -64 -15 ) __TB_empty 0 0 0 1 1",
+    "( -64 -64 -16 ) ( -64 -64 -15 ) ( -63 -64 -16 ) __TB_empty 0 0 0 1 1",
+    "( -64 -64 -16 ) ( -63 -64 -16 ) ( -64 -63 -16 ) __TB_empty 0 0 0 1 1",
+    "( 64 64 16 ) ( 64 65 16 ) ( 65 64 16 ) __TB_empty 0 0 0 1 1",
+    "( 64 64 16 ) ( 65 64 16 ) ( 64 64 17 ) __TB_empty 0 0 0 1 1",
+    "( 64 64 16 ) ( 64 64 17 ) ( 64 65 16 ) __TB_empty 0.5 -2 90 0.25 1.5e+1",
+    "}",
+    "}",
+    "",
+    "// entity 1",
+    "{",
+    '"classname" "info_player_start"',
+    '"origin" "0 0 24"',
+    "}"]
+
+
+def test_parse():
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse()
+    assert len(quake_map.entities) == 2
+    worldspawn, player_start = quake_map.entities
+    assert worldspawn.classname == "worldspawn"
+    assert len(worldspawn.brushes) == 1
+    assert len(worldspawn.brushes[0].sides) == 6
+    assert player_start.origin == "0 0 24"
+    assert quake_map.comments == {
+        0: "// Game: Quake",
+        1: "// entity 0",
+        4: "// brush 0",
+        15: "// entity 1"}
+
+
+def test_parse_invalid():
+    quake_map = id_software.QuakeMap.from_lines("test.map", [
+        "{", "{", "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) __TB_empty 0 0", "}", "}"])
+    with pytest.raises(RuntimeError, match=r"#2: '\( 0 0 0 \) \( 0 1 0 \) \( 1 0 0 \) __TB_empty 0 0'"):
+        quake_map.parse()
+
+
+def test_surface_flags():
+    """trailing words (e.g. Quake 2 contents, flags & value) are kept"""
+    quake_map = id_software.QuakeMap.from_lines("test.map", [
+        "{", "{", "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) e1u1/floor 0 0 0 1 1 0 8 0", "}", "}"])
+    quake_map.parse()
+    side = quake_map.worldspawn.brushes[0].sides[0]
+    assert side.extra_words == ("0", "8", "0")
+    assert quake_map.as_lines()[2] == "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) e1u1/floor 0 0 0 1 1 0 8 0"
+    assert side.texture_vector.s.scale == 1
+    assert side.is_decoded
+    assert quake_map.as_lines()[2] == "( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) e1u1/floor 0 0 0 1 1 0 8 0"
+    side.texture_rotation = 90
+    assert quake_map.as_lines()[2] == "(0 0 0) (0 1 0) (1 0 0) e1u1/floor 0 0 90 1 1 0 8 0"
+
+
+@pytest.mark.parametrize("line", lines[6:12])
+def test_brushside_from_words(line: str):
+    """from_words matches the regex parser"""
+    expected = id_software.BrushSide.from_string(line)
+    words = line.translate(common.unbracket).split()
+    side = id_software.BrushSide.from_words(words)
+    assert side.plane == expected.plane
+    assert side.shader == expected.shader
+    assert side.texture_rotation == expected.texture_rotation
+    assert [tuple(axis) for axis in side.texture_vector] == [
+        tuple(axis) for axis in expected.texture_vector]
+
+
+def test_lazy_sides():
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse()
+    sides = quake_map.worldspawn.brushes[0].sides
+    assert not any(side.is_decoded for side in sides)
+    # untouched & retextured sides are written w/ their original line
+    sides[4].shader = "base/wall"
+    assert quake_map.as_lines()[7] == "( 64 64 16 ) ( 65 64 16 ) ( 64 64 17 ) base/wall 0 0 0 1 1"
+    assert quake_map.as_lines()[8] == lines[11]
+    # first access decodes every field
+    assert sides[5].texture_vector.t.scale == 15
+    assert sides[5].is_decoded
+    # decoded sides are only written from their fields once changed
+    assert quake_map.as_lines()[8] == lines[11]
+    sides[5].texture_vector = sides[5].texture_vector.copy()
+    assert quake_map.as_lines()[8] == "(64 64 16) (64 64 17) (64 65 16) __TB_empty 0.5 -2 90 0.25 15"
+    # setting a field decodes the rest first
+    sides[0].texture_rotation = 45
+    assert sides[0].is_decoded
+    assert sides[0].plane == id_software.BrushSide.from_string(lines[6]).plane
+    assert quake_map.as_lines()[3] == "(-64 -64 -16) (-64 -63 -16) (-64 -64 -15) __TB_empty 0 0 45 1 1"
+
+
+def test_verbatim_layout():
+    """undecoded sides keep their spacing, even w/ a new shader or extra words"""
+    line = "(-64 -64 -16)  ( -64 -63 -16 ) (-64 -64 -15)\tbase/a   0 0 0 1 1"
+    side = id_software.BrushSide.from_line(line)
+    assert str(side) == line
+    side.shader = "base/b"
+    assert str(side) == "(-64 -64 -16)  ( -64 -63 -16 ) (-64 -64 -15)\tbase/b   0 0 0 1 1"
+    side.extra_words = ("0", "8", "0")
+    assert str(side) == "(-64 -64 -16)  ( -64 -63 -16 ) (-64 -64 -15)\tbase/b   0 0 0 1 1 0 8 0"
+
+
+def test_lazy_invalid():
+    side = id_software.BrushSide.from_words("0 0 0 0 1 0 1 0 0 __TB_empty 0 0 zero 1 1".split())
+    with pytest.raises(ValueError):
+        side.texture_rotation
+
+
+def test_parse_parallel():
+    expected = id_software.QuakeMap.from_lines("test.map", lines)
+    expected.parse()
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse_parallel(processes=2)
+    assert quake_map.comments == expected.comments
+    assert len(quake_map.entities) == len(expected.entities)
+    for entity, expected_entity in zip(quake_map.entities, expected.entities):
+        assert entity._keys == expected_entity._keys
+        assert len(entity.brushes) == len(expected_entity.brushes)
+
+
+def test_iter_entities():
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    entities = quake_map.iter_entities()
+    worldspawn = next(entities)
+    assert worldspawn.classname == "worldspawn"
+    assert len(worldspawn.brushes[0].sides) == 6
+    player_start = next(entities)
+    assert player_start.origin == "0 0 24"
+    assert len(list(entities)) == 0
+    assert not quake_map.is_parsed
+    assert quake_map.entities == list()
+    assert quake_map.comments == dict()
+
+
+@pytest.mark.parametrize("method", ["parse", "parse_parallel", "parse_entities"])
+def test_iter_entities_then_parse(method: str):
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    next(quake_map.iter_entities())  # partial iteration
+    getattr(quake_map, method)()
+    assert [entity.classname for entity in quake_map.entities] == ["worldspawn", "info_player_start"]
+    assert len(quake_map.comments) == 4
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    list(quake_map.iter_entities())
+    assert len(quake_map.search(classname="worldspawn")) == 1
+
+
+def test_parse_entities():
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse_entities()
+    worldspawn, player_start = quake_map.entities
+    assert worldspawn.classname == "worldspawn"
+    assert player_start.origin == "0 0 24"
+    assert len(worldspawn.brushes) == 0
+    assert quake_map.brush_spans == {worldspawn: [(5, 12)], player_start: list()}
+    assert 4 in quake_map.comments
+    quake_map.load_brushes()
+    assert len(worldspawn.brushes) == 1
+    assert len(worldspawn.brushes[0].sides) == 6
+    assert quake_map.brush_spans == dict()
+
+
+def test_parse_entities_then_edit():
+    """skipped brushes stay w/ their entity if .entities changes"""
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse_entities()
+    worldspawn, player_start = quake_map.entities
+    quake_map.entities.insert(0, base.Entity(classname="light"))
+    quake_map.load_brushes()
+    assert len(worldspawn.brushes) == 1
+    assert [len(entity.brushes) for entity in quake_map.entities] == [0, 1, 0]
+
+
+def test_parse_entities_then_physics():
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse_entities()
+    assert len(quake_map.as_physics()) == 1
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    quake_map.parse_entities()
+    assert len(spatial.BVH.from_map(quake_map)) == 2  # brush & player start
+
+
+@pytest.mark.parametrize("junk,error,match", [
+    ("junk", RuntimeError, "#14: 'junk'"),
+    ('"origin" "0 0 0"', AssertionError, "keyvalues outside of entity"),
+    ("( 0 0 0 ) ( 0 1 0 ) ( 1 0 0 ) __TB_empty 0 0 0 1 1", AssertionError, "brushside outside of brush")])
+@pytest.mark.parametrize("method", ["parse", "parse_entities"])
+def test_parse_junk(junk: str, error: type, match: str, method: str):
+    """.parse_entities() rejects the same files as .parse()"""
+    quake_map = id_software.QuakeMap.from_lines("test.map", [*lines[:14], junk, *lines[14:]])
+    with pytest.raises(error, match=match):
+        getattr(quake_map, method)()
+
+
+def test_write():
+    quake_map = id_software.QuakeMap.from_lines("test.map", lines)
+    out = io.StringIO()
+    quake_map.write(out, buffer_size=16)
+    assert out.getvalue().encode() == quake_map.as_bytes()
+    reparsed = id_software.QuakeMap.from_lines("test.map", out.getvalue().split("\n"))
+    reparsed.parse()
+    for entity, expected_entity in zip(reparsed.entities, quake_map.entities):
+        assert entity._keys == expected_entity._keys
+        for brush, expected_brush in zip(entity.brushes, expected_entity.brushes):
+            assert [str(side) for side in brush.sides] == [str(side) for side in expected_brush.sides]
+
+
+def test_reparse(tmp_path):
+    filepath = str(tmp_path / "test.map")
+    with open(filepath, "w") as map_file:
+        map_file.write("\n".join(lines))
+    quake_map = id_software.QuakeMap(filepath)
+    quake_map.reparse()
+    worldspawn, player_start = quake_map.entities
+    # edit the player start & move it above the worldspawn
+    edited = ["// new comment", *lines[15:19], '"angle" "90"', "}", *lines[:15]]
+    with open(filepath, "w") as map_file:
+        map_file.write("\n".join(edited))
+    quake_map.reparse()
+    assert quake_map.entities[1] is worldspawn
+    assert quake_map.entities[0] is not player_start
+    assert quake_map.entities[0].angle == "90"
+    expected = id_software.QuakeMap.from_lines("test.map", edited)
+    expected.parse()
+    assert quake_map.comments == expected.comments
+    assert quake_map.as_lines() == expected.as_lines()
+
+
+def test_reparse_junk(tmp_path):
+    filepath = str(tmp_path / "test.map")
+    with open(filepath, "w") as map_file:
+        map_file.write("\n".join([*lines[:14], "junk", *lines[14:]]))
+    quake_map = id_software.QuakeMap(filepath)
+    with pytest.raises(RuntimeError, match="#14: 'junk'"):
+        quake_map.reparse()
@@ -0,0 +1,94 @@
+from abe.parse import infinity_ward
+
+import pytest
+
+
+side = "( {} ) caulk 64 64 0 0 0 0 lightmap_gray 16384 16384 0 0 0 0"
+lines = [
+    "iwmap 4",
+    '"000_Global" flags  active',
+    '"The Map" flags ',
+    "// entity 0",
+    "{",
+    '"classname" "worldspawn"',
+    "// brush 0",
+    "{",
+    side.format("64 64 16 ) ( 64 65 16 ) ( 65 64 16"),
+    side.format("-64 -64 -16 ) ( -64 -63 -16 ) ( -64 -64 -15"),
+    side.format("-64 -64 -16 ) ( -64 -64 -15 ) ( -63 -64 -16"),
+    side.format("-64 -64 -16 ) ( -63 -64 -16 ) ( -64 -63 -16"),
+    side.format("64 64 16 ) ( 65 64 16 ) ( 64 64 17"),
+    side.format("64 64 16 ) ( 64 64 17 ) ( 64 65 16"),
+    "}",
+    "}",
+    "// entity 1",
+    "{",
+    '"origin" "0 0 0"',
+    '"classname" "info_player_start"',
+    "}"]
+
+
+def test_parse():
+    cod4_map = infinity_ward.CoD4Map.from_lines("test.map", lines)
+    cod4_map.parse()
+    worldspawn, player_start = cod4_map.entities
+    assert worldspawn.classname == "worldspawn"
+    assert player_start.origin == "0 0 0"
+    assert len(worldspawn.brushes[0].sides) == 6
+    assert worldspawn.brushes[0].sides[0].lightmap == "lightmap_gray"
+    # NOTE: line numbers start after the header
+    assert cod4_map.comments == {2: "// entity 0", 5: "// brush 0", 15: "// entity 1"}
+    assert cod4_map.as_lines()[0] == "iwmap 4"
+
+
+@pytest.mark.parametrize("method", ["parse", "parse_parallel", "parse_entities"])
+def test_parse_methods(method: str):
+    expected = infinity_ward.CoD4Map.from_lines("test.map", lines)
+    expected.parse()
+    cod4_map = infinity_ward.CoD4Map.from_lines("test.map", lines)
+    list(cod4_map.iter_entities())
+    if method == "parse_parallel":
+        cod4_map.parse_parallel(processes=1)
+    else:
+        getattr(cod4_map, method)()
+    assert cod4_map.comments == expected.comments
+    assert cod4_map.as_lines() == expected.as_lines()
+
+
+def test_bad_header():
+    cod4_map = infinity_ward.CoD4Map.from_lines("test.map", lines[1:])
+    with pytest.raises(AssertionError):
+        cod4_map.parse()
+
+
+def test_reparse(tmp_path):
+    filepath = str(tmp_path / "test.map")
+    with open(filepath, "w") as map_file:
+        map_file.write("\n".join(lines))
+    cod4_map = infinity_ward.CoD4Map(filepath)
+    cod4_map.reparse()
+    worldspawn = cod4_map.worldspawn
+    edited = [*lines[:-1], '"angle" "90"', "}"]
+    with open(filepath, "w") as map_file:
+        map_file.write("\n".join(edited))
+    cod4_map.reparse()
+    assert cod4_map.worldspawn is worldspawn
+    assert cod4_map.entities[1].angle == "90"
+    expected = infinity_ward.CoD4Map.from_lines("test.map", edited)
+    expected.parse()
+    assert cod4_map.comments == expected.comments
+    assert cod4_map.as_lines() == expected.as_lines()
+
+
+def test_as_model():
+    cod4_map = infinity_ward.CoD4Map.from_lines("test.map", lines)
+    cod4_map.parse()
+    brush = cod4_map.worldspawn.brushes[0]
+    assert brush.sides[0].texture_vector is None
+    model = brush.as_model()
+    assert len(model.meshes) == 6
+    assert all(mesh.material.name == "caulk" for mesh in model.meshes)
+    # NOTE: projections aren't decoded to uvs yet
+    vertices = [vertex for mesh in model.meshes for vertex in mesh.polygons[0].vertices]
+    assert len(vertices) == 6 * 4
+    assert all(tuple(vertex.uv[0]) == (0, 0) for vertex in vertices)
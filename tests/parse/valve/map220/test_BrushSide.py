@@ -0,0 +1,39 @@
+from abe.parse.valve import map220
+
+
+line = " ".join([
+    "( -64 -64 -16 ) ( -64 -63 -16 ) ( -64 -64 -15 ) __TB_empty",
+    "[ 0 -1 0 0.5 ] [ 0 0 -1 -2 ] 90 0.25 1.5"])
+
+
+def test_str():
+    side = map220.BrushSide.from_string(line)
+    # untouched sides reuse their words
+    assert str(side) == " ".join([
+        "(-64 -64 -16) (-64 -63 -16) (-64 -64 -15) __TB_empty",
+        "[ 0 -1 0 0.5 ] [ 0 0 -1 -2 ] 90 0.25 1.5"])
+    side.decode()
+    assert str(side) == " ".join([
+        "(-64 -64 -16) (-64 -63 -16) (-64 -64 -15) __TB_empty",
+        "[ 0 -1 0 0.5 ] [ 0 0 -1 -2 ] 90 0.25 1.5"])
+    side.texture_rotation = 45.5
+    assert str(side).endswith("] 45.5 0.25 1.5")
+
+
+def test_edit_undecoded():
+    side = map220.BrushSide.from_string(line)
+    side.texture_rotation = 0
+    assert str(side) == " ".join([
+        "(-64 -64 -16) (-64 -63 -16) (-64 -64 -15) __TB_empty",
+        "[ 0 -1 0 0.5 ] [ 0 0 -1 -2 ] 0 0.25 1.5"])
+
+
+def test_projection_axis_class():
+    class ProjectionAxis(map220.ProjectionAxis):
+        pass
+
+    class BrushSide(map220.BrushSide):
+        ProjectionAxisClass = ProjectionAxis
+
+    side = BrushSide.from_string(line)
+    assert all(type(axis) is ProjectionAxis for axis in side.texture_vector)
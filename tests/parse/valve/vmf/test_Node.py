@@ -0,0 +1,86 @@
+from abe.parse.valve import vmf
+
+import pytest
+
+
+def test_getitem():
+    node = vmf.Node("entity")
+    node.key_values.extend([("a", "1"), ("b", "2"), ("a", "3")])
+    assert node["a"] == "3"  # last occurence
+    assert node["b"] == "2"
+    assert node.get("c") is None
+    assert node.get("c", "4") == "4"
+    with pytest.raises(KeyError):
+        node["c"]
+    assert node["a"] == dict(node.key_values)["a"]
+
+
+def test_setitem():
+    node = vmf.Node("entity")
+    node["a"] = "1"
+    node["b"] = "2"
+    node["a"] = "3"  # override
+    assert node.key_values == [("a", "3"), ("b", "2")]
+    node.key_values.append(("a", "4"))
+    assert node["a"] == "4"
+    node["a"] = "5"  # override last occurence
+    assert node.key_values == [("a", "3"), ("b", "2"), ("a", "5")]
+    assert node.get_all("a") == ["3", "5"]
+
+
+def test_delitem():
+    node = vmf.Node("entity")
+    node.update({"a": "1", "b": "2", "c": "3"})
+    del node["b"]
+    assert node.key_values == [("a", "1"), ("c", "3")]
+    assert node["c"] == "3"
+    with pytest.raises(KeyError):
+        node["b"]
+
+
+def test_list_edits():
+    """index stays valid after direct edits to key_values"""
+    node = vmf.Node("entity")
+    node.key_values = [("a", "1"), ("b", "2")]
+    assert isinstance(node.key_values, vmf.KeyValues)
+    assert node["b"] == "2"
+    node.key_values.insert(0, ("b", "0"))
+    assert node["b"] == "2"
+    node.key_values.pop()
+    assert node["b"] == "0"
+    node.key_values[0] = ("c", "3")
+    assert node.get("b") is None
+    assert node["c"] == "3"
+    node.key_values += [("c", "4")]
+    assert node["c"] == "4"
+    node.key_values.clear()
+    assert node.get("a") is None
+
+
+def test_nodes_by_type():
+    parent = vmf.Node("world")
+    solids = [vmf.Node("solid") for i in range(3)]
+    group = vmf.Node("group")
+    parent.nodes = [solids[0], group, solids[1]]
+    assert isinstance(parent.nodes, vmf.Nodes)
+    assert parent.nodes_by_type() == {"group": [group], "solid": solids[:2]}
+    parent.nodes.append(solids[2])
+    assert parent.nodes_by_type()["solid"] == solids
+    parent.nodes.remove(group)
+    assert "group" not in parent.nodes_by_type()
+    parent.nodes.pop(0)
+    assert parent.nodes_by_type()["solid"] == solids[1:]
+    parent.nodes.insert(0, group)
+    assert parent.nodes_by_type() == {"group": [group], "solid": solids[1:]}
+
+
+def test_first_of_type():
+    parent = vmf.Node("solid")
+    assert parent.first_of_type("side") is None
+    assert parent.first_of_type("side", "default") == "default"
+    sides = [vmf.Node("side") for i in range(6)]
+    parent.nodes.extend(sides)
+    parent.nodes.append(vmf.Node("editor"))
+    assert parent.first_of_type("side") is sides[0]
+    assert list(parent.iter_type("side")) == sides
+    assert list(parent.iter_type("dispinfo")) == list()
@@ -1,9 +1,12 @@
 from abe import base
+from abe import store
 from abe.parse import common
 from abe.parse import valve
 from ass import physics
 from ass import vector
 
+import pytest
+
 
 def test_rebuild_nodes():
     vmf = valve.Vmf("untitiled.vmf")
@@ -102,3 +105,204 @@ def test_single_brush():
 
     # TODO: validate further
     # -- ids for solids & sides (NotImplemented)
+
+
+vmf_lines = [
+    "versioninfo",
+    "{",
+    '\t"editorversion" "400"',
+    "}",
+    "visgroups",
+    "{",
+    "\tvisgroup",
+    "\t{",
+    '\t\t"name" "outer"',
+    "\t\tvisgroup",
+    "\t\t{",
+    '\t\t\t"name" "inner"',
+    "\t\t}",
+    "\t}",
+    "}",
+    "world",
+    "{",
+    '\t"id" "1"',
+    '\t"classname" "worldspawn"',
+    "\tsolid",
+    "\t{",
+    '\t\t"id" "2"',
+    "\t\tside",
+    "\t\t{",
+    '\t\t\t"id" "1"',
+    '\t\t\t"plane" "(-64 64 64) (64 64 64) (64 -64 64)"',
+    '\t\t\t"material" "DEV/DEV_BLENDMEASURE"',
+    '\t\t\t"uaxis" "[1 0 0 0] 0.25"',
+    '\t\t\t"vaxis" "[0 -1 0 0] 0.25"',
+    '\t\t\t"rotation" "0"',
+    "\t\t}",
+    "\t}",
+    "}",
+    "entity",
+    "{",
+    '\t"id" "3"',
+    '\t"classname" "info_player_start"',
+    '\t"origin" "0 0 0"',
+    "}"]
+
+
+def test_parse():
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse()
+    assert [node.node_type for node in vmf.nodes] == [
+        "versioninfo", "visgroups", "world", "entity"]
+    visgroups = vmf.nodes[1]
+    assert len(visgroups.nodes) == 1
+    outer = visgroups.nodes[0]
+    assert outer["name"] == "outer"
+    assert len(outer.nodes) == 1
+    assert outer.nodes[0]["name"] == "inner"
+    world = vmf.nodes[2]
+    assert world.key_values == [("id", "1"), ("classname", "worldspawn")]
+    assert world.nodes[0].nodes[0]["material"] == "DEV/DEV_BLENDMEASURE"
+    # entities
+    assert len(vmf.entities) == 2
+    worldspawn, player_start = vmf.entities
+    assert worldspawn.classname == "worldspawn"
+    assert len(worldspawn.brushes) == 1
+    assert len(worldspawn.brushes[0].sides) == 1
+    side = worldspawn.brushes[0].sides[0]
+    assert side.shader == "DEV/DEV_BLENDMEASURE"
+    assert side.texture_vector.s.scale == 0.25
+    assert player_start.origin == "0 0 0"
+
+
+def test_parse_invalid():
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines[:-1])
+    with pytest.raises(AssertionError):
+        vmf.parse()
+
+
+def test_parse_parallel():
+    expected = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    expected.parse()
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse_parallel(processes=2)
+    assert [str(node) for node in vmf.nodes] == [str(node) for node in expected.nodes]
+    assert [entity.classname for entity in vmf.entities] == ["worldspawn", "info_player_start"]
+
+
+def test_write_unparsed():
+    expected = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    expected.parse()
+    assert valve.Vmf.from_lines("test.vmf", vmf_lines).as_lines() == expected.as_lines()
+    assert list(valve.Vmf.from_lines("test.vmf", vmf_lines).iter_lines()) == expected.as_lines()
+
+
+def test_iter_entities():
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    entities = list(vmf.iter_entities())
+    assert [entity.classname for entity in entities] == ["worldspawn", "info_player_start"]
+    assert len(entities[0].brushes[0].sides) == 1
+    assert not vmf.is_parsed
+    assert len(vmf.nodes) == 0
+    vmf.parse()  # rewinds
+    assert [entity.classname for entity in vmf.entities] == ["worldspawn", "info_player_start"]
+
+
+def test_parse_entities():
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse_entities()
+    assert [node.node_type for node in vmf.nodes] == [
+        "versioninfo", "visgroups", "world", "entity"]
+    assert len(vmf.nodes[2].nodes) == 0  # solid was skipped
+    worldspawn, player_start = vmf.entities
+    assert worldspawn["id"] == "1"
+    assert len(worldspawn.brushes) == 0
+    assert vmf.brush_spans == {worldspawn: [(19, 31)], player_start: list()}
+    vmf.load_brushes([worldspawn])
+    assert len(worldspawn.brushes) == 1
+    assert worldspawn.brushes[0].sides[0].shader == "DEV/DEV_BLENDMEASURE"
+
+
+def test_parse_entities_then_write():
+    expected = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse_entities()
+    assert vmf.as_lines() == expected.as_lines()
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse_entities()
+    assert vmf.as_bytes() == expected.as_bytes()
+
+
+def test_iter_lines():
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse()
+    lines = list(vmf.iter_lines())
+    assert len(vmf.nodes) == 4  # .nodes is not rebuilt
+    assert lines == vmf.as_lines()
+    assert "\n".join(lines) == "\n".join(map(str, vmf.nodes))
+
+
+def test_reparse(tmp_path):
+    filepath = str(tmp_path / "test.vmf")
+    with open(filepath, "w") as vmf_file:
+        vmf_file.write("\n".join(vmf_lines))
+    vmf = valve.Vmf(filepath)
+    vmf.reparse()
+    worldspawn, player_start = vmf.entities
+    visgroups = vmf.nodes[1]
+    with open(filepath, "w") as vmf_file:
+        vmf_file.write("\n".join(vmf_lines).replace('"origin" "0 0 0"', '"origin" "0 0 8"'))
+    vmf.reparse()
+    assert vmf.entities[0] is worldspawn
+    assert vmf.nodes[1] is visgroups
+    assert vmf.entities[1] is not player_start
+    assert vmf.entities[1].origin == "0 0 8"
+
+
+def test_reparse_junk(tmp_path):
+    filepath = str(tmp_path / "test.vmf")
+    with open(filepath, "w") as vmf_file:
+        vmf_file.write("\n".join(["Junk", *vmf_lines]))
+    with pytest.raises(RuntimeError, match="#0: 'Junk'"):
+        valve.Vmf(filepath).reparse()
+
+
+def test_compact():
+    """BrushStore views rebuild sides w/ .vmf ProjectionAxes"""
+    expected = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    expected.parse()
+    vmf = valve.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf.parse()
+    store.compact(vmf)
+    side = vmf.worldspawn.brushes[0].sides[0]
+    assert type(side) is valve.vmf.BrushSide
+    assert all(type(axis) is valve.vmf.ProjectionAxis for axis in side.texture_vector)
+    assert side.texture_vector == expected.worldspawn.brushes[0].sides[0].texture_vector
+    # NOTE: rebuilt planes are written from their normal & distance, not the original triangle
+    sides = [side for brush in vmf.worldspawn.brushes for side in brush.sides]
+    expected_sides = [side for brush in expected.worldspawn.brushes for side in brush.sides]
+    assert len(sides) == len(expected_sides)
+    for side, expected_side in zip(sides, expected_sides):
+        assert side.plane == expected_side.plane
+        node, expected_node = side.as_node(), expected_side.as_node()
+        for key in ("material", "uaxis", "vaxis", "rotation"):
+            assert str(node[key]) == expected_node[key]
+
+
+def test_lazy_sides():
+    lines = [
+        line.replace("(64 -64 64)", "(64 -64 64.0)")
+        for line in vmf_lines]
+    vmf = valve.Vmf.from_lines("test.vmf", lines)
+    vmf.parse()
+    side = vmf.worldspawn.brushes[0].sides[0]
+    assert not side.is_decoded
+    # untouched & retextured sides are written w/ their original values
+    side.shader = "DEV/DEV_MEASUREWALL01A"
+    assert '\t"plane" "(-64 64 64) (64 64 64) (64 -64 64.0)"' in vmf.as_lines()
+    assert '\t"material" "DEV/DEV_MEASUREWALL01A"' in vmf.as_lines()
+    # decoded sides are only written from their fields once changed
+    assert side.plane.normal.z == 1
+    assert '\t"plane" "(-64 64 64) (64 64 64) (64 -64 64.0)"' in vmf.as_lines()
+    side.texture_rotation = 90
+    assert '\t"rotation" "90"' in vmf.as_lines()
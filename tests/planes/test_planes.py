@@ -0,0 +1,95 @@
+from abe import planes
+from abe import store
+from abe.parse import id_software
+
+import numpy as np
+
+from tests.boxes import brush
+
+
+def stacked_boxes():
+    lines = ["{", '"classname" "worldspawn"', *brush(0), *brush(32), "}"]
+    out = id_software.QuakeMap.from_lines("test.map", lines)
+    out.parse()
+    return out
+
+
+def test_add():
+    table = planes.PlaneTable()
+    index = table.add((0, 0, 1), 16)
+    assert index % 2 == 0
+    assert table.add((0, 0, -1), -16) == table.opposite(index) == index + 1
+    assert table.add((0, 0, 1), 16.001) == index  # w/in DISTANCE_EPSILON
+    assert table.add((0.000001, 0, 0.9999999), 16) == index  # w/in NORMAL_EPSILON
+    assert table.add((0, 0, 1), 16.5) == index + 2
+    assert table.coplanar(index, index + 1)
+    assert not table.coplanar(index, index + 2)
+    assert len(table) == 4
+    assert table.find((0, 0, 1), 32) is None
+    assert tuple(table[index + 1].normal) == (0, 0, -1)
+
+
+def test_opposite_first():
+    table = planes.PlaneTable()
+    assert table.add((-1, 0, 0), 8) == 1
+    assert table.normals[0] == (1, 0, 0)
+    assert table.distances[0] == -8
+
+
+def test_bucket_edge():
+    table = planes.PlaneTable()
+    index = table.add((1, 0, 0), 0.4995)
+    assert table.add((1, 0, 0), 0.5005) == index  # rounds into the next bucket
+
+
+def test_snap_arrays():
+    normals = np.array([[0.0000001, -0.9999999, 0], [0.6, 0.8, 0.0000001]])
+    distances = np.array([7.999, 3.3])
+    snapped_normals, snapped_distances = planes.snap_arrays(normals, distances)
+    assert snapped_normals.tolist() == [[0, -1, 0], [0.6, 0.8, 0]]
+    assert snapped_distances.tolist() == [8, 3.3]
+    for normal, distance, snapped_normal, snapped_distance in zip(
+            normals, distances, snapped_normals.tolist(), snapped_distances.tolist()):
+        assert planes.snap(normal, distance) == (tuple(snapped_normal), snapped_distance)
+
+
+def test_map_planes():
+    quake_map = stacked_boxes()
+    table = quake_map.planes
+    assert table is quake_map.planes
+    lower, upper = quake_map.worldspawn.brushes
+    assert all(side.plane_index is not None for side in lower.sides + upper.sides)
+    # walls are shared
+    assert [side.plane_index for side in lower.sides[:2]] == [side.plane_index for side in upper.sides[:2]]
+    # lower ceiling touches upper floor
+    ceiling, floor = lower.sides[3], upper.sides[2]
+    assert ceiling.plane_index == table.opposite(floor.plane_index)
+    assert table.sides_on(ceiling.plane_index, facing=False) == [floor]
+    assert len(table) == 2 * 7  # 4 walls + 3 floors
+    # lazy sides aren't decoded & still write their own triangles
+    assert not any(side.is_decoded for side in lower.sides + upper.sides)
+    assert quake_map.as_lines() == stacked_boxes().as_lines()
+
+
+def test_store():
+    quake_map = stacked_boxes()
+    table, indices = store.BrushStore.from_entities(quake_map.entities).plane_table()
+    assert len(table) == len(quake_map.planes)
+    sides = [side for brush in quake_map.worldspawn.brushes for side in brush.sides]
+    assert indices.tolist() == [side.plane_index for side in sides]
+    normals, distances = table.as_arrays()
+    assert normals.shape == (len(table), 3)
+    assert np.allclose(normals[indices ^ 1], -normals[indices])
+
+
+def test_compact():
+    expected = stacked_boxes()
+    quake_map = stacked_boxes()
+    brush_store = store.compact(quake_map)
+    table = quake_map.planes
+    assert len(table) == len(expected.planes)
+    assert table.uses == dict()  # views build new sides on every access
+    indices = table.add_arrays(brush_store.plane_normals, brush_store.plane_distances)
+    assert len(table) == len(expected.planes)
+    sides = [side for brush in expected.worldspawn.brushes for side in brush.sides]
+    assert indices.tolist() == [side.plane_index for side in sides]
@@ -0,0 +1,78 @@
+from abe import base
+from abe import spatial
+from ass import physics
+from ass import vector
+
+import numpy as np
+import pytest
+
+
+def grid_bvh() -> spatial.BVH:
+    """10x10x10 unit cubes, 2 units apart"""
+    mins = np.array([
+        (x, y, z)
+        for x in range(0, 20, 2)
+        for y in range(0, 20, 2)
+        for z in range(0, 20, 2)], dtype=np.float64)
+    return spatial.BVH.from_bounds(list(range(1000)), mins, mins + 1)
+
+
+def test_query_box():
+    bvh = grid_bvh()
+    assert sorted(bvh.query_box((0, 0, 0), (0.5, 0.5, 0.5))) == [0]
+    assert sorted(bvh.query_box((1, 1, 1), (2, 2, 2))) == [0, 1, 10, 11, 100, 101, 110, 111]
+    assert bvh.query_box((-5, -5, -5), (-1, -1, -1)) == list()
+
+
+def test_query_ray():
+    bvh = grid_bvh()
+    hits = bvh.query_ray((0.5, 0.5, -10), (0, 0, 1))
+    assert [item for distance, item in hits] == list(range(10))
+    assert hits[0][0] == pytest.approx(10)
+    assert len(bvh.query_ray((0.5, 0.5, -10), (0, 0, 1), max_distance=12.5)) == 2
+    assert bvh.query_ray((1.5, 0.5, -10), (0, 0, 1)) == list()  # between cubes
+
+
+def test_nearest():
+    bvh = grid_bvh()
+    assert bvh.nearest((0.5, 0.5, 0.5)) == [(0, 0)]
+    distance, item = bvh.nearest((100, 100, 100))[0]
+    assert item == 999
+    assert len(bvh.nearest((0.5, 0.5, 0.5), count=4)) == 4
+    assert bvh.nearest((-10, 0, 0), max_distance=1) == list()
+
+
+def test_edits():
+    bvh = grid_bvh()
+    bvh.remove(0)
+    assert 0 not in bvh
+    assert len(bvh) == 999
+    assert bvh.query_box((0, 0, 0), (0.5, 0.5, 0.5)) == list()
+    bvh.insert("new", (0, 0, 0), (0.5, 0.5, 0.5))
+    assert bvh.query_box((0, 0, 0), (0.5, 0.5, 0.5)) == ["new"]
+    bvh.update(1, (-10, -10, -10), (-9, -9, -9))
+    assert bvh.nearest((-10, -10, -10)) == [(0, 1)]
+    bvh.rebuild()
+    assert len(bvh) == 1000
+    assert bvh.nearest((-10, -10, -10)) == [(0, 1)]
+    with pytest.raises(KeyError):
+        bvh.insert(1, (0, 0, 0), (1, 1, 1))
+    with pytest.raises(ValueError):
+        bvh.insert("inverted", (1, 1, 1), (0, 0, 0))
+
+
+def test_from_map():
+    brush = base.Brush.from_bounds(physics.AABB.from_mins_maxs(
+        mins=vector.vec3(-64, -64, -16),
+        maxs=vector.vec3(64, 64, 16)))
+    worldspawn = base.Entity(classname="worldspawn")
+    worldspawn.brushes.append(brush)
+    player_start = base.Entity(classname="info_player_start", origin="0 0 24")
+    test_map = base.MapFile.from_entities("test.map", [worldspawn, player_start])
+    bvh = spatial.BVH.from_map(test_map)
+    assert len(bvh) == 2
+    mins, maxs = bvh.bounds(brush)
+    assert mins.tolist() == [-64, -64, -16]
+    assert maxs.tolist() == [64, 64, 16]
+    assert bvh.query_box((-1, -1, 20), (1, 1, 30)) == [player_start]
+    assert [item for distance, item in bvh.query_ray((0, 0, 100), (0, 0, -1))] == [player_start, brush]
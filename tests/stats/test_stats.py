@@ -0,0 +1,113 @@
+from abe import stats
+from abe.parse import id_software
+from abe.parse import infinity_ward
+from abe.parse.valve import vmf
+
+import pytest
+
+
+quake_lines = [
+    "// test map",
+    "{",
+    '"classname" "worldspawn"',
+    "{",
+    "( 0 0 0 ) ( 0 1 0 ) ( 0 0 1 ) base/wall 0 0 0 1 1",
+    "( 8 0 0 ) ( 8 0 1 ) ( 8 1 0 ) base/wall 0 0 0 1 1",
+    "( 0 0 0 ) ( 0 0 1 ) ( 1 0 0 ) base/wall 0 0 0 1 1",
+    "( 0 8 0 ) ( 1 8 0 ) ( 0 8 1 ) base/wall 0 0 0 1 1",
+    "( 0 0 0 ) ( 1 0 0 ) ( 0 1 0 ) base/floor 0 0 0 1 1",
+    "( 0 0 8 ) ( 0 1 8 ) ( 1 0 8 ) base/floor 0 0 0 1 1",
+    "}",
+    "}",
+    "{",
+    '"classname" "light"',
+    '"origin" "4 4 4"',
+    "}"]
+
+
+@pytest.fixture
+def recorded():
+    records = list()
+    stats.enable(records.append)
+    yield records
+    stats.disable()
+
+
+def test_disabled():
+    assert len(stats.listeners) == 0
+    quake_map = id_software.QuakeMap.from_lines("test.map", quake_lines)
+    quake_map.parse()
+    assert quake_map.parse_stats is None
+    assert len(quake_map.entities) == 2
+
+
+def test_parse(recorded):
+    quake_map = id_software.QuakeMap.from_lines("test.map", quake_lines)
+    quake_map.parse()
+    record, = recorded
+    assert quake_map.parse_stats is record
+    assert (record.map_class, record.method) == ("QuakeMap", "parse")
+    assert (record.lines, record.entities, record.brushes, record.sides) == (16, 2, 1, 6)
+    assert record.comments == 1
+    assert record.bytes_read == len("\n".join(quake_lines))
+    assert {"read", "tokenise", "brush_sides"} <= set(record.seconds)
+    assert all(seconds >= 0 for seconds in record.seconds.values())
+    assert sum(record.seconds.values()) <= record.total
+    assert not record.cache_hit
+    assert record.as_dict()["sides"] == 6
+    # same result as an unrecorded parse
+    expected = id_software.QuakeMap.from_lines("test.map", quake_lines)
+    stats.disable()
+    expected.parse()
+    assert quake_map.as_lines() == expected.as_lines()
+
+
+def test_parse_error(recorded):
+    quake_map = id_software.QuakeMap.from_lines("test.map", quake_lines[:-1])
+    with pytest.raises(AssertionError):
+        quake_map.parse()
+    record, = recorded
+    assert record.error.startswith("AssertionError")
+
+
+def test_cod4(recorded):
+    lines = ["iwmap 4", *quake_lines[1:3], "}"]
+    cod4_map = infinity_ward.CoD4Map.from_lines("test.map", lines)
+    cod4_map.parse()
+    record, = recorded
+    assert (record.lines, record.entities) == (4, 1)
+    assert cod4_map.worldspawn.classname == "worldspawn"
+
+
+def test_vmf(recorded):
+    vmf_lines = [
+        "world",
+        "{",
+        '\t"classname" "worldspawn"',
+        "\tsolid",
+        "\t{",
+        "\t\tside",
+        "\t\t{",
+        '\t\t\t"plane" "(-64 64 64) (64 64 64) (64 -64 64)"',
+        '\t\t\t"material" "DEV/DEV_BLENDMEASURE"',
+        '\t\t\t"uaxis" "[1 0 0 0] 0.25"',
+        '\t\t\t"vaxis" "[0 -1 0 0] 0.25"',
+        '\t\t\t"rotation" "0"',
+        "\t\t}",
+        "\t}",
+        "}"]
+    vmf_file = vmf.Vmf.from_lines("test.vmf", vmf_lines)
+    vmf_file.parse()
+    record, = recorded
+    assert {"tokenise", "entities"} <= set(record.seconds)
+    assert (record.entities, record.brushes, record.sides) == (1, 1, 1)
+
+
+def test_nested_phases():
+    record = stats.ParseStats("test.map", "QuakeMap", "parse")
+    with record.phase("outer"):
+        with record.phase("inner"):
+            pass
+        record.timed("leaf", lambda: None)()
+    assert set(record.seconds) == {"outer", "inner", "leaf"}
+    assert all(seconds >= 0 for seconds in record.seconds.values())
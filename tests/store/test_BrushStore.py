@@ -0,0 +1,100 @@
+from abe import base
+from abe import store
+from abe.parse import common
+from ass import physics
+from ass import vector
+
+import numpy as np
+
+
+def cube(shader: str) -> base.Brush:
+    bounds = physics.AABB.from_mins_maxs(
+        mins=vector.vec3(-1, -2, -3),
+        maxs=vector.vec3(4, 5, 6))
+    return base.Brush.from_bounds(bounds, shader)
+
+
+def test_from_entities():
+    worldspawn = base.Entity(classname="worldspawn")
+    worldspawn.brushes = [cube("a"), cube("b")]
+    player_start = base.Entity(classname="info_player_start")
+    func_wall = base.Entity(classname="func_wall")
+    func_wall.brushes = [cube("a")]
+    brush_store = store.BrushStore.from_entities([worldspawn, player_start, func_wall])
+    assert brush_store.num_entities == 3
+    assert brush_store.num_brushes == 3
+    assert brush_store.num_sides == 18
+    assert brush_store.shaders == ["a", "b"]
+    assert brush_store.entity_offsets.tolist() == [0, 2, 2, 3]
+    assert brush_store.brush_offsets.tolist() == [0, 6, 12, 18]
+    assert brush_store.plane_normals.shape == (18, 3)
+    assert brush_store.texture_axes.shape == (18, 2, 3)
+    assert np.isnan(brush_store.triangles).all()  # physics.Plane has no _triangle
+
+
+def test_side():
+    brush = cube("a")
+    triangle = (vector.vec3(0, 0, 0), vector.vec3(0, 1, 0), vector.vec3(1, 0, 0))
+    brush.sides[0].plane = common.Plane.from_triangle(*triangle)
+    brush.sides[0].texture_vector.s.offset = 16
+    brush.sides[0].texture_rotation = 45
+    brush_store = store.BrushStore.from_brushes([brush])
+    for i, expected in enumerate(brush.sides):
+        side = brush_store.side(i)
+        assert side.plane.normal == expected.plane.normal
+        assert side.plane.distance == expected.plane.distance
+        assert side.shader == expected.shader
+        assert side.texture_rotation == expected.texture_rotation
+        for axis, expected_axis in zip(side.texture_vector, expected.texture_vector):
+            assert axis.axis == expected_axis.axis
+            assert axis.offset == expected_axis.offset
+            assert axis.scale == expected_axis.scale
+    assert brush_store.side(0).plane._triangle == triangle
+
+
+def test_compact():
+    map_file = base.MapFile.from_entities("test.map", [
+        base.Entity(classname="worldspawn"),
+        base.Entity(classname="func_wall")])
+    map_file.entities[0].brushes = [cube("a"), cube("b")]
+    map_file.entities[1].brushes = [cube("c")]
+    brush_store = store.compact(map_file)
+    worldspawn, func_wall = map_file.entities
+    assert isinstance(worldspawn.brushes, store.BrushList)
+    assert len(worldspawn.brushes) == 2
+    assert len(func_wall.brushes) == 1
+    assert worldspawn.brushes[1].sides[0].shader == "b"
+    assert worldspawn.brushes[-1].sides[0].shader == "b"
+    assert [brush.sides[0].shader for brush in worldspawn.brushes] == ["a", "b"]
+    assert func_wall.brushes[0].sides[0].shader == "c"
+    assert brush_store.num_brushes == 3
+    store.expand(map_file)
+    assert isinstance(worldspawn.brushes, list)
+    assert len(worldspawn.brushes[0].sides) == 6
+
+
+def test_as_models():
+    brush_store = store.BrushStore.from_brushes([cube("a"), cube("b")])
+    models = brush_store.as_models()
+    assert len(models) == 2
+    for model in models:
+        assert len(model.meshes) == 6
+        assert all(
+            len(mesh.polygons[0].vertices) == 4
+            for mesh in model.meshes)
+    positions, side_offsets = brush_store.polygons()
+    assert positions.shape == (48, 3)
+    assert brush_store.uvs(positions, side_offsets).shape == (48, 2)
+
+
+def test_as_physics():
+    brush_store = store.BrushStore.from_brushes([cube("a"), cube("b")])
+    brushes = brush_store.as_physics()
+    assert len(brushes) == 2
+    for brush in brushes:
+        assert len(brush.axial_planes) == 6
+        assert len(brush.other_planes) == 0
+        assert tuple(brush.bounds.mins) == (-1, -2, -3)
+        assert tuple(brush.bounds.maxs) == (4, 5, 6)
+    mins, maxs = brush_store.bounds()
+    assert mins.tolist() == [[-1, -2, -3]] * 2
@@ -0,0 +1,65 @@
+import gc
+
+from abe import texture
+from ass import vector
+
+import numpy as np
+import pytest
+
+
+def texture_vector(offset: float = 0) -> texture.TextureVector:
+    return texture.TextureVector(
+        texture.ProjectionAxis((1, 0, 0), offset, 0.5),
+        texture.ProjectionAxis((0, -1, 0), 0, 0.5))
+
+
+def test_eq():
+    assert texture_vector() == texture_vector()
+    assert hash(texture_vector()) == hash(texture_vector())
+    assert texture_vector() != texture_vector(offset=16)
+
+
+def test_intern():
+    first = texture.intern(texture_vector())
+    second = texture.intern(texture_vector())
+    assert second is first
+    assert texture.intern(texture_vector(offset=16)) is not first
+    assert first.frozen and first.s.frozen and first.t.frozen
+
+
+def test_intern_gc():
+    gc.collect()  # drop vectors left over from other tests
+    before = len(texture.shared)
+    pooled = [texture.intern(texture_vector(offset=1000 + i)) for i in range(1000)]
+    assert len(texture.shared) == before + 1000
+    del pooled
+    gc.collect()
+    assert len(texture.shared) == before
+
+
+def test_frozen():
+    shared = texture.intern(texture_vector())
+    with pytest.raises(AttributeError):
+        shared.s.offset = 16
+    with pytest.raises(AttributeError):
+        shared.t = texture.ProjectionAxis((0, 0, 1))
+    copy = shared.copy()
+    assert copy == shared and not copy.frozen
+    copy.s.offset = 16
+    assert shared.s.offset == 0
+
+
+def test_uv_array():
+    points = np.array([(0, 0, 0), (1, 2, 3), (-8, 16, 0.5)])
+    uvs = texture_vector(offset=16).uv_array(points)
+    assert uvs.shape == (3, 2)
+    for uv, point in zip(uvs.tolist(), points.tolist()):
+        assert uv == pytest.approx(list(texture_vector(offset=16).uv_at(vector.vec3(*point))))
+
+
+@pytest.mark.parametrize("normal,axis", [
+    ((1, 0, 0), 0), ((0, 1, 0), 1), ((0, 0, 1), 2), ((0, 0, -1), 0), ((0.6, 0.8, 0), 1)])
+def test_from_normal(normal, axis):
+    s, t = texture.TextureVector.from_normal(vector.vec3(*normal))
+    assert [list(s.axis), list(t.axis)] == texture.DEFAULT_AXES[axis].tolist()
+    assert texture.default_axis_indices(np.array([normal], dtype=float)).tolist() == [axis]